@@ -0,0 +1,61 @@
+"""Initial schema
+
+Revision ID: 275a91a78d60
+Revises: 
+Create Date: 2026-10-18 08:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '275a91a78d60'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'buckets',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(), nullable=True),
+        sa.Column('slug', sa.String(), nullable=True),
+        sa.Column('content', sa.String(), nullable=True),
+        sa.Column('version', sa.String(), nullable=True),
+        sa.Column('release_date', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('is_published', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_buckets_id'), 'buckets', ['id'], unique=False)
+    op.create_index(op.f('ix_buckets_slug'), 'buckets', ['slug'], unique=True)
+    op.create_index(op.f('ix_buckets_title'), 'buckets', ['title'], unique=False)
+    op.create_table(
+        'files',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('original_name', sa.String(), nullable=True),
+        sa.Column('storage_path', sa.String(), nullable=True),
+        sa.Column('file_type', sa.String(), nullable=True),
+        sa.Column('file_size', sa.Float(), nullable=True),
+        sa.Column('description', sa.String(), nullable=True),
+        sa.Column('bucket_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['bucket_id'], ['buckets.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_files_id'), 'files', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_files_id'), table_name='files')
+    op.drop_table('files')
+    op.drop_index(op.f('ix_buckets_title'), table_name='buckets')
+    op.drop_index(op.f('ix_buckets_slug'), table_name='buckets')
+    op.drop_index(op.f('ix_buckets_id'), table_name='buckets')
+    op.drop_table('buckets')
@@ -0,0 +1,77 @@
+"""File content version history
+
+Revision ID: 3a7c9e1f2b64
+Revises: 5f0bd512aa4a
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from pathlib import Path
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3a7c9e1f2b64'
+down_revision: Union[str, None] = '5f0bd512aa4a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+
+def upgrade() -> None:
+    file_versions = op.create_table(
+        'file_versions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('file_id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('storage_path', sa.String(), nullable=True),
+        sa.Column('data', sa.LargeBinary(), nullable=True),
+        sa.Column('checksum', sa.String(), nullable=True),
+        sa.Column('file_size', sa.Float(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.ForeignKeyConstraint(['file_id'], ['files.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_file_versions_file_id_version', 'file_versions', ['file_id', 'version'], unique=True)
+    op.create_index(op.f('ix_file_versions_storage_path'), 'file_versions', ['storage_path'], unique=False)
+
+    # Existing files start their history at their current content, left in its blob
+    connection = op.get_bind()
+    files = sa.table(
+        'files',
+        sa.column('id', sa.Integer), sa.column('storage_path', sa.String), sa.column('file_size', sa.Float),
+        sa.column('created_at', sa.DateTime), sa.column('updated_at', sa.DateTime),
+    )
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(files).where(files.c.id > last_id, files.c.storage_path.isnot(None))
+            .order_by(files.c.id).limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        op.bulk_insert(file_versions, [
+            {
+                'file_id': row.id,
+                'version': 1,
+                'kind': 'blob',
+                'storage_path': row.storage_path,
+                # Blobs are named by their SHA-256
+                'checksum': Path(row.storage_path).name,
+                'file_size': row.file_size,
+                'created_at': row.updated_at or row.created_at,
+            }
+            for row in rows
+        ])
+
+
+def downgrade() -> None:
+    # Blobs that only old versions referenced stay in storage
+    op.drop_index(op.f('ix_file_versions_storage_path'), table_name='file_versions')
+    op.drop_index('ix_file_versions_file_id_version', table_name='file_versions')
+    op.drop_table('file_versions')
@@ -0,0 +1,61 @@
+"""Full-text search index over buckets and files
+
+Revision ID: 48fbf457eb8a
+Revises: 4936a4b58b5d
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '48fbf457eb8a'
+down_revision: Union[str, None] = '4936a4b58b5d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "title, version, body, bucket_id UNINDEXED, tokenize='porter unicode61')",
+]
+
+POSTGRES_DDL = [
+    """CREATE TABLE IF NOT EXISTS search_index (
+        id BIGINT PRIMARY KEY,
+        bucket_id INTEGER NOT NULL,
+        title TEXT,
+        version TEXT,
+        body TEXT,
+        document TSVECTOR GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(version, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(body, '')), 'C')
+        ) STORED
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_search_index_document ON search_index USING GIN (document)",
+]
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    postgres = conn.dialect.name == 'postgresql'
+    for statement in POSTGRES_DDL if postgres else SQLITE_DDL:
+        conn.execute(sa.text(statement))
+
+    # Document ids: bucket id * 2 for buckets, file id * 2 + 1 for files
+    id_column = 'id' if postgres else 'rowid'
+    conn.execute(sa.text(
+        f"INSERT INTO search_index ({id_column}, bucket_id, title, version, body) "
+        "SELECT id * 2, id, title, version, content FROM buckets"
+    ))
+    conn.execute(sa.text(
+        f"INSERT INTO search_index ({id_column}, bucket_id, title, version, body) "
+        "SELECT id * 2 + 1, bucket_id, original_name, NULL, description FROM files"
+    ))
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS search_index")
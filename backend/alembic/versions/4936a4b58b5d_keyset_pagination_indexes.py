@@ -0,0 +1,61 @@
+"""Composite indexes for keyset pagination
+
+Revision ID: 4936a4b58b5d
+Revises: 5c22b3b1b989
+Create Date: 2026-10-18 08:30:00.000000
+
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4936a4b58b5d'
+down_revision: Union[str, None] = '5c22b3b1b989'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# SQLite compares datetimes as text, so keyset cursors on (created_at, id) are
+# only exact when every value is written as 'YYYY-MM-DD HH:MM:SS.ffffff'.
+# Rows inserted through CURRENT_TIMESTAMP (whole seconds) or by other tools
+# ('T' separators, offsets, fewer fraction digits) are rewritten to it.
+STORED_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+BATCH_SIZE = 1000
+
+
+def _normalize(value: str) -> str:
+    parsed = datetime.fromisoformat(value.strip())
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime(STORED_FORMAT)
+
+
+def _normalize_created_at(conn) -> None:
+    for table in ('buckets', 'files'):
+        rows = conn.execute(sa.text(
+            f"SELECT id, created_at FROM {table} WHERE created_at IS NOT NULL "
+            f"AND (length(created_at) != 26 OR substr(created_at, 11, 1) != ' ')"
+        )).all()
+        for start in range(0, len(rows), BATCH_SIZE):
+            conn.execute(
+                sa.text(f"UPDATE {table} SET created_at = :created_at WHERE id = :id"),
+                [{"id": row_id, "created_at": _normalize(value)} for row_id, value in rows[start:start + BATCH_SIZE]],
+            )
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name == 'sqlite':
+        # Other databases store timestamps as such
+        _normalize_created_at(conn)
+
+    op.create_index('ix_buckets_created_at_id', 'buckets', ['created_at', 'id'], unique=False)
+    op.create_index('ix_files_bucket_id_created_at_id', 'files', ['bucket_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_files_bucket_id_created_at_id', table_name='files')
+    op.drop_index('ix_buckets_created_at_id', table_name='buckets')
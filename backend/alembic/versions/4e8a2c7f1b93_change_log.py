@@ -0,0 +1,42 @@
+"""Change log for incremental sync
+
+Revision ID: 4e8a2c7f1b93
+Revises: 9b1f6c3e8d27
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4e8a2c7f1b93'
+down_revision: Union[str, None] = '9b1f6c3e8d27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'change_log',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('entity', sa.String(), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('bucket_id', sa.Integer(), nullable=False),
+        sa.Column('action', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        # Ids are sync tokens and must not be reused once old rows are pruned
+        sqlite_autoincrement=True,
+    )
+    op.create_index('ix_change_log_bucket_id_id', 'change_log', ['bucket_id', 'id'], unique=False)
+    # Pruning by age
+    op.create_index('ix_change_log_created_at', 'change_log', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_change_log_created_at', table_name='change_log')
+    op.drop_index('ix_change_log_bucket_id_id', table_name='change_log')
+    op.drop_table('change_log')
@@ -0,0 +1,118 @@
+"""Move uuid-named files into the content-addressed blob store
+
+Revision ID: 5c22b3b1b989
+Revises: 275a91a78d60
+Create Date: 2026-10-18 08:10:00.000000
+
+"""
+import hashlib
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c22b3b1b989'
+down_revision: Union[str, None] = '275a91a78d60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+files = sa.table(
+    'files',
+    sa.column('id', sa.Integer),
+    sa.column('original_name', sa.String),
+    sa.column('storage_path', sa.String),
+    sa.column('bucket_id', sa.Integer),
+)
+
+# The storage layout as of this revision: blobs/<2 hex>/<2 hex>/<sha256>
+# under STORAGE_DIR, stored in files.storage_path as absolute paths, which
+# later layouts still read
+STORAGE_DIR = Path(os.getenv("STORAGE_DIR", Path(__file__).resolve().parents[2] / "app" / "storage"))
+BLOBS_DIR = STORAGE_DIR / "blobs"
+CHUNK_SIZE = 1024 * 1024
+
+
+def _blob_path(checksum: str) -> Path:
+    return BLOBS_DIR / checksum[:2] / checksum[2:4] / checksum
+
+
+def _adopt(path: str) -> str:
+    """Move a file into the blob store unless its content is there already; returns the blob's path"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    blob_path = _blob_path(digest.hexdigest())
+    if blob_path.exists():
+        os.unlink(path)
+    else:
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        os.chmod(path, 0o644)
+        os.replace(path, blob_path)
+    return str(blob_path)
+
+
+def _local_path(storage_path: str) -> Path:
+    # Later layouts store keys relative to the blob directory
+    path = Path(storage_path)
+    return path if path.is_absolute() else BLOBS_DIR / path
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_files_storage_path'), 'files', ['storage_path'], unique=False)
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.select(files.c.id, files.c.storage_path)).fetchall()
+    for file_id, storage_path in rows:
+        if not storage_path or not os.path.exists(storage_path):
+            continue
+        # Duplicates collapse onto the blob that already holds their content
+        blob_path = _adopt(storage_path)
+        conn.execute(
+            files.update().where(files.c.id == file_id).values(storage_path=blob_path)
+        )
+
+    # Drop the now empty per-bucket directories
+    if not STORAGE_DIR.is_dir():
+        return
+    for entry in STORAGE_DIR.iterdir():
+        if entry.is_dir() and entry.name.isdigit():
+            try:
+                entry.rmdir()
+            except OSError:
+                pass
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    rows = conn.execute(
+        sa.select(files.c.id, files.c.original_name, files.c.storage_path, files.c.bucket_id)
+    ).fetchall()
+    blob_paths = set()
+    for file_id, original_name, storage_path, bucket_id in rows:
+        blob_file = _local_path(storage_path) if storage_path else None
+        if not blob_file or not blob_file.exists():
+            continue
+        # Give every file its own copy again
+        bucket_path = STORAGE_DIR / str(bucket_id)
+        bucket_path.mkdir(exist_ok=True)
+        file_path = bucket_path / f"{uuid.uuid4()}{os.path.splitext(original_name or '')[1]}"
+        shutil.copyfile(blob_file, file_path)
+        conn.execute(
+            files.update().where(files.c.id == file_id).values(storage_path=str(file_path))
+        )
+        blob_paths.add(blob_file)
+
+    for blob_path in blob_paths:
+        try:
+            blob_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    op.drop_index(op.f('ix_files_storage_path'), table_name='files')
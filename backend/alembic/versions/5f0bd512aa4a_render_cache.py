@@ -0,0 +1,37 @@
+"""Render cache for bucket markdown
+
+Revision ID: 5f0bd512aa4a
+Revises: 48fbf457eb8a
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f0bd512aa4a'
+down_revision: Union[str, None] = '48fbf457eb8a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'rendered_content',
+        sa.Column('content_hash', sa.String(), nullable=False),
+        sa.Column('html', sa.String(), nullable=True),
+        sa.Column('renderer_version', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.PrimaryKeyConstraint('content_hash')
+    )
+    with op.batch_alter_table('buckets') as batch_op:
+        batch_op.add_column(sa.Column('rendered_hash', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('buckets') as batch_op:
+        batch_op.drop_column('rendered_hash')
+    op.drop_table('rendered_content')
@@ -0,0 +1,33 @@
+"""Record the codec of compressed file blobs
+
+Revision ID: 7d2e4b9c1a35
+Revises: 3a7c9e1f2b64
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2e4b9c1a35'
+down_revision: Union[str, None] = '3a7c9e1f2b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing blobs are all stored uncompressed
+    with op.batch_alter_table('files') as batch_op:
+        batch_op.add_column(sa.Column('content_encoding', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    # Compressed blobs would be served as-is to clients that can't decode them
+    connection = op.get_bind()
+    if connection.execute(sa.text("SELECT 1 FROM files WHERE content_encoding IS NOT NULL LIMIT 1")).first():
+        raise RuntimeError("Files are stored compressed; downgrading would serve them undecoded")
+    with op.batch_alter_table('files') as batch_op:
+        batch_op.drop_column('content_encoding')
@@ -0,0 +1,49 @@
+"""Store the SHA-256 of each file's content
+
+Revision ID: c6f1a8d3e5b2
+Revises: 4e8a2c7f1b93
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+import re
+from pathlib import PurePosixPath
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6f1a8d3e5b2'
+down_revision: Union[str, None] = '4e8a2c7f1b93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# A blob's name is the SHA-256 of its content, plus a suffix if stored compressed
+BLOB_NAME = re.compile(r"([0-9a-f]{64})(?:\.gz|\.zst)?")
+
+files = sa.table(
+    'files',
+    sa.column('storage_path', sa.String),
+    sa.column('checksum', sa.String),
+)
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('files') as batch_op:
+        batch_op.add_column(sa.Column('checksum', sa.String(), nullable=True))
+
+    # Blobs are named by the SHA-256 of their content, so existing rows need no reads
+    conn = op.get_bind()
+    storage_paths = conn.execute(
+        sa.select(files.c.storage_path).where(files.c.storage_path.isnot(None)).distinct()
+    ).scalars().all()
+    for storage_path in storage_paths:
+        match = BLOB_NAME.fullmatch(PurePosixPath(storage_path).name)
+        if match:
+            conn.execute(files.update().where(files.c.storage_path == storage_path).values(checksum=match.group(1)))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('files') as batch_op:
+        batch_op.drop_column('checksum')
@@ -0,0 +1,306 @@
+"""Admission control: rate limits, concurrency caps and download bandwidth.
+
+Requests are sorted into route classes by method and path before routing:
+
+- ``upload``: file uploads, content updates and archive imports
+- ``download``: file and version downloads, exports and ``/storage`` files
+- ``feed``: the change feed, whose requests mostly wait
+- ``read`` and ``write``: every other GET/HEAD, including ``/published`` pages,
+  and every other request
+
+Each class can have a per-client token bucket (RATE_LIMITS) and a cap on how
+many of its requests a process serves at once (CONCURRENCY_LIMITS); both are
+off unless configured. A client
+over its rate gets 429, and a request that finds no free slot within
+ADMISSION_QUEUE_TIMEOUT gets 503, both with Retry-After, before any of the
+app runs. Uploads whose Content-Length already exceeds MAX_UPLOAD_SIZE (per
+file, for batches) get 413 before their form is parsed. Downloads are sent at no more than DOWNLOAD_BANDWIDTH bytes per
+second each. ``/health`` and ``/metrics`` are never limited.
+
+Token buckets live in this process by default. Set RATE_LIMIT_BACKEND=redis
+(with the ``redis`` package installed) so all workers share them; any object
+with an async ``take(key, rate, burst)`` works as a backend.
+"""
+import asyncio
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from app import metrics
+from app.config import (
+    ADMISSION_QUEUE_TIMEOUT, CONCURRENCY_LIMITS, DOWNLOAD_BANDWIDTH, MAX_BATCH_FILES, MAX_UPLOAD_SIZE,
+    RATE_LIMIT_BACKEND, RATE_LIMITS, REDIS_URL, TRUST_FORWARDED_FOR,
+)
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = {"GET", "HEAD"}
+
+# (class, methods or None for any, path pattern or None for any), first match wins
+ROUTE_CLASSES = (
+    ("upload", {"POST", "PUT"}, re.compile(r"/buckets/\d+/files/(batch)?|/files/\d+/content|/import")),
+    ("download", READ_METHODS,
+     re.compile(r"/files/\d+/download|/files/\d+/versions/\d+|/export|/storage/.*")),
+    ("feed", READ_METHODS, re.compile(r"/changes(/stream)?")),
+    ("read", READ_METHODS, None),
+    ("write", None, None),
+)
+EXEMPT_PATHS = {"/health", "/metrics"}
+
+# (upload path pattern, files it may carry); imports are archives and not capped
+UPLOAD_PATHS = (
+    (re.compile(r"/buckets/\d+/files/batch"), MAX_BATCH_FILES),
+    (re.compile(r"/buckets/\d+/files/|/files/\d+/content"), 1),
+)
+# Allowance per file for multipart boundaries, part headers and form fields
+MULTIPART_OVERHEAD = 64 * 1024
+
+rejections = metrics.registry.counter(
+    "admission_rejections_total", "Requests turned away by admission control", ("route_class", "reason"))
+
+
+def parse_limits(text: str) -> dict[str, tuple[float, ...]]:
+    """Parse "read=50:100,upload=2" into {"read": (50.0, 100.0), "upload": (2.0,)}"""
+    limits = {}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        name, _, values = item.partition("=")
+        try:
+            limits[name.strip()] = tuple(float(value) for value in values.split(":"))
+        except ValueError:
+            raise ValueError(f"Invalid limit {item.strip()!r}; expected <class>=<number>[:<number>]") from None
+    return limits
+
+
+def max_upload_body(path: str, max_upload_size: int = MAX_UPLOAD_SIZE) -> Optional[int]:
+    """Largest Content-Length accepted for an upload to path, or None for no limit"""
+    if max_upload_size <= 0:
+        return None
+    for pattern, files in UPLOAD_PATHS:
+        if pattern.fullmatch(path):
+            return files * (max_upload_size + MULTIPART_OVERHEAD)
+    return None
+
+
+def content_length(scope) -> Optional[int]:
+    value = Headers(scope=scope).get("content-length")
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    if path in EXEMPT_PATHS:
+        return None
+    for name, methods, pattern in ROUTE_CLASSES:
+        if (methods is None or method in methods) and (pattern is None or pattern.fullmatch(path)):
+            return name
+    return None
+
+
+def client_key(scope) -> str:
+    if TRUST_FORWARDED_FOR:
+        forwarded = Headers(scope=scope).get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class LocalRateLimitBackend:
+    """Token buckets in this process, least recently used ones dropped beyond max_keys"""
+
+    name = "local"
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        """Take a token; returns 0 if there was one, else seconds until there will be"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1 if wait == 0 else tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisRateLimitBackend:
+    """Token buckets shared by all workers through Redis, updated atomically by a script"""
+
+    name = "redis"
+
+    SCRIPT = """
+    local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+    local wait = 0
+    if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str, prefix: str = "release-notes:rate:"):
+        import redis.asyncio
+
+        self.client = redis.asyncio.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(self.SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        try:
+            return float(await self._take(keys=[self.prefix + key], args=[rate, burst]))
+        except Exception:
+            # Rather serve without rate limits than fail every request while Redis is away
+            logger.warning("Rate limit backend unavailable; admitting request", exc_info=True)
+            return 0.0
+
+
+class ConcurrencyLimiter:
+    """At most limit holders at once; others wait in order for a slot to be handed over"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self, timeout: float) -> bool:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        if timeout <= 0:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Handed a slot just as the request went away
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes straight to the next waiter
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+def make_backend():
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisRateLimitBackend(REDIS_URL)
+    return LocalRateLimitBackend()
+
+
+def _throttled(send, bandwidth: int):
+    """send, pacing response body bytes to bandwidth per second"""
+    started = None
+    sent = 0
+
+    async def throttled_send(message):
+        nonlocal started, sent
+        if message["type"] == "http.response.body":
+            if started is None:
+                started = time.monotonic()
+            sent += len(message.get("body", b""))
+            ahead = sent / bandwidth - (time.monotonic() - started)
+            if ahead > 0:
+                await asyncio.sleep(ahead)
+        await send(message)
+
+    return throttled_send
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying upload sizes, rate limits, concurrency caps and download bandwidth per route class"""
+
+    def __init__(self, app, rate_limits: str = RATE_LIMITS, concurrency_limits: str = CONCURRENCY_LIMITS,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT, download_bandwidth: int = DOWNLOAD_BANDWIDTH,
+                 backend=None, max_upload_size: int = MAX_UPLOAD_SIZE):
+        self.app = app
+        self.max_upload_size = max_upload_size
+        self.rate_limits = {}
+        for name, values in parse_limits(rate_limits).items():
+            rate = values[0]
+            if rate > 0:
+                self.rate_limits[name] = (rate, max(values[1] if len(values) > 1 else rate, 1))
+        self.limiters = {
+            name: ConcurrencyLimiter(int(values[0]))
+            for name, values in parse_limits(concurrency_limits).items() if values[0] > 0
+        }
+        self.queue_timeout = queue_timeout
+        self.download_bandwidth = download_bandwidth
+        self.backend = backend if backend is not None else (make_backend() if self.rate_limits else None)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        name = route_class(scope["method"], scope["path"])
+        if name is None:
+            return await self.app(scope, receive, send)
+
+        if name == "upload":
+            # Uploads sent without a length are still cut off while they are stored
+            limit = max_upload_body(scope["path"], self.max_upload_size)
+            length = content_length(scope)
+            if limit is not None and length is not None and length > limit:
+                rejections.inc(name, "too_large")
+                detail = f"Upload exceeds the maximum upload size of {self.max_upload_size} bytes"
+                response = JSONResponse({"detail": detail}, status_code=413)
+                return await response(scope, receive, send)
+
+        if name in self.rate_limits:
+            rate, burst = self.rate_limits[name]
+            wait = await self.backend.take(f"{name}:{client_key(scope)}", rate, burst)
+            if wait > 0:
+                return await self._reject(scope, receive, send, name, 429, "Too many requests", wait)
+
+        limiter = self.limiters.get(name)
+        if limiter is not None and not await limiter.acquire(self.queue_timeout):
+            return await self._reject(scope, receive, send, name, 503, "Server busy", 1)
+        try:
+            if name == "download" and self.download_bandwidth > 0:
+                send = _throttled(send, self.download_bandwidth)
+            await self.app(scope, receive, send)
+        finally:
+            if limiter is not None:
+                limiter.release()
+
+    async def _reject(self, scope, receive, send, name: str, status_code: int, detail: str, retry_after: float):
+        reason = "rate_limited" if status_code == 429 else "overloaded"
+        rejections.inc(name, reason)
+        response = JSONResponse(
+            {"detail": f"{detail}; retry later"}, status_code=status_code,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+        await response(scope, receive, send)
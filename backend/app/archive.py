@@ -0,0 +1,316 @@
+"""Streaming export and import of buckets and files as tar archives.
+
+Archive layout, in this order so an import can run in a single pass:
+
+    blobs/<sha256>    file contents, once per distinct blob
+    buckets.ndjson    one bucket per line
+    files.ndjson      one file per line, pointing at its bucket by slug and
+                      at its blob by checksum
+
+Exports are generated member by member from the database and the blob store,
+and imports read the archive as a stream, so memory use does not grow with
+archive size. Imports match buckets by slug and files by (bucket, name,
+checksum), so importing the same archive twice changes nothing.
+"""
+import json
+import tarfile
+import tempfile
+import time
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from app import changes, compression, processing, search, versions
+from app.cache import bucket_cache
+from app.crud import count_blob_references, touch_buckets
+from app.models import Bucket, File, FileVersion
+from app.storage_service import file_storage
+
+BATCH_SIZE = 500
+BLOCK_SIZE = tarfile.BLOCKSIZE
+# NDJSON members are spooled to memory up to this size, then to disk
+SPOOL_SIZE = 8 * 1024 * 1024
+
+BUCKET_FIELDS = ("slug", "title", "content", "version", "release_date", "is_published", "created_at")
+FILE_FIELDS = ("original_name", "description", "file_type", "file_size", "created_at")
+DATETIME_FIELDS = ("release_date", "created_at")
+
+
+class ArchiveError(ValueError):
+    """Raised when an archive is malformed or references missing content"""
+
+
+def _tar_member(name: str, size: int, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    yield info.tobuf(format=tarfile.PAX_FORMAT)
+    yield from chunks
+    remainder = size % BLOCK_SIZE
+    if remainder:
+        yield b"\0" * (BLOCK_SIZE - remainder)
+
+
+def _read_chunks(fileobj, chunk_size: int) -> Iterator[bytes]:
+    while chunk := fileobj.read(chunk_size):
+        yield chunk
+
+
+def _to_json(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _spooled_ndjson(rows: Iterable[dict]):
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    for row in rows:
+        spool.write(json.dumps({key: _to_json(value) for key, value in row.items()}).encode())
+        spool.write(b"\n")
+    size = spool.tell()
+    spool.seek(0)
+    return spool, size
+
+
+def _selected_buckets(bucket_ids: Optional[list[int]], slugs: Optional[list[str]]):
+    query = select(Bucket.id)
+    if bucket_ids or slugs:
+        conditions = []
+        if bucket_ids:
+            conditions.append(Bucket.id.in_(bucket_ids))
+        if slugs:
+            conditions.append(Bucket.slug.in_(slugs))
+        query = query.where(or_(*conditions))
+    return query
+
+
+def _export_blobs(db: Session, selected) -> Iterator[tuple[str, str, float]]:
+    """(checksum, storage_path, file size) of each distinct blob the selected buckets' files hold"""
+    blobs = db.execute(
+        select(File.storage_path, func.max(File.file_size))
+        .where(File.bucket_id.in_(selected)).group_by(File.storage_path)
+    ).yield_per(BATCH_SIZE)
+    seen = set()
+    for storage_path, file_size in blobs:
+        checksum = file_storage.content_hash(storage_path)
+        if checksum not in seen:
+            seen.add(checksum)
+            yield checksum, storage_path, file_size
+
+
+def check_export(db: Session, bucket_ids: Optional[list[int]] = None, slugs: Optional[list[str]] = None) -> None:
+    """Raise ArchiveError if a blob the export would include is missing.
+
+    Runs before the response starts, since an error once the archive is
+    streaming can only cut it short.
+    """
+    missing = [
+        storage_path for _, storage_path, _ in _export_blobs(db, _selected_buckets(bucket_ids, slugs))
+        if not file_storage.exists(storage_path)
+    ]
+    if missing:
+        raise ArchiveError(f"{len(missing)} blobs missing from storage, e.g. {missing[0]}")
+
+
+def export_archive(session_factory, bucket_ids: Optional[list[int]] = None,
+                   slugs: Optional[list[str]] = None) -> Iterator[bytes]:
+    """Yield a tar archive of the selected buckets (all buckets when none are selected).
+
+    Opens its own session because the response outlives the request's session.
+    Call check_export first; a blob released after that ends the stream early.
+    """
+    with session_factory() as db:
+        selected = _selected_buckets(bucket_ids, slugs)
+
+        # Each distinct blob once, streamed straight from storage. Archives hold
+        # original content; compressed blobs are decompressed on the way out.
+        for checksum, storage_path, file_size in _export_blobs(db, selected):
+            if file_storage.content_encoding(storage_path):
+                size = int(file_size)
+            else:
+                size = file_storage.blob_size(storage_path)
+            with file_storage.open_content(storage_path) as f:
+                yield from _tar_member(f"blobs/{checksum}", size, _read_chunks(f, file_storage.chunk_size))
+
+        buckets = db.execute(
+            select(*(getattr(Bucket, field) for field in BUCKET_FIELDS))
+            .where(Bucket.id.in_(selected)).order_by(Bucket.id)
+        ).yield_per(BATCH_SIZE)
+        spool, size = _spooled_ndjson(row._asdict() for row in buckets)
+        with spool:
+            yield from _tar_member("buckets.ndjson", size, _read_chunks(spool, file_storage.chunk_size))
+
+        files = db.execute(
+            select(Bucket.slug.label("bucket_slug"), File.storage_path,
+                   *(getattr(File, field) for field in FILE_FIELDS))
+            .join(Bucket, Bucket.id == File.bucket_id)
+            .where(File.bucket_id.in_(selected)).order_by(File.id)
+        ).yield_per(BATCH_SIZE)
+
+        def file_rows():
+            for row in files:
+                data = row._asdict()
+                data["checksum"] = file_storage.content_hash(data.pop("storage_path"))
+                yield data
+
+        spool, size = _spooled_ndjson(file_rows())
+        with spool:
+            yield from _tar_member("files.ndjson", size, _read_chunks(spool, file_storage.chunk_size))
+
+    # End-of-archive marker
+    yield b"\0" * (BLOCK_SIZE * 2)
+
+
+def _parse_row(line: bytes) -> dict:
+    row = json.loads(line)
+    for field in DATETIME_FIELDS:
+        if row.get(field):
+            row[field] = datetime.fromisoformat(row[field])
+    return row
+
+
+def _batches(fileobj) -> Iterator[list[dict]]:
+    batch = []
+    for line in fileobj:
+        if line.strip():
+            batch.append(_parse_row(line))
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _import_buckets(db: Session, fileobj, stats: dict) -> None:
+    for batch in _batches(fileobj):
+        rows = {row["slug"]: {field: row.get(field) for field in BUCKET_FIELDS} for row in batch}
+        existing = {slug: (bucket_id, bool(is_published)) for slug, bucket_id, is_published in db.execute(
+            select(Bucket.slug, Bucket.id, Bucket.is_published).where(Bucket.slug.in_(rows))
+        )}
+
+        updates = [{**row, "id": existing[slug][0]} for slug, row in rows.items() if slug in existing]
+        inserts = [row for slug, row in rows.items() if slug not in existing]
+        for row in updates:
+            # Keep the destination's creation time so pagination order is stable
+            row.pop("created_at", None)
+        db.bulk_update_mappings(Bucket, updates)
+        db.bulk_insert_mappings(Bucket, inserts)
+        db.flush()
+
+        imported = db.query(Bucket).filter(Bucket.slug.in_(rows)).all()
+        for bucket in imported:
+            search.index_bucket(db, bucket)
+            processing.enqueue_render(db, bucket)
+            if bucket.slug in existing:
+                action = changes.bucket_action(existing[bucket.slug][1], bool(bucket.is_published))
+            else:
+                action = changes.CREATED
+            changes.record(db, changes.BUCKET, action, bucket.id, bucket.id)
+        db.commit()
+        for bucket in imported:
+            bucket_cache.invalidate(bucket.id)
+        stats["buckets_created"] += len(inserts)
+        stats["buckets_updated"] += len(updates)
+
+
+def _import_files(db: Session, fileobj, stats: dict) -> None:
+    for batch in _batches(fileobj):
+        slugs = {row["bucket_slug"] for row in batch}
+        bucket_ids = dict(db.execute(select(Bucket.slug, Bucket.id).where(Bucket.slug.in_(slugs))).all())
+        missing = slugs - bucket_ids.keys()
+        if missing:
+            raise ArchiveError(f"Files reference unknown buckets: {', '.join(sorted(missing))}")
+
+        # One existence check per distinct blob; remote backends pay a request each
+        for checksum in {row["checksum"] for row in batch}:
+            if not file_storage.exists(file_storage.blob_path(checksum)):
+                raise ArchiveError(f"Archive is missing blob {checksum}")
+
+        inserts = []
+        for row in batch:
+            storage_path = file_storage.blob_path(row["checksum"])
+            inserts.append({
+                **{field: row.get(field) for field in FILE_FIELDS},
+                "storage_path": storage_path,
+                "checksum": row["checksum"],
+                "content_encoding": file_storage.content_encoding(storage_path),
+                "bucket_id": bucket_ids[row["bucket_slug"]],
+            })
+
+        # Files here may hold the same content in a compressed blob
+        plain_paths = {row["storage_path"] for row in inserts}
+        stored_as = plain_paths | {path + codec.suffix for path in plain_paths for codec in compression.CODECS.values()}
+        existing = {
+            (bucket_id, name, file_storage.content_hash(path)) for bucket_id, name, path in db.execute(
+                select(File.bucket_id, File.original_name, File.storage_path)
+                .where(File.bucket_id.in_(bucket_ids.values()))
+                .where(File.storage_path.in_(stored_as))
+            )
+        }
+        new_rows = []
+        for row in inserts:
+            key = (row["bucket_id"], row["original_name"], file_storage.content_hash(row["storage_path"]))
+            if key not in existing:
+                existing.add(key)
+                new_rows.append(row)
+
+        db.bulk_insert_mappings(File, new_rows)
+        db.flush()
+        created = db.query(File).filter(
+            File.bucket_id.in_({row["bucket_id"] for row in new_rows}),
+            File.storage_path.in_({row["storage_path"] for row in new_rows}),
+        ).all() if new_rows else []
+        for db_file in created:
+            search.index_file(db, db_file)
+        # Matching files that were already here keep their history
+        versioned = set(db.execute(
+            select(FileVersion.file_id).where(FileVersion.file_id.in_([f.id for f in created])).distinct()
+        ).scalars()) if created else set()
+        db.add_all([versions.initial_version(f) for f in created if f.id not in versioned])
+        for db_file in created:
+            if db_file.id not in versioned:
+                changes.record(db, changes.FILE, changes.CREATED, db_file.id, db_file.bucket_id)
+        processing.enqueue_file_processing(db, created)
+        # Imported files keep their own timestamps, which may be older than the bucket's
+        touch_buckets(db, {db_file.bucket_id for db_file in created})
+        db.commit()
+        for bucket_id in {row["bucket_id"] for row in new_rows}:
+            bucket_cache.invalidate(bucket_id)
+        stats["files_created"] += len(new_rows)
+        stats["files_skipped"] += len(inserts) - len(new_rows)
+
+
+def import_archive(db: Session, fileobj) -> dict:
+    """Import an archive produced by export_archive, reading it as a stream"""
+    stats = {
+        "blobs_stored": 0,
+        "buckets_created": 0,
+        "buckets_updated": 0,
+        "files_created": 0,
+        "files_skipped": 0,
+    }
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode="r|*")
+    except tarfile.TarError as e:
+        raise ArchiveError(f"Not a tar archive: {e}") from e
+
+    with archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            content = archive.extractfile(member)
+            if member.name.startswith("blobs/"):
+                expected = member.name.split("/", 1)[1]
+                storage_path, _, checksum = file_storage.store_fileobj(content)
+                if checksum != expected:
+                    # Only delete what nothing references; the blob may predate this import
+                    if count_blob_references(db, storage_path) == 0:
+                        file_storage.delete_file(storage_path)
+                    raise ArchiveError(f"Checksum mismatch for {member.name}")
+                stats["blobs_stored"] += 1
+            elif member.name == "buckets.ndjson":
+                _import_buckets(db, content, stats)
+            elif member.name == "files.ndjson":
+                _import_files(db, content, stats)
+    return stats
@@ -0,0 +1,291 @@
+"""Read-through cache of serialized bucket responses for hot buckets.
+
+Entries hold the JSON body of ``GET /buckets/{id}`` together with its cache
+validators, keyed by bucket id; a second key maps each slug to its id. Every
+write in crud invalidates the affected bucket after committing.
+
+Invalidation also bumps a per-bucket generation number. A read that misses
+notes the generation before loading from the database and stores what it
+loaded only if the generation is still the same, so a response read before
+a write cannot be cached after that write's invalidation.
+
+The default backend is an in-process LRU with a TTL. Set CACHE_BACKEND=redis
+(and REDIS_URL, with the ``redis`` package installed) so all workers share
+entries and see each other's invalidations.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Optional
+
+from app.config import BUCKET_CACHE_SIZE, BUCKET_CACHE_TTL, CACHE_BACKEND, REDIS_URL
+from app.metrics import registry
+
+
+class LocalCacheBackend:
+    """Thread-safe LRU cache whose entries expire after ttl seconds"""
+
+    name = "local"
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        # Generations of the most recently invalidated keys, in an LRU of the
+        # same size as the entries. They are drawn from one increasing counter,
+        # and a key without one is at the highest generation evicted so far, so
+        # evicting a generation never makes it equal to one read before.
+        self._generations: OrderedDict[str, int] = OrderedDict()
+        self._last_generation = 0
+        self._evicted_generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._set(key, value)
+
+    def _set(self, key: str, value: str) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _generation(self, key: str) -> int:
+        return self._generations.get(key, self._evicted_generation)
+
+    def generation(self, key: str) -> int:
+        with self._lock:
+            return self._generation(key)
+
+    def set_if_generation(self, key: str, value: str, generation: int) -> bool:
+        """Set key only if its generation is still generation"""
+        with self._lock:
+            if self._generation(key) != generation:
+                return False
+            self._set(key, value)
+            return True
+
+    def delete(self, *keys: str) -> None:
+        """Delete keys and bump their generations"""
+        with self._lock:
+            for key in keys:
+                self._last_generation += 1
+                self._generations[key] = self._last_generation
+                self._generations.move_to_end(key)
+                self._entries.pop(key, None)
+            while len(self._generations) > self.max_entries:
+                # Oldest first, so this is the highest generation evicted yet
+                _, self._evicted_generation = self._generations.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisCacheBackend:
+    """Cache shared by all workers through Redis"""
+
+    name = "redis"
+    GENERATION_TTL = 7 * 24 * 3600
+
+    # Compares the generation and sets the value in one step on the server
+    SET_IF_GENERATION = """
+    if tonumber(redis.call('GET', KEYS[2]) or '0') ~= tonumber(ARGV[2]) then
+        return 0
+    end
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+    return 1
+    """
+
+    def __init__(self, url: str, ttl: int, prefix: str = "release-notes:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        # Generations outlive any read by far, so one cannot expire back to a value read before
+        self.generation_prefix = prefix + "generation:"
+        self._set_if_generation = self.client.register_script(self.SET_IF_GENERATION)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(self.prefix + key)
+        return value.decode() if value is not None else None
+
+    def set(self, key: str, value: str) -> None:
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+    def generation(self, key: str) -> int:
+        return int(self.client.get(self.generation_prefix + key) or 0)
+
+    def set_if_generation(self, key: str, value: str, generation: int) -> bool:
+        """Set key only if its generation is still generation"""
+        keys = [self.prefix + key, self.generation_prefix + key]
+        return bool(self._set_if_generation(keys=keys, args=[value, generation, self.ttl]))
+
+    def delete(self, *keys: str) -> None:
+        """Delete keys and bump their generations"""
+        if keys:
+            pipeline = self.client.pipeline()
+            for key in keys:
+                pipeline.incr(self.generation_prefix + key)
+                pipeline.expire(self.generation_prefix + key, self.GENERATION_TTL)
+            pipeline.delete(*(self.prefix + key for key in keys))
+            pipeline.execute()
+
+    def clear(self) -> None:
+        for key in self.client.scan_iter(match=self.prefix + "*"):
+            if not key.decode().startswith(self.generation_prefix):
+                self.client.delete(key)
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class CachedBucket:
+    """A serialized bucket response and its cache validators"""
+
+    def __init__(self, bucket_id: int, slug: str, body: str, etag: str,
+                 last_modified: Optional[datetime], published: bool):
+        self.bucket_id = bucket_id
+        self.slug = slug
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.published = published
+
+    def dumps(self) -> str:
+        return json.dumps({
+            "id": self.bucket_id,
+            "slug": self.slug,
+            "body": self.body,
+            "etag": self.etag,
+            "last_modified": self.last_modified.isoformat() if self.last_modified else None,
+            "published": self.published,
+        })
+
+    @classmethod
+    def loads(cls, value: str) -> "CachedBucket":
+        data = json.loads(value)
+        last_modified = datetime.fromisoformat(data["last_modified"]) if data["last_modified"] else None
+        return cls(data["id"], data["slug"], data["body"], data["etag"], last_modified, data["published"])
+
+
+class BucketCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, hit: bool) -> None:
+        # Unlocked increments may drop the odd count under contention; fine for stats
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def get_by_id(self, bucket_id: int) -> Optional[CachedBucket]:
+        value = self.backend.get(f"bucket:{bucket_id}")
+        self._count(value is not None)
+        return CachedBucket.loads(value) if value is not None else None
+
+    def _slug_bucket_id(self, slug: str) -> Optional[int]:
+        bucket_id = self.backend.get(f"slug:{slug}")
+        return int(bucket_id) if bucket_id is not None else None
+
+    def get_by_slug(self, slug: str) -> Optional[CachedBucket]:
+        bucket_id = self._slug_bucket_id(slug)
+        value = self.backend.get(f"bucket:{bucket_id}") if bucket_id is not None else None
+        cached = CachedBucket.loads(value) if value is not None else None
+        # The slug may have moved to another bucket since it was cached
+        if cached is not None and cached.slug != slug:
+            cached = None
+        self._count(cached is not None)
+        return cached
+
+    def generation(self, bucket_id: int) -> int:
+        return self.backend.generation(f"bucket:{bucket_id}")
+
+    def store(self, cached: CachedBucket, generation: Optional[int]) -> CachedBucket:
+        """Cache a response read at generation, unless the bucket was invalidated since; None only maps the slug"""
+        if generation is not None:
+            self.backend.set_if_generation(f"bucket:{cached.bucket_id}", cached.dumps(), generation)
+        self.backend.set(f"slug:{cached.slug}", str(cached.bucket_id))
+        return cached
+
+    def read_through(self, bucket_id: int, load: Callable[[], Optional[CachedBucket]]) -> Optional[CachedBucket]:
+        """The cached response for a bucket, or load() stored if nothing changed while it ran; None if load() is"""
+        cached = self.get_by_id(bucket_id)
+        if cached is None:
+            generation = self.generation(bucket_id)
+            cached = load()
+            if cached is not None:
+                self.store(cached, generation)
+        return cached
+
+    def read_through_slug(self, slug: str, load: Callable[[], Optional[CachedBucket]]) -> Optional[CachedBucket]:
+        """read_through by slug.
+
+        The generation can only be noted for the bucket the slug mapped to
+        before loading; when there was none or the slug has moved, only the
+        mapping is stored and the next read caches the response.
+        """
+        cached = self.get_by_slug(slug)
+        if cached is None:
+            bucket_id = self._slug_bucket_id(slug)
+            generation = self.generation(bucket_id) if bucket_id is not None else None
+            cached = load()
+            if cached is not None:
+                self.store(cached, generation if cached.bucket_id == bucket_id else None)
+        return cached
+
+    def invalidate(self, bucket_id: int) -> None:
+        # Slug keys only map to ids and are checked on read, so they can stay
+        self.backend.delete(f"bucket:{bucket_id}")
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": self.backend.size(),
+        }
+
+
+def make_backend():
+    if CACHE_BACKEND == "redis":
+        return RedisCacheBackend(REDIS_URL, BUCKET_CACHE_TTL)
+    return LocalCacheBackend(BUCKET_CACHE_SIZE, BUCKET_CACHE_TTL)
+
+
+bucket_cache = BucketCache(make_backend())
+
+registry.callback("bucket_cache_hits_total", "Bucket cache lookups served from the cache",
+                  lambda: bucket_cache.hits, kind="counter")
+registry.callback("bucket_cache_misses_total", "Bucket cache lookups that went to the database",
+                  lambda: bucket_cache.misses, kind="counter")
+registry.callback("bucket_cache_hit_ratio", "Share of bucket cache lookups that were hits",
+                  lambda: bucket_cache.stats()["hit_rate"])
+registry.callback("bucket_cache_entries", "Entries in this worker's bucket cache",
+                  bucket_cache.backend.size)
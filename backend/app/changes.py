@@ -0,0 +1,275 @@
+"""Change log of buckets and files, for clients that sync incrementally.
+
+Every write in crud (and archive imports) records what it changed in the
+``change_log`` table, in the same transaction as the change itself. A row's
+id is its token: ids increase in commit order, so a client that has seen
+everything up to a token only needs the rows after it:
+
+    GET /changes?since=<token>          the changes after token, and the next token
+    GET /changes?since=<token>&wait=30  the same, waiting up to 30s for one to happen
+    GET /changes/stream?since=<token>   server-sent events, one per change
+
+Omitting ``since`` starts at the oldest change kept; ``since=now`` returns no
+changes but the current token, to start from after a full fetch. Changes are
+kept for CHANGES_RETENTION_DAYS; a token older than that is answered with 410
+Gone, and the client starts over with a full fetch.
+
+A page holds the latest change of each bucket or file in it, so a file
+created and deleted within it appears once, as deleted. Clients fetch the
+current state of what changed, and treat ``deleted`` as removing it.
+"""
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from typing import AsyncIterator, NamedTuple, Optional
+
+from sqlalchemy import and_, delete, event, func, insert, literal, or_, select
+from sqlalchemy.orm import Session
+
+from app import jobs, schemas
+from app.config import CHANGES_POLL_INTERVAL, CHANGES_RETENTION_DAYS
+from app.models import Bucket, Change, File, utcnow
+
+BUCKET = "bucket"
+FILE = "file"
+
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+PUBLISHED = "published"
+UNPUBLISHED = "unpublished"
+
+# Token clients pass to start from the current position
+NOW = "now"
+# Key of the PostgreSQL advisory lock that orders writers of the log
+_LOCK_KEY = 0x6368616E6765
+# Seconds between keep-alive comments on an idle event stream
+KEEPALIVE_INTERVAL = 15
+
+
+class InvalidTokenError(ValueError):
+    """Raised when a change token cannot be parsed"""
+
+
+class TokenExpiredError(InvalidTokenError):
+    """Raised when the changes after a token are no longer all kept"""
+
+
+class Feed(NamedTuple):
+    changes: list
+    next: str
+    has_more: bool
+
+
+def _serialize_writers(db: Session) -> None:
+    # PostgreSQL hands out sequence values in insert order, not commit order, so
+    # a reader could pass over an id that commits later. Holding a transaction
+    # lock from the first id to the commit makes the two orders the same. SQLite
+    # allows a single writer at a time, which has the same effect.
+    if db.info.get("change_log_locked"):
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(select(func.pg_advisory_xact_lock(_LOCK_KEY)))
+    db.info["change_log_locked"] = True
+
+
+def record(db: Session, entity: str, action: str, entity_id: int, bucket_id: int) -> None:
+    """Add a change to the caller's transaction; caller commits"""
+    _serialize_writers(db)
+    db.add(Change(entity=entity, action=action, entity_id=entity_id, bucket_id=bucket_id))
+    db.info["changes_recorded"] = True
+
+
+def record_bucket_files(db: Session, bucket_id: int, action: str) -> None:
+    """Add a change for every file of a bucket in one statement; caller commits"""
+    _serialize_writers(db)
+    db.execute(
+        insert(Change).from_select(
+            ["entity", "action", "entity_id", "bucket_id", "created_at"],
+            select(literal(FILE), literal(action), File.id, File.bucket_id, literal(utcnow(), Change.created_at.type))
+            .where(File.bucket_id == bucket_id)
+            .order_by(File.id),
+        )
+    )
+    db.info["changes_recorded"] = True
+
+
+def bucket_action(was_published: bool, is_published: bool) -> str:
+    """Action recorded for an update to a bucket"""
+    if is_published != was_published:
+        return PUBLISHED if is_published else UNPUBLISHED
+    return UPDATED
+
+
+class _Notifier:
+    """Wakes requests waiting for changes when this process commits some.
+
+    Commits happen on worker threads and waiters are on event loops, so each
+    waiter is woken through its loop. Commits by other processes are seen by
+    polling (CHANGES_POLL_INTERVAL).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = set()
+        self.generation = 0
+
+    def notify(self) -> None:
+        with self._lock:
+            self.generation += 1
+            waiters = list(self._waiters)
+        for loop, woken in waiters:
+            try:
+                loop.call_soon_threadsafe(woken.set)
+            except RuntimeError:
+                # The loop has been closed
+                pass
+
+    async def wait(self, generation: int, timeout: float) -> None:
+        """Return when notified after generation was read, or after timeout seconds"""
+        woken = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), woken)
+        with self._lock:
+            if self.generation != generation:
+                return
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(woken.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+
+notifier = _Notifier()
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_waiters(session):
+    session.info.pop("change_log_locked", None)
+    if session.info.pop("changes_recorded", False):
+        notifier.notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_recorded(session):
+    session.info.pop("change_log_locked", None)
+    session.info.pop("changes_recorded", None)
+
+
+def parse_token(token: Optional[str]) -> Optional[int]:
+    """Position a token stands for: 0 for the start, None for now"""
+    if not token:
+        return 0
+    if token == NOW:
+        return None
+    if not token.isdigit():
+        raise InvalidTokenError("Invalid change token")
+    return int(token)
+
+
+def get_changes(db: Session, since: Optional[int] = 0, limit: int = 100, entity: Optional[str] = None,
+                bucket_id: Optional[int] = None, published_only: bool = False) -> Feed:
+    """Latest change per bucket or file among the next limit changes after since.
+
+    published_only keeps changes to buckets that are published now, and to
+    their files, plus buckets being unpublished or deleted, which readers of
+    published content have to drop.
+    """
+    # Rows up to head are all committed, so the next page can start after it
+    head, oldest = db.execute(select(func.max(Change.id), func.min(Change.id))).one()
+    head = head or 0
+    if since is None:
+        return Feed([], str(head), False)
+    if since > head or (oldest is not None and 0 < since < oldest - 1):
+        raise TokenExpiredError("Change token has expired; fetch everything again and sync from since=now")
+
+    query = db.query(Change).filter(Change.id > since, Change.id <= head)
+    if entity:
+        query = query.filter(Change.entity == entity)
+    if bucket_id is not None:
+        query = query.filter(Change.bucket_id == bucket_id)
+    if published_only:
+        query = query.outerjoin(Bucket, Bucket.id == Change.bucket_id).filter(or_(
+            Bucket.is_published.is_(True),
+            and_(Change.entity == BUCKET, Change.action.in_((UNPUBLISHED, DELETED))),
+        ))
+    rows = query.order_by(Change.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest = {}
+    for change in rows:
+        latest[(change.entity, change.entity_id)] = change
+    changes = sorted(latest.values(), key=lambda change: change.id)
+    return Feed(changes, str(rows[-1].id if has_more else head), has_more)
+
+
+def _read(session_factory, since: Optional[int], **filters) -> Feed:
+    # A session per read, so each sees what was committed since the last one
+    with session_factory() as db:
+        return get_changes(db, since, **filters)
+
+
+async def poll(session_factory, since: Optional[int], wait: float = 0, **filters) -> Feed:
+    """get_changes, waiting up to wait seconds for a change if there is none yet"""
+    deadline = time.monotonic() + wait
+    while True:
+        generation = notifier.generation
+        feed = await asyncio.to_thread(_read, session_factory, since, **filters)
+        remaining = deadline - time.monotonic()
+        if feed.changes or remaining <= 0:
+            return feed
+        # Changes the filters skipped need not be read again
+        since = int(feed.next)
+        await notifier.wait(generation, min(remaining, CHANGES_POLL_INTERVAL))
+
+
+def _event(change: Change) -> str:
+    data = schemas.Change.model_validate(change).model_dump_json()
+    return f"id: {change.id}\nevent: change\ndata: {data}\n\n"
+
+
+async def stream(session_factory, since: int, feed: Feed, **filters) -> AsyncIterator[str]:
+    """Server-sent events for the changes in feed (read after since) and every later one, until the client leaves.
+
+    Each event's id is its token, so a reconnecting client resumes with
+    Last-Event-ID. When the filters skip changes, an event with only an id
+    moves that on.
+    """
+    position = since
+    generation = notifier.generation
+    last_sent = time.monotonic()
+    while True:
+        for change in feed.changes:
+            yield _event(change)
+            position = change.id
+            last_sent = time.monotonic()
+        if int(feed.next) != position:
+            yield f"id: {feed.next}\n\n"
+            position = int(feed.next)
+        if not feed.has_more:
+            if time.monotonic() - last_sent >= KEEPALIVE_INTERVAL:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            await notifier.wait(generation, CHANGES_POLL_INTERVAL)
+        generation = notifier.generation
+        feed = await asyncio.to_thread(_read, session_factory, position, **filters)
+
+
+@jobs.maintenance
+def prune_changes(db: Session) -> None:
+    """Delete changes past retention, keeping the latest so tokens can be checked against it"""
+    if CHANGES_RETENTION_DAYS <= 0:
+        return
+    latest = db.execute(select(func.max(Change.id))).scalar()
+    if latest is None:
+        return
+    db.execute(
+        delete(Change)
+        .where(Change.created_at < utcnow() - timedelta(days=CHANGES_RETENTION_DAYS), Change.id < latest)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
@@ -0,0 +1,260 @@
+"""Compression of stored text blobs and of API responses.
+
+Blobs of text-like files can be stored compressed (STORAGE_COMPRESSION=gzip
+or zstd). A compressed blob is named after the SHA-256 of its uncompressed
+content plus the codec's suffix, e.g. ``ab/cd/<sha256>.gz``, so plain and
+compressed copies of the same content never share a name, and the storage
+path alone says how to read a blob. zstd needs the ``zstandard`` package.
+
+CompressionMiddleware compresses JSON and HTML responses with Brotli when the
+client accepts it and the ``brotli`` package is installed, otherwise gzip.
+"""
+import gzip
+import shutil
+import zlib
+from typing import BinaryIO, Iterable, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+# Besides text/*, types that are text and compress well
+TEXT_TYPES = {"application/json", "application/xml", "application/javascript", "application/x-yaml", "application/yaml"}
+
+# Response media types CompressionMiddleware compresses
+COMPRESSIBLE_RESPONSE_TYPES = {"application/json", "application/x-ndjson", "text/html"}
+
+
+def is_text_type(file_type: Optional[str]) -> bool:
+    return bool(file_type) and (file_type.startswith("text/") or file_type in TEXT_TYPES)
+
+
+class GzipCodec:
+    name = "gzip"
+    suffix = ".gz"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress_stream(self, source: BinaryIO, destination: BinaryIO, chunk_size: int) -> None:
+        # mtime=0 keeps the output a function of the content alone
+        with gzip.GzipFile(fileobj=destination, mode="wb", compresslevel=self.level, mtime=0) as out:
+            shutil.copyfileobj(source, out, chunk_size)
+
+    def reader(self, fileobj: BinaryIO) -> BinaryIO:
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+
+
+class ZstdCodec:
+    name = "zstd"
+    suffix = ".zst"
+
+    def __init__(self, level: int = 3):
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("STORAGE_COMPRESSION=zstd needs the zstandard package (pip install zstandard)") from None
+
+        self.zstandard = zstandard
+        self.level = level
+
+    def compress_stream(self, source: BinaryIO, destination: BinaryIO, chunk_size: int) -> None:
+        self.zstandard.ZstdCompressor(level=self.level).copy_stream(
+            source, destination, read_size=chunk_size, write_size=chunk_size
+        )
+
+    def reader(self, fileobj: BinaryIO) -> BinaryIO:
+        return self.zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=False)
+
+
+CODECS = {codec.name: codec for codec in (GzipCodec, ZstdCodec)}
+_codecs = {}
+
+
+def get_codec(name: str):
+    if name not in CODECS:
+        raise ValueError(f"Unknown compression codec: {name!r} (expected one of {', '.join(CODECS)})")
+    if name not in _codecs:
+        _codecs[name] = CODECS[name]()
+    return _codecs[name]
+
+
+def codec_name(storage_path: str) -> Optional[str]:
+    """Codec a blob is stored with, from its name; None for plain blobs"""
+    for codec in CODECS.values():
+        if storage_path.endswith(codec.suffix):
+            return codec.name
+    return None
+
+
+def strip_suffix(blob_name: str) -> str:
+    name = codec_name(blob_name)
+    return blob_name[:-len(CODECS[name].suffix)] if name else blob_name
+
+
+class DecodedReader:
+    """File-like reader decompressing a stored blob; closing it closes the blob too"""
+
+    def __init__(self, reader: BinaryIO, source: BinaryIO):
+        self._reader = reader
+        self._source = source
+
+    def read(self, size: int = -1) -> bytes:
+        return self._reader.read(size)
+
+    def close(self) -> None:
+        try:
+            self._reader.close()
+        finally:
+            self._source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def _parse_accept_encoding(header: str) -> dict[str, float]:
+    weights = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding] = weight
+    return weights
+
+
+def negotiate(accept_encoding: Optional[str], codings: Iterable[str]) -> Optional[str]:
+    """Best of codings (in order of preference) the Accept-Encoding header allows, if any"""
+    if not accept_encoding:
+        return None
+    weights = _parse_accept_encoding(accept_encoding)
+    best, best_weight = None, 0.0
+    for coding in codings:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+class _GzipStream:
+    def __init__(self, level: int = 6):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        out = self._compressor.compress(data)
+        # Streamed bodies are flushed per chunk so clients see each part promptly
+        return out + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class _BrotliStream:
+    def __init__(self, quality: int = 5):
+        import brotli
+
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        out = self._compressor.process(data)
+        return out + (self._compressor.finish() if final else self._compressor.flush())
+
+
+def _response_codings() -> dict:
+    codings = {}
+    try:
+        import brotli  # noqa: F401
+        codings["br"] = _BrotliStream
+    except ImportError:
+        pass
+    codings["gzip"] = _GzipStream
+    return codings
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing JSON and HTML responses the client accepts compressed.
+
+    Responses that are already encoded, partial (206) or smaller than
+    minimum_size are passed through. Strong ETags are made weak, since the
+    compressed bytes differ from the identity representation.
+    """
+
+    def __init__(self, app, minimum_size: int = 500):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.codings = _response_codings()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.minimum_size:
+            return await self.app(scope, receive, send)
+        coding = negotiate(Headers(scope=scope).get("accept-encoding"), self.codings)
+        if coding is None:
+            return await self.app(scope, receive, send)
+
+        start_message = None
+        # Leading body chunks held back until there is enough to be worth compressing
+        pending = []
+        pending_size = 0
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, pending_size, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # Held back until the body shows whether to compress
+                start_message = message
+                headers = Headers(raw=message["headers"])
+                media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+                passthrough = (
+                    message["status"] in (204, 206, 304)
+                    or "content-encoding" in headers
+                    or "content-range" in headers
+                    or media_type not in COMPRESSIBLE_RESPONSE_TYPES
+                )
+                if passthrough:
+                    start_message = None
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                return await send(message)
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is not None:
+                return await send({**message, "body": compressor.compress(body, final=not more_body)})
+
+            # Streamed responses may arrive in small pieces, e.g. through BaseHTTPMiddleware
+            pending.append(body)
+            pending_size += len(body)
+            if more_body and pending_size < self.minimum_size:
+                return
+            body = b"".join(pending)
+            pending.clear()
+            start, start_message = start_message, None
+            if not more_body and len(body) < self.minimum_size:
+                passthrough = True
+                await send(start)
+                return await send({**message, "body": body})
+
+            compressor = self.codings[coding]()
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = coding
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            body = compressor.compress(body, final=not more_body)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(body))
+            await send(start)
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_wrapper)
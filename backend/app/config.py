@@ -0,0 +1,121 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Uploads larger than this many bytes are rejected (0 disables the limit)
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 512 * 1024 * 1024))
+
+# Size of the chunks read from an upload and written to disk
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+
+# Batch uploads: files written to storage at once, and files accepted per request
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", 8))
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", 500))
+
+# Version history: text content up to VERSION_DELTA_MAX_SIZE bytes is kept as compressed
+# deltas, with a full snapshot every VERSION_SNAPSHOT_INTERVAL versions; the rest as blobs
+VERSION_SNAPSHOT_INTERVAL = int(os.getenv("VERSION_SNAPSHOT_INTERVAL", 10))
+VERSION_DELTA_MAX_SIZE = int(os.getenv("VERSION_DELTA_MAX_SIZE", 4 * 1024 * 1024))
+
+# Root of local file storage (blobs and upload temp files)
+STORAGE_DIR = os.getenv("STORAGE_DIR", os.path.join(os.path.dirname(__file__), "storage"))
+
+# Store text-like uploads compressed: "" (off), "gzip" or "zstd" (needs zstandard); blobs
+# smaller than STORAGE_COMPRESSION_MIN_SIZE bytes, or that shrink by less than 10%, stay plain
+STORAGE_COMPRESSION = os.getenv("STORAGE_COMPRESSION", "")
+STORAGE_COMPRESSION_MIN_SIZE = int(os.getenv("STORAGE_COMPRESSION_MIN_SIZE", 1024))
+# JSON and HTML responses at least this many bytes are compressed when the client accepts it (0 disables)
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", 500))
+
+# Where blob content lives: "sharded" or "local" (app/storage on disk) or "s3"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sharded")
+# Hash characters per directory level of the sharded layout: "2,2" stores blobs at ab/cd/<sha256>
+STORAGE_FANOUT = tuple(int(width) for width in os.getenv("STORAGE_FANOUT", "2,2").split(",") if width.strip())
+# S3 or S3-compatible (MinIO) object storage; credentials come from the usual AWS_* variables
+S3_BUCKET = os.getenv("S3_BUCKET", "release-notes")
+S3_PREFIX = os.getenv("S3_PREFIX", "blobs")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+S3_REGION = os.getenv("S3_REGION")
+
+# Browser and shared (CDN) cache lifetimes, in seconds, for published buckets and their files
+PUBLISHED_CACHE_MAX_AGE = int(os.getenv("PUBLISHED_CACHE_MAX_AGE", 300))
+PUBLISHED_SHARED_CACHE_MAX_AGE = int(os.getenv("PUBLISHED_SHARED_CACHE_MAX_AGE", 86400))
+
+# Database connection; SQLite is used when DATABASE_URL is not set
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./release_notes.db")
+# Async driver URL, derived from DATABASE_URL (aiosqlite/asyncpg) when not set
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+
+# Connection pool settings (ignored for SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# SQLite tuning: WAL lets readers run alongside the single writer,
+# busy_timeout (ms) makes writers wait for the lock instead of failing
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))
+
+# Cache of serialized bucket responses: "local" (per worker) or "redis" (shared)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "local")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+BUCKET_CACHE_SIZE = int(os.getenv("BUCKET_CACHE_SIZE", 1024))
+BUCKET_CACHE_TTL = int(os.getenv("BUCKET_CACHE_TTL", 60))
+
+# Background jobs: worker threads per process (0 to run them only via `python -m app.jobs`),
+# seconds between polls when idle, attempts before a job fails and the first retry delay
+# (doubled on each retry), seconds after which a running job is presumed lost, and days
+# finished jobs are kept
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", 2.0))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 300))
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", 7))
+# Seconds a blob replaced in the background (e.g. by its compressed copy) is kept for
+# requests that already resolved it
+BLOB_RELEASE_DELAY = int(os.getenv("BLOB_RELEASE_DELAY", 60))
+# Seconds after a blob was written or reused by an upload during which it is not deleted,
+# since the upload's row may not be committed yet; longer than the slowest upload takes
+BLOB_REUSE_GRACE = int(os.getenv("BLOB_REUSE_GRACE", 900))
+
+# Change feed: days entries are kept (0 keeps them forever), longest a /changes request may
+# wait for one, and how often a waiting request checks for commits made by other processes
+CHANGES_RETENTION_DAYS = int(os.getenv("CHANGES_RETENTION_DAYS", 30))
+CHANGES_MAX_WAIT = float(os.getenv("CHANGES_MAX_WAIT", 30))
+CHANGES_POLL_INTERVAL = float(os.getenv("CHANGES_POLL_INTERVAL", 1.0))
+
+# Static publishing: write published buckets as JSON and HTML files that the app serves under
+# /published/ and any other web server can serve as well
+STATIC_PUBLISHING = os.getenv("STATIC_PUBLISHING", "true").lower() == "true"
+STATIC_PUBLISH_DIR = os.getenv("STATIC_PUBLISH_DIR", os.path.join(STORAGE_DIR, "published"))
+
+# Storage scrubbing: every blob is re-read and checked against its SHA-256 once per
+# SCRUB_INTERVAL_HOURS (0 disables it), by SCRUB_WORKERS threads reading at most
+# SCRUB_RATE bytes per second in total (0 for no limit)
+SCRUB_INTERVAL_HOURS = float(os.getenv("SCRUB_INTERVAL_HOURS", 168))
+SCRUB_WORKERS = int(os.getenv("SCRUB_WORKERS", 2))
+SCRUB_RATE = int(os.getenv("SCRUB_RATE", 8 * 1024 * 1024))
+
+# Admission control, by route class (read, write, upload, download, feed):
+# - RATE_LIMITS: per-client token buckets as "<class>=<requests per second>[:<burst>],...";
+#   classes not listed are not rate limited
+# - CONCURRENCY_LIMITS: requests of a class served at once by each process, as
+#   "<class>=<requests>,..."; others wait up to ADMISSION_QUEUE_TIMEOUT seconds for a slot,
+#   then get 503. Off by default; size it to the worker threads and database connections
+#   each process has, e.g. "upload=16,download=64,write=32,read=256"
+# - DOWNLOAD_BANDWIDTH: bytes per second each download is sent at, 0 for no limit
+# - RATE_LIMIT_BACKEND: "local" (per process) or "redis" (shared through REDIS_URL)
+# - TRUST_FORWARDED_FOR: identify clients by X-Forwarded-For, when behind a proxy that sets it
+RATE_LIMITS = os.getenv("RATE_LIMITS", "")
+CONCURRENCY_LIMITS = os.getenv("CONCURRENCY_LIMITS", "")
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 0.5))
+DOWNLOAD_BANDWIDTH = int(os.getenv("DOWNLOAD_BANDWIDTH", 0))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "local")
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+
+# Observability: /metrics is always on; spans around crud and storage calls need opentelemetry-api
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
@@ -1,77 +1,392 @@
-from sqlalchemy.orm import Session
-from app.models import Bucket, File
+from sqlalchemy.orm import Session, selectinload, joinedload
+from sqlalchemy import select
+from sqlalchemy.sql import func
+from app.models import Bucket, File, FileVersion
 from app.schemas import BucketCreate, BucketUpdate, FileCreate
 from app.storage_service import file_storage
+from app.pagination import encode_cursor, paginate
+from app import changes, processing, render, search, versions
+from app.cache import bucket_cache
+from app.config import BLOB_REUSE_GRACE
+import asyncio
+import io
+import time
 import os
 from datetime import datetime
 
-def get_buckets(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(Bucket).offset(skip).limit(limit).all()
+# Statements for the reads, shared with the async functions in crud_async.py
+
+def buckets_query(skip: int = 0, limit: int = 100, cursor: str = None):
+    # Load files for the whole page in one extra query instead of one per bucket
+    query = select(Bucket).options(selectinload(Bucket.files))
+    return paginate(query, Bucket.created_at, Bucket.id, skip, limit, cursor)
+
+def bucket_summaries_query(skip: int = 0, limit: int = 100, cursor: str = None):
+    # File counts and sizes are aggregated in the same query as the buckets
+    query = (
+        select(
+            Bucket.id,
+            Bucket.title,
+            Bucket.slug,
+            Bucket.version,
+            Bucket.release_date,
+            Bucket.is_published,
+            Bucket.created_at,
+            Bucket.updated_at,
+            func.count(File.id).label("file_count"),
+            func.coalesce(func.sum(File.file_size), 0).label("total_bytes"),
+        )
+        .outerjoin(File, File.bucket_id == Bucket.id)
+        .group_by(Bucket.id)
+    )
+    return paginate(query, Bucket.created_at, Bucket.id, skip, limit, cursor)
+
+def bucket_query(bucket_id: int):
+    return select(Bucket).where(Bucket.id == bucket_id)
+
+def bucket_with_files_query(bucket_id: int):
+    # A single bucket and its files come back in one joined query
+    return select(Bucket).options(joinedload(Bucket.files)).where(Bucket.id == bucket_id)
+
+def files_query(bucket_id: int, skip: int = 0, limit: int = 100, cursor: str = None):
+    query = select(File).where(File.bucket_id == bucket_id)
+    return paginate(query, File.created_at, File.id, skip, limit, cursor)
+
+def file_query(file_id: int):
+    return select(File).where(File.id == file_id)
+
+def get_buckets(db: Session, skip: int = 0, limit: int = 100, cursor: str = None):
+    return db.execute(buckets_query(skip, limit, cursor)).scalars().all()
+
+# Columns of the Bucket and File response models, in their field order (see app/serialization.py)
+BUCKET_ROW_COLUMNS = (
+    Bucket.title, Bucket.slug, Bucket.id, Bucket.version, Bucket.release_date, Bucket.content,
+    Bucket.is_published, Bucket.created_at, Bucket.updated_at,
+)
+FILE_ROW_COLUMNS = (
+    File.original_name, File.description, File.id, File.storage_path, File.file_type, File.file_size,
+    File.checksum, File.bucket_id, File.created_at, File.updated_at,
+)
+
+BUCKET_ROW_FIELDS = tuple(column.key for column in BUCKET_ROW_COLUMNS)
+FILE_ROW_FIELDS = tuple(column.key for column in FILE_ROW_COLUMNS)
+
+def _file_row(row) -> dict:
+    file_row = dict(zip(FILE_ROW_FIELDS, row))
+    file_row["file_size"] = float(file_row["file_size"])
+    return file_row
+
+def get_bucket_rows(db: Session, skip: int = 0, limit: int = 100, cursor: str = None) -> list[dict]:
+    """get_buckets as plain dicts, read with two column queries and no ORM objects"""
+    query = paginate(select(*BUCKET_ROW_COLUMNS), Bucket.created_at, Bucket.id, skip, limit, cursor)
+    buckets = [dict(zip(BUCKET_ROW_FIELDS, row), files=[]) for row in db.execute(query)]
+    if buckets:
+        by_id = {bucket["id"]: bucket for bucket in buckets}
+        files = db.execute(
+            select(*FILE_ROW_COLUMNS).where(File.bucket_id.in_(by_id)).order_by(File.bucket_id, File.id)
+        )
+        for row in files:
+            file_row = _file_row(row)
+            by_id[file_row["bucket_id"]]["files"].append(file_row)
+    return buckets
+
+def get_file_rows(db: Session, bucket_id: int, skip: int = 0, limit: int = 100, cursor: str = None) -> list[dict]:
+    """get_files as plain dicts, read with a column query"""
+    query = paginate(select(*FILE_ROW_COLUMNS).where(File.bucket_id == bucket_id), File.created_at, File.id,
+                     skip, limit, cursor)
+    return [_file_row(row) for row in db.execute(query)]
+
+def iter_row_batches(read_page, cursor: str = None, batch_size: int = 500):
+    """Pages from read_page(skip, limit, cursor) until the last, e.g. for streaming a whole collection"""
+    while True:
+        rows = read_page(0, batch_size, cursor)
+        yield rows
+        if len(rows) < batch_size:
+            return
+        cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+def get_bucket_summaries(db: Session, skip: int = 0, limit: int = 100, cursor: str = None):
+    return db.execute(bucket_summaries_query(skip, limit, cursor)).all()
 
 def get_bucket(db: Session, bucket_id: int):
-    return db.query(Bucket).filter(Bucket.id == bucket_id).first()
+    return db.scalar(bucket_query(bucket_id))
+
+def get_bucket_by_slug(db: Session, slug: str):
+    return db.query(Bucket).filter(Bucket.slug == slug).first()
 
 def create_bucket(db: Session, bucket: BucketCreate):
     db_bucket = Bucket(**bucket.model_dump())
     db.add(db_bucket)
+    db.flush()
+    search.index_bucket(db, db_bucket)
+    processing.enqueue_render(db, db_bucket)
+    changes.record(db, changes.BUCKET, changes.CREATED, db_bucket.id, db_bucket.id)
     db.commit()
+    bucket_cache.invalidate(db_bucket.id)
     db.refresh(db_bucket)
     return db_bucket
 
 def update_bucket(db: Session, bucket_id: int, bucket: BucketUpdate):
     db_bucket = db.query(Bucket).filter(Bucket.id == bucket_id).first()
     if db_bucket:
+        was_published = bool(db_bucket.is_published)
         for key, value in bucket.model_dump(exclude_unset=True).items():
             setattr(db_bucket, key, value)
+        search.index_bucket(db, db_bucket)
+        # Published content is pre-rendered in the background so readers rarely wait for markdown
+        processing.enqueue_render(db, db_bucket)
+        action = changes.bucket_action(was_published, bool(db_bucket.is_published))
+        changes.record(db, changes.BUCKET, action, bucket_id, bucket_id)
         db.commit()
+        bucket_cache.invalidate(bucket_id)
         db.refresh(db_bucket)
     return db_bucket
 
 def delete_bucket(db: Session, bucket_id: int):
-    db_bucket = db.query(Bucket).filter(Bucket.id == bucket_id).first()
-    if db_bucket:
-        # This will automatically delete associated files due to cascade
-        db.delete(db_bucket)
-        db.commit()
-        return True
-    return False
+    bucket = db.query(Bucket.id, Bucket.rendered_hash).filter(Bucket.id == bucket_id).first()
+    if bucket is None:
+        return False
+    storage_paths = bucket_storage_paths(db, bucket_id)
+    search.remove_bucket_documents(db, bucket_id)
+    changes.record_bucket_files(db, bucket_id, changes.DELETED)
+    changes.record(db, changes.BUCKET, changes.DELETED, bucket_id, bucket_id)
+    # One statement; the database cascades to files and their versions
+    db.query(Bucket).filter(Bucket.id == bucket_id).delete(synchronize_session=False)
+    render.release_rendering(db, bucket.rendered_hash)
+    # Blobs no other file points to are removed in the background
+    processing.enqueue_blob_release(db, storage_paths)
+    db.commit()
+    bucket_cache.invalidate(bucket_id)
+    return True
+
+def bucket_storage_paths(db: Session, bucket_id: int) -> set[str]:
+    """Distinct blobs the files of a bucket and their versions point at"""
+    file_ids = select(File.id).where(File.bucket_id == bucket_id)
+    return set(db.execute(
+        select(File.storage_path).where(File.bucket_id == bucket_id)
+        .union(
+            select(FileVersion.storage_path)
+            .where(FileVersion.file_id.in_(file_ids), FileVersion.storage_path.isnot(None))
+        )
+    ).scalars())
+
+def touch_buckets(db: Session, bucket_ids) -> None:
+    """Mark buckets modified because their files changed; caller commits.
+
+    Last-Modified of a bucket covers its file list, which a deleted file
+    would otherwise move backwards.
+    """
+    db.query(Bucket).filter(Bucket.id.in_(set(bucket_ids))).update(
+        {Bucket.updated_at: func.now()}, synchronize_session=False
+    )
 
-def get_files(db: Session, bucket_id: int, skip: int = 0, limit: int = 100):
-    return db.query(File).filter(File.bucket_id == bucket_id).offset(skip).limit(limit).all()
+def get_files(db: Session, bucket_id: int, skip: int = 0, limit: int = 100, cursor: str = None):
+    return db.execute(files_query(bucket_id, skip, limit, cursor)).scalars().all()
 
 def get_file(db: Session, file_id: int):
-    return db.query(File).filter(File.id == file_id).first()
+    return db.scalar(file_query(file_id))
 
 def create_file(db: Session, file_data: bytes, original_name: str, bucket_id: int, description: str = None):
     # Save file to storage
     storage_path, file_type, file_size = file_storage.save_file(
         file_data, original_name, bucket_id
     )
-    
+    return _add_file(db, original_name, storage_path, file_type, file_size, bucket_id, description)
+
+async def create_file_from_upload(db: Session, upload, original_name: str, bucket_id: int, description: str = None):
+    # Stream upload to storage without buffering it in memory; database work
+    # runs in a worker thread so the event loop isn't blocked either
+    stored = await file_storage.save_upload(upload, original_name, bucket_id)
+    try:
+        return await asyncio.to_thread(
+            _add_file, db, original_name, stored.storage_path, stored.file_type, stored.file_size, bucket_id, description
+        )
+    except Exception:
+        await asyncio.to_thread(_rollback_and_release, db, [stored.storage_path])
+        raise
+
+async def create_files_from_uploads(db: Session, uploads: list, bucket_id: int, descriptions: list = None):
+    """Store uploads concurrently, then insert all their file rows in one transaction.
+
+    Returns (upload, File or None, error or None) per upload. If the transaction
+    fails, blobs no file references are removed again and the error is raised.
+    """
+    descriptions = descriptions or []
+    stored = await file_storage.save_uploads(uploads, bucket_id)
+
+    results = []
+    db_files = []
+    for i, (upload, item) in enumerate(zip(uploads, stored)):
+        if isinstance(item, Exception):
+            results.append((upload, None, item))
+            continue
+        db_file = File(
+            original_name=upload.filename,
+            storage_path=item.storage_path,
+            file_type=item.file_type,
+            file_size=item.file_size,
+            checksum=item.checksum,
+            content_encoding=file_storage.content_encoding(item.storage_path),
+            description=descriptions[i] if i < len(descriptions) else None,
+            bucket_id=bucket_id
+        )
+        db_files.append(db_file)
+        results.append((upload, db_file, None))
+
+    if db_files:
+        try:
+            await asyncio.to_thread(_add_files, db, db_files, bucket_id)
+        except Exception:
+            await asyncio.to_thread(_rollback_and_release, db, {f.storage_path for f in db_files})
+            raise
+    return results
+
+async def update_file_content(db: Session, db_file: File, upload):
+    # Store new content as its own blob and point the file at it
+    old_storage_path = db_file.storage_path
+    storage_path, file_size, _ = await file_storage.store_upload(upload)
+    return await asyncio.to_thread(_replace_content, db, db_file, old_storage_path, storage_path, file_size)
+
+def _replace_content(db: Session, db_file: File, old_storage_path: str, storage_path: str, file_size: int):
+    if storage_path != db_file.storage_path:
+        versions.record_version(db, db_file, storage_path, file_size)
+    db_file.storage_path = storage_path
+    db_file.checksum = file_storage.content_hash(storage_path)
+    db_file.content_encoding = file_storage.content_encoding(storage_path)
+    db_file.file_size = file_size
+    db_file.updated_at = func.now()
+    processing.enqueue_file_processing(db, [db_file])
+    changes.record(db, changes.FILE, changes.UPDATED, db_file.id, db_file.bucket_id)
+    touch_buckets(db, [db_file.bucket_id])
+    db.commit()
+    bucket_cache.invalidate(db_file.bucket_id)
+    if old_storage_path != storage_path:
+        release_blob(db, old_storage_path)
+        db.commit()
+    db.refresh(db_file)
+    return db_file
+
+def restore_file_version(db: Session, db_file: File, version: int):
+    """Make an earlier version the file's content again, as a new version"""
+    content = versions.read_version(db, db_file, version)
+    if content is None:
+        return None
+    storage_path, file_size, _ = file_storage.store_fileobj(io.BytesIO(content))
+    return _replace_content(db, db_file, db_file.storage_path, storage_path, file_size)
+
+def _add_files(db: Session, db_files: list, bucket_id: int):
+    db.add_all(db_files)
+    db.flush()
+    for db_file in db_files:
+        search.index_file(db, db_file)
+    db.add_all([versions.initial_version(db_file) for db_file in db_files])
+    processing.enqueue_file_processing(db, db_files)
+    for db_file in db_files:
+        changes.record(db, changes.FILE, changes.CREATED, db_file.id, bucket_id)
+    touch_buckets(db, [bucket_id])
+    file_ids = [db_file.id for db_file in db_files]
+    db.commit()
+    bucket_cache.invalidate(bucket_id)
+    # Reload the committed rows in one query instead of refreshing each
+    db.query(File).filter(File.id.in_(file_ids)).all()
+
+def _rollback_and_release(db: Session, storage_paths):
+    db.rollback()
+    for storage_path in storage_paths:
+        release_blob(db, storage_path)
+    db.commit()
+
+def _add_file(db: Session, original_name: str, storage_path: str, file_type: str, file_size: float, bucket_id: int, description: str = None):
     # Create database record
     db_file = File(
         original_name=original_name,
         storage_path=storage_path,
         file_type=file_type,
         file_size=file_size,
+        checksum=file_storage.content_hash(storage_path),
+        content_encoding=file_storage.content_encoding(storage_path),
         description=description,
         bucket_id=bucket_id
     )
     db.add(db_file)
+    db.flush()
+    search.index_file(db, db_file)
+    db.add(versions.initial_version(db_file))
+    processing.enqueue_file_processing(db, [db_file])
+    changes.record(db, changes.FILE, changes.CREATED, db_file.id, bucket_id)
+    touch_buckets(db, [bucket_id])
     db.commit()
+    bucket_cache.invalidate(bucket_id)
     db.refresh(db_file)
     return db_file
 
 def delete_file(db: Session, file_id: int):
     db_file = db.query(File).filter(File.id == file_id).first()
     if db_file:
-        # Delete from storage
-        file_storage.delete_file(db_file.storage_path)
-        # Delete database record
+        storage_paths = {db_file.storage_path}
+        storage_paths.update(
+            path for (path,) in db.query(FileVersion.storage_path)
+            .filter(FileVersion.file_id == file_id, FileVersion.storage_path.isnot(None))
+        )
+        bucket_id = db_file.bucket_id
+        search.remove_documents(db, search.FILE, [file_id])
+        changes.record(db, changes.FILE, changes.DELETED, file_id, bucket_id)
+        touch_buckets(db, [bucket_id])
+        # Delete database record; the database removes its versions
         db.delete(db_file)
         db.commit()
+        bucket_cache.invalidate(bucket_id)
+        # Delete from storage once nothing references the blobs
+        release_blobs(db, storage_paths)
+        db.commit()
         return True
     return False
 
+def count_blob_references(db: Session, storage_path: str) -> int:
+    # Rows may name the same blob by an absolute path or a relative key
+    paths = file_storage.aliases(storage_path)
+    return (
+        db.query(File).filter(File.storage_path.in_(paths)).count()
+        + db.query(FileVersion).filter(FileVersion.storage_path.in_(paths)).count()
+    )
+
+def referenced_blobs(db: Session, storage_paths) -> set[str]:
+    """Those of storage_paths some file or file version references, under any of their names"""
+    aliases = {storage_path: file_storage.aliases(storage_path) for storage_path in storage_paths}
+    names = set().union(*aliases.values())
+    if not names:
+        return set()
+    referenced = set(db.execute(
+        select(File.storage_path).where(File.storage_path.in_(names))
+        .union(select(FileVersion.storage_path).where(FileVersion.storage_path.in_(names)))
+    ).scalars())
+    return {storage_path for storage_path, spellings in aliases.items() if spellings & referenced}
+
+def release_blob(db: Session, storage_path: str) -> bool:
+    """Delete a blob from storage if no file row references it any more; caller commits"""
+    return release_blobs(db, [storage_path]) == 1
+
+def release_blobs(db: Session, storage_paths) -> int:
+    """Delete the blobs no file row references any more; returns how many were deleted.
+
+    An upload that reuses a blob marks it as just written, then commits its
+    row. A blob written within BLOB_REUSE_GRACE seconds may be such an upload's,
+    so it is kept, and a release job is enqueued to look at it again once that
+    has passed; caller commits.
+    """
+    storage_paths = set(storage_paths)
+    unreferenced = storage_paths - referenced_blobs(db, storage_paths)
+    modified_before = time.time() - BLOB_REUSE_GRACE
+    deleted = 0
+    kept = []
+    for storage_path in sorted(unreferenced):
+        if file_storage.delete_file(storage_path, modified_before=modified_before):
+            deleted += 1
+        elif file_storage.exists(storage_path):
+            kept.append(storage_path)
+    if kept:
+        processing.enqueue_blob_release(db, kept, delay=BLOB_REUSE_GRACE)
+    return deleted
+
 def get_bucket_with_files(db: Session, bucket_id: int):
-    return db.query(Bucket).filter(Bucket.id == bucket_id).first() 
\ No newline at end of file
+    return db.execute(bucket_with_files_query(bucket_id)).unique().scalar_one_or_none() 
\ No newline at end of file
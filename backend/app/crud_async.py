@@ -0,0 +1,30 @@
+"""Async counterparts of the read functions in crud.py, for use with get_async_db.
+
+They run the same statements as crud.py. Writes stay there because they also
+manage blobs in storage.
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+
+async def get_buckets(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: str = None):
+    result = await db.execute(crud.buckets_query(skip, limit, cursor))
+    return result.scalars().all()
+
+async def get_bucket_summaries(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: str = None):
+    result = await db.execute(crud.bucket_summaries_query(skip, limit, cursor))
+    return result.all()
+
+async def get_bucket(db: AsyncSession, bucket_id: int):
+    return await db.scalar(crud.bucket_query(bucket_id))
+
+async def get_bucket_with_files(db: AsyncSession, bucket_id: int):
+    result = await db.execute(crud.bucket_with_files_query(bucket_id))
+    return result.unique().scalar_one_or_none()
+
+async def get_files(db: AsyncSession, bucket_id: int, skip: int = 0, limit: int = 100, cursor: str = None):
+    result = await db.execute(crud.files_query(bucket_id, skip, limit, cursor))
+    return result.scalars().all()
+
+async def get_file(db: AsyncSession, file_id: int):
+    return await db.scalar(crud.file_query(file_id))
@@ -1,20 +1,123 @@
-from sqlalchemy import create_engine
+import threading
+
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./release_notes.db"
-
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+from app.config import (
+    ASYNC_DATABASE_URL,
+    DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    SQLITE_BUSY_TIMEOUT,
+    SQLITE_JOURNAL_MODE,
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+SQLALCHEMY_DATABASE_URL = DATABASE_URL
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+def engine_options(url: str) -> dict:
+    """Engine keyword arguments for a database URL"""
+    if is_sqlite(url):
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+def configure_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    # SQLite only enforces foreign keys, and so ON DELETE CASCADE, when asked to
+    cursor.execute("PRAGMA foreign_keys=ON")
+    if SQLITE_JOURNAL_MODE.upper() == "WAL":
+        # Safe with WAL and avoids an fsync per commit
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """Create the engine on first use, so importing the app loads no driver and opens no connection"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
+                if is_sqlite(SQLALCHEMY_DATABASE_URL):
+                    event.listen(engine, "connect", configure_sqlite)
+                SessionLocal.configure(bind=engine)
+                _engine = engine
+    return _engine
+
+class LazySessionmaker(sessionmaker):
+    """sessionmaker bound to the engine from get_engine, created when the first session is"""
+
+    def __call__(self, **local_kw):
+        get_engine()
+        return super().__call__(**local_kw)
+
+SessionLocal = LazySessionmaker(autocommit=False, autoflush=False)
+
+def __getattr__(name):
+    # `from app.database import engine` creates the engine at that point
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def has_schema() -> bool:
+    """Whether the database has been migrated with Alembic, which alone manages the schema"""
+    return inspect(get_engine()).has_table("alembic_version")
 
 Base = declarative_base()
 
-# Dependency
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+def async_database_url(url: str) -> str:
+    """Swap the sync driver of a URL for its async counterpart"""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for {parsed.get_backend_name()}")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+_async_engine = None
+_async_sessionmaker = None
+
+def get_async_engine():
+    """Create the async engine on first use so its driver is only needed when used"""
+    global _async_engine, _async_sessionmaker
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        url = ASYNC_DATABASE_URL or async_database_url(SQLALCHEMY_DATABASE_URL)
+        options = engine_options(url)
+        options.pop("connect_args", None)
+        _async_engine = create_async_engine(url, **options)
+        if is_sqlite(url):
+            event.listen(_async_engine.sync_engine, "connect", configure_sqlite)
+        _async_sessionmaker = async_sessionmaker(_async_engine, expire_on_commit=False)
+    return _async_engine
+
+async def get_async_db():
+    get_async_engine()
+    async with _async_sessionmaker() as db:
+        yield db
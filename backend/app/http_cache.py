@@ -0,0 +1,239 @@
+import base64
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional
+from urllib.parse import quote
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+
+from app.config import PUBLISHED_CACHE_MAX_AGE, PUBLISHED_SHARED_CACHE_MAX_AGE
+
+
+def make_etag(*parts) -> str:
+    """Build a strong ETag from the values that identify a representation"""
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # SQLite hands back naive datetimes that are already UTC
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def latest(values: Iterable[Optional[datetime]]) -> Optional[datetime]:
+    present = [as_utc(value) for value in values if value is not None]
+    return max(present) if present else None
+
+
+def cache_control(published: bool) -> str:
+    """Cache policy for content of a bucket: cacheable once published, never for drafts"""
+    if published:
+        return f"public, max-age={PUBLISHED_CACHE_MAX_AGE}, s-maxage={PUBLISHED_SHARED_CACHE_MAX_AGE}"
+    return "no-store"
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime], published: bool) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control(published)}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(as_utc(last_modified).replace(microsecond=0), usegmt=True)
+    return headers
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in candidates
+
+
+def is_not_modified(request_headers: Headers, etag: str, last_modified: Optional[datetime]) -> bool:
+    """Evaluate If-None-Match, then If-Modified-Since, as RFC 9110 orders them"""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = as_utc(parsedate_to_datetime(if_modified_since))
+        except (TypeError, ValueError):
+            return False
+        return as_utc(last_modified).replace(microsecond=0) <= since
+    return False
+
+
+def bucket_validators(bucket) -> tuple[str, Optional[datetime]]:
+    """ETag and Last-Modified for a bucket with its files loaded"""
+    files = sorted(bucket.files, key=lambda f: f.id)
+    etag = make_etag(
+        bucket.id, bucket.title, bucket.slug, bucket.version, bucket.release_date,
+        bucket.content, bucket.is_published, bucket.updated_at,
+        *((f.id, f.original_name, f.description, f.storage_path, f.updated_at) for f in files),
+    )
+    last_modified = latest([bucket.created_at, bucket.updated_at, *(f.updated_at or f.created_at for f in files)])
+    return etag, last_modified
+
+
+def digest_headers(checksum: str) -> dict:
+    """Digest of the whole content, from its hex SHA-256, in the RFC 9530 and older RFC 3230 forms"""
+    try:
+        encoded = base64.b64encode(bytes.fromhex(checksum)).decode()
+    except (TypeError, ValueError):
+        # Not a checksum, e.g. a file stored before blobs were named by content
+        return {}
+    return {"Repr-Digest": f"sha-256=:{encoded}:", "Digest": f"SHA-256={encoded}"}
+
+
+def content_disposition(filename: str) -> str:
+    """Attachment header value, RFC 5987 encoded when the name isn't plain ASCII"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def not_modified(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(range_header: str, file_size: int) -> Optional[tuple[int, int]]:
+    """Parse a single byte range into inclusive (start, end).
+
+    Returns None when the header should be ignored (malformed or multiple ranges),
+    in which case the whole file is sent.
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    start_text, _, end_text = ranges.strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else file_size - 1
+        else:
+            # Suffix range: the last N bytes
+            suffix = int(end_text)
+            if suffix == 0:
+                raise RangeNotSatisfiable()
+            start = max(file_size - suffix, 0)
+            end = file_size - 1
+    except ValueError:
+        return None
+    if start >= file_size:
+        raise RangeNotSatisfiable()
+    if start > end:
+        return None
+    return start, min(end, file_size - 1)
+
+
+class RevalidatedStaticFiles(StaticFiles):
+    """StaticFiles whose responses caches may store but must revalidate, for files rewritten in place"""
+
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, no-cache"
+        return response
+
+
+class RangedFileResponse(FileResponse):
+    """FileResponse that serves single byte ranges with 206 Partial Content"""
+
+    async def __call__(self, scope, receive, send) -> None:
+        request_headers = Headers(scope=scope)
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        self.headers["accept-ranges"] = "bytes"
+
+        # A stale If-Range means the client's partial copy is outdated
+        if not range_header or (if_range is not None and if_range != self.headers.get("etag")):
+            return await super().__call__(scope, receive, send)
+
+        stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+        file_size = stat_result.st_size
+        try:
+            byte_range = parse_range(range_header, file_size)
+        except RangeNotSatisfiable:
+            response = Response(status_code=416, headers={"Content-Range": f"bytes */{file_size}"})
+            return await response(scope, receive, send)
+        if byte_range is None:
+            return await super().__call__(scope, receive, send)
+
+        start, end = byte_range
+        self.status_code = 206
+        self.headers["content-length"] = str(end - start + 1)
+        self.headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+        self.set_stat_headers(stat_result)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class RangedStreamResponse(Response):
+    """Streams content read from storage, serving single byte ranges with 206 like RangedFileResponse.
+
+    reader(start, end) yields the bytes from start up to and including end.
+    """
+
+    def __init__(self, reader, size: int, filename: Optional[str] = None,
+                 media_type: Optional[str] = None, headers: Optional[dict] = None):
+        self.reader = reader
+        self.size = size
+        self.status_code = 200
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers["content-length"] = str(size)
+        self.headers["accept-ranges"] = "bytes"
+        if filename is not None:
+            self.headers["content-disposition"] = content_disposition(filename)
+
+    async def __call__(self, scope, receive, send) -> None:
+        request_headers = Headers(scope=scope)
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+
+        start, end = 0, self.size - 1
+        if range_header and (if_range is None or if_range == self.headers.get("etag")):
+            try:
+                byte_range = parse_range(range_header, self.size)
+            except RangeNotSatisfiable:
+                response = Response(status_code=416, headers={"Content-Range": f"bytes */{self.size}"})
+                return await response(scope, receive, send)
+            if byte_range is not None:
+                start, end = byte_range
+                self.status_code = 206
+                self.headers["content-length"] = str(end - start + 1)
+                self.headers["content-range"] = f"bytes {start}-{end}/{self.size}"
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() != "HEAD" and end >= start:
+            async for chunk in self.reader(start, end):
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -0,0 +1,332 @@
+"""Background jobs kept in the ``jobs`` table and run by worker threads.
+
+A job is enqueued in the same transaction as the write that needs it, so it
+exists exactly when that write was committed, and no outside broker is needed:
+
+    jobs.enqueue(db, "render_bucket", subject=f"bucket:{bucket.id}", bucket_id=bucket.id)
+    db.commit()
+
+Handlers are registered with ``@jobs.handler("name")`` and are called with a
+fresh session and the job's keyword arguments. A job can run more than once
+(a worker may die after doing the work but before recording it), so handlers
+must be idempotent. Failed attempts are retried with exponential backoff, up
+to JOB_MAX_ATTEMPTS. When a worker claims a job with a subject, jobs of the
+same kind for that subject that are already due are folded into it, since
+this run sees everything they were enqueued for.
+
+Each app process runs JOB_WORKERS threads. Jobs are claimed with a conditional
+UPDATE, so any number of processes can share the table. To run workers apart
+from the web app, set JOB_WORKERS=0 there and run:
+
+    python -m app.jobs --workers 4
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import Callable, NamedTuple, Optional
+
+from sqlalchemy import and_, delete, event, or_, select, update
+from sqlalchemy.orm import Session
+
+from app import metrics
+from app.config import (
+    JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_POLL_INTERVAL, JOB_RETENTION_DAYS, JOB_RETRY_DELAY, JOB_WORKERS,
+)
+from app.models import Job, utcnow
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Candidate jobs read per claim attempt; others may take some of them first
+CLAIM_BATCH = 10
+# Seconds between sweeps for lost and expired jobs
+MAINTENANCE_INTERVAL = 300
+
+jobs_processed = metrics.registry.counter(
+    "jobs_processed_total", "Background job attempts by outcome (succeeded, retried or failed)", ("kind", "outcome"))
+job_duration = metrics.registry.histogram(
+    "job_duration_seconds", "Time to run one background job attempt", ("kind",))
+
+_handlers: dict[str, Callable] = {}
+# Housekeeping of other modules, run with the sweep for lost jobs
+_maintenance: list[Callable[[Session], None]] = []
+# Set when a transaction that enqueued jobs commits, so idle workers start right away
+_wakeup = threading.Event()
+
+
+class ClaimedJob(NamedTuple):
+    id: int
+    kind: str
+    payload: str
+    attempts: int
+    max_attempts: int
+    locked_at: object
+
+
+def handler(kind: str):
+    """Register the function that runs jobs of this kind"""
+    def register(function):
+        _handlers[kind] = function
+        return function
+    return register
+
+
+def maintenance(function):
+    """Register a function run with a session every MAINTENANCE_INTERVAL, e.g. to prune old rows"""
+    _maintenance.append(function)
+    return function
+
+
+def enqueue(db: Session, kind: str, subject: Optional[str] = None, delay: float = 0, **payload) -> Job:
+    """Add a job to the caller's transaction; it becomes runnable when that commits"""
+    job = Job(
+        kind=kind,
+        subject=subject,
+        payload=json.dumps(payload),
+        status=PENDING,
+        attempts=0,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        run_after=utcnow() + timedelta(seconds=delay),
+    )
+    db.add(job)
+    db.info["jobs_enqueued"] = True
+    return job
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_workers(session):
+    if session.info.pop("jobs_enqueued", False):
+        _wakeup.set()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_enqueued(session):
+    session.info.pop("jobs_enqueued", None)
+
+
+def get_job(db: Session, job_id: int) -> Optional[Job]:
+    return db.get(Job, job_id)
+
+
+def get_jobs(db: Session, status: Optional[str] = None, kind: Optional[str] = None,
+             subject: Optional[str] = None, limit: int = 100) -> list[Job]:
+    """Most recent jobs first, optionally filtered"""
+    query = db.query(Job)
+    if status:
+        query = query.filter(Job.status == status)
+    if kind:
+        query = query.filter(Job.kind == kind)
+    if subject:
+        query = query.filter(Job.subject == subject)
+    return query.order_by(Job.id.desc()).limit(limit).all()
+
+
+def claim(db: Session) -> Optional[ClaimedJob]:
+    """Mark the next due job as running and return it, or None if there is nothing to do"""
+    now = utcnow()
+    lease_expired = now - timedelta(seconds=JOB_LEASE_SECONDS)
+    claimable = or_(
+        and_(Job.status == PENDING, Job.run_after <= now),
+        # A worker died or hung while running it
+        and_(Job.status == RUNNING, Job.locked_at < lease_expired, Job.attempts < Job.max_attempts),
+    )
+    candidates = db.execute(
+        select(Job.id).where(claimable).order_by(Job.run_after, Job.id).limit(CLAIM_BATCH)
+    ).scalars().all()
+    for job_id in candidates:
+        result = db.execute(
+            update(Job)
+            .where(Job.id == job_id, claimable)
+            .values(status=RUNNING, locked_at=now, attempts=Job.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            # Another worker got there first
+            db.rollback()
+            continue
+        job = db.execute(
+            select(Job.id, Job.kind, Job.subject, Job.payload, Job.attempts, Job.max_attempts)
+            .where(Job.id == job_id)
+        ).one()
+        if job.subject is not None:
+            db.execute(
+                update(Job)
+                .where(Job.kind == job.kind, Job.subject == job.subject, Job.status == PENDING,
+                       Job.run_after <= now, Job.id != job_id)
+                .values(status=SUCCEEDED, finished_at=now)
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
+        return ClaimedJob(job.id, job.kind, job.payload, job.attempts, job.max_attempts, now)
+    db.rollback()
+    return None
+
+
+def run_job(session_factory, job: ClaimedJob) -> bool:
+    """Run a claimed job and record the outcome; returns whether it succeeded"""
+    started = time.perf_counter()
+    error = None
+    try:
+        function = _handlers.get(job.kind)
+        if function is None:
+            raise LookupError(f"No handler registered for job kind {job.kind!r}")
+        with session_factory() as db:
+            function(db, **json.loads(job.payload))
+    except Exception as e:
+        error = e
+    job_duration.observe(time.perf_counter() - started, job.kind)
+
+    now = utcnow()
+    if error is None:
+        outcome = "succeeded"
+        values = {"status": SUCCEEDED, "finished_at": now, "last_error": None}
+    elif job.attempts >= job.max_attempts:
+        outcome = "failed"
+        logger.error("Job %s (%s) failed after %s attempts", job.id, job.kind, job.attempts, exc_info=error)
+        values = {"status": FAILED, "finished_at": now, "last_error": _describe(error)}
+    else:
+        outcome = "retried"
+        logger.warning("Job %s (%s) attempt %s failed: %s", job.id, job.kind, job.attempts, _describe(error))
+        delay = JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+        values = {"status": PENDING, "run_after": now + timedelta(seconds=delay), "last_error": _describe(error)}
+    jobs_processed.inc(job.kind, outcome)
+
+    with session_factory() as db:
+        # Only if the job is still ours: a lost lease means another worker has it
+        db.execute(
+            update(Job)
+            .where(Job.id == job.id, Job.status == RUNNING, Job.locked_at == job.locked_at)
+            .values(locked_at=None, **values)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    return error is None
+
+
+def _describe(error: Exception) -> str:
+    return f"{type(error).__name__}: {error}"[:2000]
+
+
+def run_maintenance(db: Session) -> None:
+    """Fail jobs lost with no attempts left, delete finished jobs past retention and run registered maintenance"""
+    now = utcnow()
+    db.execute(
+        update(Job)
+        .where(Job.status == RUNNING, Job.locked_at < now - timedelta(seconds=JOB_LEASE_SECONDS),
+               Job.attempts >= Job.max_attempts)
+        .values(status=FAILED, finished_at=now, locked_at=None, last_error="Worker stopped while running the job")
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(
+        delete(Job)
+        .where(Job.status.in_((SUCCEEDED, FAILED)), Job.finished_at < now - timedelta(days=JOB_RETENTION_DAYS))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    for function in _maintenance:
+        try:
+            function(db)
+        except Exception:
+            logger.exception("Maintenance task %s failed", function.__name__)
+            db.rollback()
+
+
+def retry_failed(db: Session) -> int:
+    """Give every failed job a fresh set of attempts; returns how many"""
+    result = db.execute(
+        update(Job)
+        .where(Job.status == FAILED)
+        .values(status=PENDING, attempts=0, run_after=utcnow(), finished_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    _wakeup.set()
+    return result.rowcount
+
+
+class WorkerPool:
+    """Threads that claim and run jobs until stopped"""
+
+    def __init__(self, session_factory, workers: int = JOB_WORKERS, poll_interval: float = JOB_POLL_INTERVAL):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._stopping = threading.Event()
+        self._maintained_at = 0.0
+        self._maintenance_lock = threading.Lock()
+
+    def start(self) -> None:
+        self._stopping.clear()
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop claiming jobs and wait for running ones to finish"""
+        self._stopping.set()
+        _wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_once(self) -> bool:
+        """Claim and run one job; returns False when none was due"""
+        with self.session_factory() as db:
+            job = claim(db)
+        if job is None:
+            return False
+        run_job(self.session_factory, job)
+        return True
+
+    def _maintain(self) -> None:
+        with self._maintenance_lock:
+            if time.monotonic() - self._maintained_at < MAINTENANCE_INTERVAL:
+                return
+            self._maintained_at = time.monotonic()
+        with self.session_factory() as db:
+            run_maintenance(db)
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                ran = self.run_once()
+                if not ran:
+                    self._maintain()
+            except Exception:
+                logger.exception("Job worker error")
+                ran = False
+            if not ran:
+                _wakeup.wait(self.poll_interval)
+                _wakeup.clear()
+
+
+if __name__ == "__main__":
+    from app import changes, processing, publish, storage_scrub  # noqa: F401  (register job handlers and maintenance)
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Run background job workers")
+    parser.add_argument("--workers", type=int, default=max(JOB_WORKERS, 1), help="worker threads")
+    parser.add_argument("--retry-failed", action="store_true", help="requeue failed jobs and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.retry_failed:
+        with SessionLocal() as db:
+            print(f"Requeued {retry_failed(db)} jobs")
+    else:
+        pool = WorkerPool(SessionLocal, workers=args.workers)
+        pool.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pool.stop()
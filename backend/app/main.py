@@ -1,42 +1,91 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File as FastAPIFile, Form
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, UploadFile, File as FastAPIFile, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.openapi.utils import get_openapi
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import Response
 from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager
 from typing import List, Optional
+import asyncio
+import logging
 import os
-from app import crud
-from app.models import Base
-from app.schemas import Bucket, BucketCreate, BucketUpdate, File
-from app.database import engine, get_db
-from app.storage_service import file_storage
+from app import (
+    admission, archive, changes, compression, crud, jobs, metrics, publish, render, search, serialization, tracing,
+    versions,
+)
+from app import storage_scrub  # noqa: F401  (registers the scrub job and its maintenance)
+from app.schemas import (
+    Bucket, BucketCreate, BucketUpdate, BucketSummary, ChangeFeed, File, FileUploadResult, FileVersion, Job, SearchHit
+)
+from app.database import get_db, has_schema, SessionLocal
+from app.storage_service import file_storage, FileTooLargeError
+from app.config import CHANGES_MAX_WAIT, JOB_WORKERS, MAX_BATCH_FILES, RESPONSE_COMPRESSION_MIN_SIZE
+from app.cache import CachedBucket, bucket_cache
+from app.http_cache import (
+    RangedFileResponse,
+    RangedStreamResponse,
+    RevalidatedStaticFiles,
+    bucket_validators,
+    content_disposition,
+    digest_headers,
+    is_not_modified,
+    not_modified,
+    validator_headers,
+)
+from app.pagination import InvalidCursorError, decode_cursor, set_next_cursor
+from app.routers import release_notes
 from sqlalchemy.sql import func
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing connects or touches the disk at import; each worker does it once here.
+    # The schema is managed by Alembic alone (`alembic upgrade head`).
+    await asyncio.to_thread(file_storage.setup)
+    if not await asyncio.to_thread(has_schema):
+        logger.error("The database has not been migrated; run `alembic upgrade head`")
+    # Post-upload processing and rendering run in these threads (see app/jobs.py)
+    worker_pool = jobs.WorkerPool(SessionLocal, workers=JOB_WORKERS)
+    worker_pool.start()
+    try:
+        yield
+    finally:
+        await asyncio.to_thread(worker_pool.stop)
 
 app = FastAPI(
     title="Release Notes CMS",
     description="A modern Content Management System for managing release notes",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Middleware to disable caching
+metrics.instrument_engines()
+tracing.setup_tracing()
+
+# Middleware to disable caching for routes that don't set their own policy
 class NoCacheMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request, call_next):
         response = await call_next(request)
-        response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
+        if "Cache-Control" not in response.headers:
+            response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+            response.headers["Pragma"] = "no-cache"
+            response.headers["Expires"] = "0"
         return response
 
 app.add_middleware(NoCacheMiddleware)
 
-# Mount static files with no caching
-app.mount("/storage", StaticFiles(directory="app/storage", html=True), name="storage")
+# Mount static files with no caching; the directory is created at startup (see lifespan)
+app.mount("/storage", StaticFiles(directory=file_storage.base_storage_path, html=True, check_dir=False), name="storage")
+
+# Snapshot of published buckets (see app/publish.py); other web servers can serve the same directory
+app.mount("/published", RevalidatedStaticFiles(directory=publish.static_site.path, html=True, check_dir=False), name="published")
+
+# Rate limits, concurrency caps and download bandwidth per route class (see app/admission.py);
+# inside CORS so browsers can read the 429s and 503s
+app.add_middleware(admission.AdmissionMiddleware)
 
 # Configure CORS
 app.add_middleware(
@@ -45,8 +94,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# JSON and HTML responses are compressed for clients that accept gzip or Brotli
+app.add_middleware(compression.CompressionMiddleware, minimum_size=RESPONSE_COMPRESSION_MIN_SIZE)
+
+# Outermost, so its timings cover every other middleware and it counts bytes as sent
+app.add_middleware(metrics.MetricsMiddleware)
+
 def custom_openapi():
     if app.openapi_schema:
         return app.openapi_schema
@@ -89,21 +145,142 @@ def custom_openapi():
 
 app.openapi = custom_openapi
 
+app.include_router(release_notes.router)
+
+@app.exception_handler(InvalidCursorError)
+async def invalid_cursor_handler(request, exc: InvalidCursorError):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+@app.exception_handler(changes.InvalidTokenError)
+async def invalid_change_token_handler(request, exc: changes.InvalidTokenError):
+    # An expired token is gone for good: the client has to fetch everything again
+    status_code = 410 if isinstance(exc, changes.TokenExpiredError) else 400
+    return JSONResponse(status_code=status_code, content={"detail": str(exc)})
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Release Notes CMS API"}
 
 @app.get("/buckets/", response_model=List[Bucket])
-def read_buckets(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    buckets = crud.get_buckets(db, skip=skip, limit=limit)
-    return buckets
+def read_buckets(
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    List buckets ordered by creation time.
+
+    Pass the `X-Next-Cursor` response header back as `cursor` to fetch the next page.
+    `GET /buckets/stream` returns every bucket as NDJSON instead.
+    """
+    # Column rows encoded directly; validating ORM objects costs more than the query
+    buckets = crud.get_bucket_rows(db, skip=skip, limit=limit, cursor=cursor)
+    response = serialization.FastJSONResponse(buckets)
+    set_next_cursor(response, buckets, limit)
+    return response
+
+def stream_rows(read_page, cursor: Optional[str]) -> StreamingResponse:
+    """Stream every row from cursor on as NDJSON, reading a page at a time with a session per page"""
+    if cursor:
+        # Fail before the response starts rather than halfway through it
+        decode_cursor(cursor)
+
+    def read(skip, limit, cursor):
+        with SessionLocal() as db:
+            return read_page(db, skip, limit, cursor)
+
+    return StreamingResponse(
+        serialization.ndjson_chunks(crud.iter_row_batches(read, cursor)),
+        media_type=serialization.NDJSON_MEDIA_TYPE,
+    )
+
+@app.get("/buckets/stream", response_model=List[Bucket])
+def stream_buckets(cursor: Optional[str] = None):
+    """
+    Every bucket with its files, one JSON object per line (NDJSON), in the order of `GET /buckets/`.
+
+    The response is written as it is read, so its size is not limited by memory.
+    Pass a `cursor` from `GET /buckets/` to start after that page.
+    """
+    return stream_rows(crud.get_bucket_rows, cursor)
+
+@app.get("/buckets/summary", response_model=List[BucketSummary])
+def read_bucket_summaries(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    List buckets with file counts and total file size instead of the full file list.
+    """
+    summaries = crud.get_bucket_summaries(db, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, summaries, limit)
+    return summaries
+
+def serialize_bucket(db_bucket) -> Optional[CachedBucket]:
+    if db_bucket is None:
+        return None
+    etag, last_modified = bucket_validators(db_bucket)
+    body = Bucket.model_validate(db_bucket).model_dump_json()
+    return CachedBucket(db_bucket.id, db_bucket.slug, body, etag, last_modified, db_bucket.is_published)
+
+def cached_bucket_response(request: Request, cached: CachedBucket) -> Response:
+    headers = validator_headers(cached.etag, cached.last_modified, cached.published)
+    if is_not_modified(request.headers, cached.etag, cached.last_modified):
+        return not_modified(headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+@app.get("/buckets/by-slug/{slug}", response_model=Bucket)
+def read_bucket_by_slug(slug: str, request: Request, db: Session = Depends(get_db)):
+    """
+    Get a bucket with its files by slug.
+
+    Served from the bucket cache when possible; supports the same conditional
+    requests as `GET /buckets/{bucket_id}`.
+    """
+    cached = bucket_cache.read_through_slug(slug, lambda: serialize_bucket(crud.get_bucket_by_slug(db, slug=slug)))
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Release bucket not found")
+    return cached_bucket_response(request, cached)
 
 @app.get("/buckets/{bucket_id}", response_model=Bucket)
-def read_bucket(bucket_id: int, db: Session = Depends(get_db)):
-    db_bucket = crud.get_bucket_with_files(db, bucket_id=bucket_id)
+def read_bucket(bucket_id: int, request: Request, db: Session = Depends(get_db)):
+    """
+    Get a bucket with its files.
+
+    Published buckets are cacheable; send `If-None-Match` or `If-Modified-Since`
+    to get `304 Not Modified` when nothing changed.
+    """
+    cached = bucket_cache.read_through(
+        bucket_id, lambda: serialize_bucket(crud.get_bucket_with_files(db, bucket_id=bucket_id))
+    )
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Release bucket not found")
+    return cached_bucket_response(request, cached)
+
+@app.get("/buckets/{slug}/html", response_class=HTMLResponse)
+def read_bucket_html(slug: str, request: Request, db: Session = Depends(get_db)):
+    """
+    Get a bucket's content rendered from markdown to sanitized HTML.
+
+    Rendering is cached by content hash, and published buckets are rendered
+    when they are saved, so this normally serves pre-rendered HTML. Drafts
+    are rendered on each request without being stored.
+    """
+    db_bucket = crud.get_bucket_by_slug(db, slug=slug)
     if db_bucket is None:
         raise HTTPException(status_code=404, detail="Release bucket not found")
-    return db_bucket
+
+    html, render_key = render.get_rendered_html(db, db_bucket)
+    etag = f'"{render_key}"'
+    last_modified = db_bucket.updated_at or db_bucket.created_at
+    headers = validator_headers(etag, last_modified, db_bucket.is_published)
+    if is_not_modified(request.headers, etag, last_modified):
+        return not_modified(headers)
+    return HTMLResponse(content=html, headers=headers)
 
 @app.post("/buckets/", response_model=Bucket)
 def create_bucket(bucket: BucketCreate, db: Session = Depends(get_db)):
@@ -135,50 +312,165 @@ async def upload_file(
     db: Session = Depends(get_db)
 ):
     # Verify bucket exists
-    db_bucket = crud.get_bucket(db, bucket_id=bucket_id)
+    db_bucket = await asyncio.to_thread(crud.get_bucket, db, bucket_id=bucket_id)
     if not db_bucket:
         raise HTTPException(status_code=404, detail="Release bucket not found")
 
     try:
-        # Read file content
-        contents = await file.read()
-        
-        # Save file and create record
-        db_file = crud.create_file(
+        # Stream file to storage and create record
+        db_file = await crud.create_file_from_upload(
             db=db,
-            file_data=contents,
+            upload=file,
             original_name=file.filename,
             bucket_id=bucket_id,
             description=description
         )
         return db_file
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
 
+@app.post("/buckets/{bucket_id}/files/batch", response_model=List[FileUploadResult])
+async def upload_files(
+    bucket_id: int,
+    files: List[UploadFile] = FastAPIFile(...),
+    descriptions: List[str] = Form([]),
+    db: Session = Depends(get_db)
+):
+    """
+    Upload many files to a bucket in one request.
+
+    - **files**: The files to upload (repeat the `files` field)
+    - **descriptions**: Optional descriptions, matched to files by position
+    - **Returns**: One result per file, in order, with `status` "created" or "failed"
+
+    Files are written to storage concurrently and all file records are created
+    in a single transaction. A file that fails to store (e.g. too large) is
+    reported in its result without affecting the others.
+    """
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_FILES} files can be uploaded at once")
+
+    db_bucket = await asyncio.to_thread(crud.get_bucket, db, bucket_id=bucket_id)
+    if not db_bucket:
+        raise HTTPException(status_code=404, detail="Release bucket not found")
+
+    try:
+        results = await crud.create_files_from_uploads(db, files, bucket_id, descriptions)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error saving files: {str(e)}")
+
+    return [
+        {
+            "original_name": upload.filename,
+            "status": "failed" if error else "created",
+            "file": db_file,
+            "error": str(error) if error else None
+        }
+        for upload, db_file, error in results
+    ]
+
 @app.get("/buckets/{bucket_id}/files/", response_model=List[File])
 def get_bucket_files(
     bucket_id: int,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    files = crud.get_file_rows(db, bucket_id=bucket_id, skip=skip, limit=limit, cursor=cursor)
+    response = serialization.FastJSONResponse(files)
+    set_next_cursor(response, files, limit)
+    return response
+
+@app.get("/buckets/{bucket_id}/files/stream", response_model=List[File])
+def stream_bucket_files(bucket_id: int, cursor: Optional[str] = None):
+    """Every file of a bucket as NDJSON, in the order of `GET /buckets/{bucket_id}/files/`"""
+    return stream_rows(lambda db, skip, limit, cursor: crud.get_file_rows(db, bucket_id, skip, limit, cursor), cursor)
+
+@app.get("/search", response_model=List[SearchHit])
+def search_content(
+    q: str,
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_drafts: bool = False,
     db: Session = Depends(get_db)
 ):
-    return crud.get_files(db, bucket_id=bucket_id, skip=skip, limit=limit)
+    """
+    Full-text search over bucket titles, versions and content and file names and descriptions.
+
+    - **q**: Search terms; results contain all of them (stemmed, so "fixes" matches "fixed")
+    - **include_drafts**: Also match unpublished buckets and their files
+    - **Returns**: Best matches first, with `<mark>`-highlighted title and snippet
+
+    Pass the `X-Next-Cursor` response header back as `cursor` to fetch the next page.
+    """
+    hits, next_page = search.search(db, q, limit=limit, cursor=cursor, include_drafts=include_drafts)
+    if next_page:
+        response.headers["X-Next-Cursor"] = next_page
+    return hits
 
 @app.get("/files/{file_id}/download")
-async def download_file(file_id: int, db: Session = Depends(get_db)):
+def download_file(file_id: int, request: Request, db: Session = Depends(get_db)):
+    """
+    Download file content.
+
+    Supports conditional requests (`If-None-Match`, `If-Modified-Since`) and
+    single byte `Range` requests for resuming large downloads. Content stored
+    compressed is sent as-is with `Content-Encoding` when the client accepts
+    that coding, and decompressed on the fly otherwise.
+
+    The ETag is the SHA-256 of the content. Uncompressed responses also carry
+    it as `Repr-Digest` and `Digest`, so clients can verify what they received.
+    """
     db_file = crud.get_file(db, file_id=file_id)
     if not db_file:
         raise HTTPException(status_code=404, detail="File not found")
-    
-    return FileResponse(
-        path=db_file.storage_path,
+
+    storage_path = db_file.storage_path
+    encoding = None
+    if db_file.content_encoding:
+        encoding = compression.negotiate(request.headers.get("accept-encoding"), [db_file.content_encoding])
+    # The content hash makes a strong validator; the compressed
+    # representation needs one of its own, and has a different digest
+    checksum = db_file.checksum or file_storage.content_hash(storage_path)
+    etag = f'"{checksum}-{encoding}"' if encoding else f'"{checksum}"'
+    last_modified = db_file.updated_at or db_file.created_at
+    headers = validator_headers(etag, last_modified, db_file.bucket.is_published)
+    if not encoding:
+        headers.update(digest_headers(checksum))
+    if db_file.content_encoding:
+        headers["Vary"] = "Accept-Encoding"
+    if is_not_modified(request.headers, etag, last_modified):
+        return not_modified(headers)
+
+    if db_file.content_encoding and not encoding:
+        return RangedStreamResponse(
+            lambda start, end: file_storage.read_blob(storage_path, start, end, decode=True),
+            size=int(db_file.file_size),
+            filename=db_file.original_name,
+            media_type="text/plain",
+            headers=headers
+        )
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    local_path = file_storage.local_path(storage_path)
+    if local_path is None:
+        # Remote backends are streamed through in chunks
+        return RangedStreamResponse(
+            lambda start, end: file_storage.read_blob(storage_path, start, end),
+            size=file_storage.blob_size(storage_path) if encoding else int(db_file.file_size),
+            filename=db_file.original_name,
+            media_type="text/plain",
+            headers=headers
+        )
+    return RangedFileResponse(
+        path=local_path,
         filename=db_file.original_name,
         media_type="text/plain",
-        headers={
-            "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
-            "Pragma": "no-cache",
-            "Expires": "0"
-        }
+        headers=headers
     )
 
 @app.get("/files/{file_id}", response_model=File)
@@ -204,10 +496,16 @@ def delete_file(file_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="File not found")
     return {"message": "File deleted successfully"}
 
-@app.put("/files/{file_id}/content")
+# The body is read by the endpoint, after its preconditions, so the schema is given here
+@app.put(
+    "/files/{file_id}/content",
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "multipart/form-data": {"schema": {"$ref": "#/components/schemas/UpdateFileContent"}}
+    }}},
+)
 async def update_file_content(
     file_id: int,
-    file: UploadFile = FastAPIFile(...),
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """
@@ -219,30 +517,240 @@ async def update_file_content(
     
     This endpoint allows you to replace the content of an existing file while maintaining
     the same file ID and metadata. The file size and updated timestamp will be automatically
-    updated in the database.
+    updated in the database. The previous content stays available as an earlier version.
+
+    To skip uploading content the file already has, send its SHA-256 as
+    `If-None-Match: "<sha256>"`: if it is the current content, the answer is
+    `412 Precondition Failed` before the body is read. With `Expect: 100-continue`
+    the client doesn't send the body at all.
+    """
+    db_file = await asyncio.to_thread(crud.get_file, db, file_id=file_id)
+    if not db_file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    checksum = db_file.checksum or file_storage.content_hash(db_file.storage_path)
+    etag = f'"{checksum}"'
+    if "if-none-match" in request.headers and is_not_modified(request.headers, etag, None):
+        return JSONResponse(
+            status_code=412, content={"detail": "File already has this content"}, headers={"ETag": etag}
+        )
+
+    async with request.form() as form:
+        file = form.get("file")
+        if file is None or isinstance(file, str):
+            raise HTTPException(status_code=422, detail="A file is required")
+        try:
+            # Stream new content to storage and point the file at it
+            db_file = await crud.update_file_content(db, db_file, file)
+
+            return {"message": "File content updated successfully", "file": db_file}
+        except FileTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error updating file: {str(e)}")
+
+@app.get("/files/{file_id}/versions", response_model=List[FileVersion])
+def list_file_versions(file_id: int, db: Session = Depends(get_db)):
+    """
+    List the versions of a file's content, oldest first.
+
+    Version 1 is the content the file was created with; every content update
+    or restore adds the next one.
     """
     db_file = crud.get_file(db, file_id=file_id)
     if not db_file:
         raise HTTPException(status_code=404, detail="File not found")
+    return versions.get_versions(db, file_id)
 
+@app.get("/files/{file_id}/versions/diff", response_class=PlainTextResponse)
+def diff_file_versions(
+    file_id: int,
+    from_version: int = Query(..., alias="from"),
+    to_version: int = Query(..., alias="to"),
+    db: Session = Depends(get_db)
+):
+    """
+    Unified diff between two versions of a text file, e.g. `?from=3&to=5`.
+    """
+    db_file = crud.get_file(db, file_id=file_id)
+    if not db_file:
+        raise HTTPException(status_code=404, detail="File not found")
     try:
-        # Read new file content
-        contents = await file.read()
-        
-        # Update file in storage
-        success = file_storage.update_file(db_file.storage_path, contents)
-        if not success:
-            raise HTTPException(status_code=500, detail="Error updating file content")
-        
-        # Update file metadata in database
-        db_file.file_size = len(contents)
-        db_file.updated_at = func.now()
-        db.commit()
-        db.refresh(db_file)
-        
-        return {"message": "File content updated successfully", "file": db_file}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error updating file: {str(e)}")
+        diff = versions.diff_versions(db, db_file, from_version, to_version)
+    except versions.VersionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if diff is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+    return PlainTextResponse(diff, media_type="text/x-diff")
+
+@app.get("/files/{file_id}/versions/{version}")
+def download_file_version(file_id: int, version: int, request: Request, db: Session = Depends(get_db)):
+    """
+    Download the content of one version of a file.
+    """
+    db_file = crud.get_file(db, file_id=file_id)
+    if not db_file:
+        raise HTTPException(status_code=404, detail="File not found")
+    db_version = versions.get_version(db, file_id, version)
+    if not db_version:
+        raise HTTPException(status_code=404, detail="Version not found")
+
+    # Versions never change, so their checksum is a strong validator
+    etag = f'"{db_version.checksum}"'
+    headers = validator_headers(etag, db_version.created_at, db_file.bucket.is_published)
+    headers.update(digest_headers(db_version.checksum))
+    if is_not_modified(request.headers, etag, db_version.created_at):
+        return not_modified(headers)
+
+    content = versions.read_version(db, db_file, version)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Version content not found in storage")
+    headers["Content-Disposition"] = content_disposition(db_file.original_name)
+    return Response(content, media_type="text/plain", headers=headers)
+
+@app.post("/files/{file_id}/versions/{version}/restore")
+def restore_file_version(file_id: int, version: int, db: Session = Depends(get_db)):
+    """
+    Roll a file back to an earlier version.
+
+    The restored content becomes a new version, so the restore itself can be
+    undone the same way.
+    """
+    db_file = crud.get_file(db, file_id=file_id)
+    if not db_file:
+        raise HTTPException(status_code=404, detail="File not found")
+    try:
+        db_file = crud.restore_file_version(db, db_file, version)
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if db_file is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+    return {"message": "File content restored", "file": db_file}
+
+@app.get("/export")
+def export_buckets(
+    bucket_id: Optional[List[int]] = Query(None),
+    slug: Optional[List[str]] = Query(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Stream a tar archive of buckets, their files and file contents.
+
+    - **bucket_id** / **slug**: Buckets to export (repeatable); all buckets when omitted
+    - **Returns**: `blobs/<sha256>` members, then `buckets.ndjson` and `files.ndjson`
+
+    Answers 500 before sending anything if file content is missing from storage.
+    """
+    try:
+        archive.check_export(db, bucket_ids=bucket_id, slugs=slug)
+    except archive.ArchiveError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(
+        archive.export_archive(SessionLocal, bucket_ids=bucket_id, slugs=slug),
+        media_type="application/x-tar",
+        headers={"Content-Disposition": 'attachment; filename="release-notes-export.tar"'}
+    )
+
+@app.post("/import")
+def import_buckets(file: UploadFile = FastAPIFile(...), db: Session = Depends(get_db)):
+    """
+    Import a tar archive produced by `GET /export`.
+
+    Buckets are matched by slug and updated in place, files already present
+    in a bucket with the same name and content are skipped, so re-importing
+    an archive is safe. Rows are written in batched transactions.
+    """
+    try:
+        return archive.import_archive(db, file.file)
+    except archive.ArchiveError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/changes", response_model=ChangeFeed)
+async def read_changes(
+    since: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    wait: float = Query(0, ge=0),
+    entity: Optional[str] = Query(None, pattern="^(bucket|file)$"),
+    bucket_id: Optional[int] = None,
+    published_only: bool = False,
+):
+    """
+    Changes to buckets and files after a token, for syncing incrementally.
+
+    - **since**: `next` of the previous response; omit it to start at the oldest
+      change kept, or pass `now` to get just the current token
+    - **wait**: seconds to hold the request until there is a change (long-polling),
+      at most CHANGES_MAX_WAIT
+    - **entity**: `bucket` or `file`
+    - **published_only**: only what readers of published releases need to see
+
+    Each change names a bucket or file and what happened to it: `created`, `updated`,
+    `deleted`, `published` or `unpublished`. Answers 410 when the token has expired.
+    """
+    return await changes.poll(
+        SessionLocal, changes.parse_token(since), min(wait, CHANGES_MAX_WAIT),
+        limit=limit, entity=entity, bucket_id=bucket_id, published_only=published_only,
+    )
+
+@app.get("/changes/stream")
+async def stream_changes(
+    request: Request,
+    since: Optional[str] = None,
+    entity: Optional[str] = Query(None, pattern="^(bucket|file)$"),
+    bucket_id: Optional[int] = None,
+    published_only: bool = False,
+):
+    """
+    Changes as server-sent events, from `since` (or the Last-Event-ID header of a
+    reconnecting EventSource) on, for as long as the client stays connected.
+    """
+    position = changes.parse_token(request.headers.get("last-event-id") or since)
+    filters = {"entity": entity, "bucket_id": bucket_id, "published_only": published_only}
+    # Read the first page up front, so a bad token is answered with an error status
+    feed = await changes.poll(SessionLocal, position, **filters)
+    if position is None:
+        position = int(feed.next)
+    return StreamingResponse(
+        changes.stream(SessionLocal, position, feed, **filters),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/jobs", response_model=List[Job])
+def list_jobs(
+    status: Optional[str] = None,
+    kind: Optional[str] = None,
+    subject: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """
+    List background jobs, most recent first.
+
+    - **status**: `pending`, `running`, `succeeded` or `failed`
+    - **kind**: e.g. `process_file` or `render_bucket`
+    - **subject**: what a job is about, e.g. `file:12` or `bucket:3`
+    """
+    return jobs.get_jobs(db, status=status, kind=kind, subject=subject, limit=limit)
+
+@app.get("/jobs/{job_id}", response_model=Job)
+def read_job(job_id: int, db: Session = Depends(get_db)):
+    """Status, attempts and last error of a background job"""
+    db_job = jobs.get_job(db, job_id)
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return db_job
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics():
+    """Prometheus metrics for this worker process"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit and miss counters of this worker's bucket cache"""
+    return bucket_cache.stats()
 
 @app.get("/health")
 async def health_check():
@@ -0,0 +1,254 @@
+"""In-process metrics, exposed in the Prometheus text format at ``/metrics``.
+
+Counters and histograms are plain Python objects guarded by a lock each, so
+recording a sample costs a dict lookup and a bisect. Every worker process keeps
+its own numbers; Prometheus scrapes each worker (or sums them) as usual.
+
+Besides HTTP latency per route, SQL statements are timed through SQLAlchemy
+engine events and attributed to the request that ran them, storage calls report
+bytes and durations, and the bucket cache counters are read at scrape time.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+
+def _label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield f"{self.name}{_label_text(self.labels, label_values)} {_number(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # Per label set: [count per bucket..., +Inf count, sum]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(series) for key, series in self._values.items()}
+        for label_values, series in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                le_label = f'le="{le}"'
+                yield f"{self.name}_bucket{_label_text(self.labels, label_values, le_label)} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.labels, label_values)} {_number(series[-1])}"
+            yield f"{self.name}_count{_label_text(self.labels, label_values)} {cumulative}"
+
+
+class Callback:
+    """A gauge or counter whose value is read from elsewhere when metrics are scraped"""
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], Optional[float]], kind: str = "gauge"):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+        self.kind = kind
+
+    def samples(self):
+        value = self.read()
+        if value is not None:
+            yield f"{self.name} {_number(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: tuple = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def callback(self, name: str, help_text: str, read: Callable[[], Optional[float]], kind: str = "gauge") -> Callback:
+        return self.register(Callback(name, help_text, read, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route template and status", ("method", "route", "status"))
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Time to serve a request, including streaming the body", ("method", "route"))
+http_response_bytes = registry.counter(
+    "http_response_bytes_total", "Response body bytes sent", ("route",))
+db_queries = registry.counter(
+    "db_queries_total", "SQL statements executed")
+db_query_duration = registry.histogram(
+    "db_query_duration_seconds", "Time to execute one SQL statement")
+db_queries_per_request = registry.histogram(
+    "db_queries_per_request", "SQL statements executed while serving a request", ("route",), COUNT_BUCKETS)
+db_time_per_request = registry.histogram(
+    "db_time_per_request_seconds", "Time spent in SQL while serving a request", ("route",))
+storage_bytes = registry.counter(
+    "storage_bytes_total", "Blob bytes written to or read from storage", ("direction",))
+storage_duration = registry.histogram(
+    "storage_operation_duration_seconds", "Time spent in storage calls", ("operation",))
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+
+
+# Set per request; worker threads the request hands off to share the same object
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    db_queries.inc()
+    db_query_duration.observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_time += elapsed
+
+
+def _handle_error(context):
+    # Failed statements never reach after_cursor_execute
+    if context.connection is not None and context.connection.info.get("query_start"):
+        context.connection.info["query_start"].pop()
+
+
+def instrument_engines() -> None:
+    """Time every statement of every engine, including the async engine's"""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+
+
+class timed:
+    """Context manager recording a storage call's duration and bytes moved"""
+
+    __slots__ = ("operation", "direction", "started", "bytes")
+
+    def __init__(self, operation: str, direction: Optional[str] = None):
+        self.operation = operation
+        self.direction = direction
+        self.bytes = 0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        storage_duration.observe(time.perf_counter() - self.started, self.operation)
+        if self.direction and self.bytes:
+            storage_bytes.inc(self.direction, amount=self.bytes)
+        return False
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and body size per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        status = [500]
+        sent = [0]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                sent[0] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            # Label by template ("/files/{file_id}") so paths don't explode the series count
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_requests.inc(method, route, str(status[0]))
+            http_request_duration.observe(time.perf_counter() - started, method, route)
+            http_response_bytes.inc(route, amount=sent[0])
+            db_queries_per_request.observe(stats.queries, route)
+            db_time_per_request.observe(stats.query_time, route)
@@ -1,8 +1,14 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Float
-from sqlalchemy.orm import relationship
+from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Float, Index, LargeBinary
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 from .database import Base
 
+def utcnow():
+    # Set created_at from Python so stored values keep a uniform precision,
+    # which keeps (created_at, id) pagination cursors exact on SQLite
+    return datetime.now(timezone.utc)
+
 class Bucket(Base):
     __tablename__ = "buckets"
 
@@ -13,24 +19,102 @@ class Bucket(Base):
     version = Column(String)
     release_date = Column(DateTime(timezone=True))
     is_published = Column(Boolean, default=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    rendered_hash = Column(String, nullable=True)  # Render cache key of the current content
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationship with files
-    files = relationship("File", back_populates="bucket", cascade="all, delete-orphan")
+    # The database deletes a bucket's files (ON DELETE CASCADE), without loading them first
+    files = relationship("File", back_populates="bucket", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        Index("ix_buckets_created_at_id", "created_at", "id"),
+    )
 
 class File(Base):
     __tablename__ = "files"
 
     id = Column(Integer, primary_key=True, index=True)
     original_name = Column(String)
-    storage_path = Column(String)  # Path where file is stored
+    storage_path = Column(String, index=True)  # Path of the content-addressed blob
     file_type = Column(String)     # MIME type
     file_size = Column(Float)      # Size in bytes
+    checksum = Column(String, nullable=True)  # SHA-256 of the content, hex; also names its blob
+    content_encoding = Column(String, nullable=True)  # Codec the blob is stored compressed with, if any
     description = Column(String, nullable=True)  # Optional description of the file
     bucket_id = Column(Integer, ForeignKey("buckets.id", ondelete="CASCADE"))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relationship with bucket
-    bucket = relationship("Bucket", back_populates="files") 
\ No newline at end of file
+    bucket = relationship("Bucket", back_populates="files")
+    versions = relationship("FileVersion", back_populates="file", cascade="all, delete-orphan",
+                            passive_deletes=True, order_by="FileVersion.version")
+
+    __table_args__ = (
+        Index("ix_files_bucket_id_created_at_id", "bucket_id", "created_at", "id"),
+    ) 
+
+class FileVersion(Base):
+    __tablename__ = "file_versions"
+
+    id = Column(Integer, primary_key=True)
+    file_id = Column(Integer, ForeignKey("files.id", ondelete="CASCADE"), nullable=False)
+    version = Column(Integer, nullable=False)  # 1 for the content the file was created with
+    kind = Column(String, nullable=False)  # "blob", "snapshot" or "delta", see app/versions.py
+    storage_path = Column(String, nullable=True, index=True)  # Blob holding the content ("blob" versions)
+    data = deferred(Column(LargeBinary, nullable=True))  # Compressed text or delta against the previous version
+    checksum = Column(String)  # SHA-256 of the full content
+    file_size = Column(Float)
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
+
+    file = relationship("File", back_populates="versions")
+
+    __table_args__ = (
+        Index("ix_file_versions_file_id_version", "file_id", "version", unique=True),
+    )
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)  # Name of the registered handler, see app/jobs.py
+    subject = Column(String, nullable=True, index=True)  # What the job is about, e.g. "file:12"
+    payload = Column(String, nullable=False)  # JSON keyword arguments for the handler
+    status = Column(String, nullable=False, default="pending")  # pending, running, succeeded or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    run_after = Column(DateTime(timezone=True), nullable=False, default=utcnow)
+    locked_at = Column(DateTime(timezone=True), nullable=True)  # When a worker claimed it
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
+class Change(Base):
+    __tablename__ = "change_log"
+
+    id = Column(Integer, primary_key=True)  # Increases in commit order; clients sync from it (see app/changes.py)
+    entity = Column(String, nullable=False)  # "bucket" or "file"
+    entity_id = Column(Integer, nullable=False)
+    bucket_id = Column(Integer, nullable=False)  # The bucket itself, or the file's bucket
+    action = Column(String, nullable=False)  # created, updated, deleted, published or unpublished
+    created_at = Column(DateTime(timezone=True), nullable=False, default=utcnow)
+
+    __table_args__ = (
+        Index("ix_change_log_bucket_id_id", "bucket_id", "id"),
+        Index("ix_change_log_created_at", "created_at"),
+        # Never reuse ids of pruned rows, which would move tokens backwards
+        {"sqlite_autoincrement": True},
+    )
+
+class RenderedContent(Base):
+    __tablename__ = "rendered_content"
+
+    content_hash = Column(String, primary_key=True)  # Hash of renderer version and markdown
+    html = Column(String)
+    renderer_version = Column(String)
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
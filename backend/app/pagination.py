@@ -0,0 +1,80 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import and_, or_
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    """Encode the sort key of the last row on a page as an opaque cursor"""
+    payload = json.dumps([sort_value.isoformat(), row_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Decode a cursor produced by encode_cursor into (sort_value, id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError("Invalid pagination cursor") from e
+
+
+def encode_score_cursor(score: float, row_id: int) -> str:
+    """Encode the (score, id) of the last ranked result on a page as an opaque cursor"""
+    payload = json.dumps([score, row_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_score_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        score, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return float(score), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError("Invalid pagination cursor") from e
+
+
+def keyset_filter(sort_column, id_column, cursor: str):
+    """Filter selecting rows that sort after the cursor on (sort_column, id_column)"""
+    sort_value, row_id = decode_cursor(cursor)
+    return or_(
+        sort_column > sort_value,
+        and_(sort_column == sort_value, id_column > row_id),
+    )
+
+
+def paginate(query, sort_column, id_column, skip: int, limit: int, cursor: Optional[str] = None):
+    """Order a query or select() by (sort_column, id_column) and apply one page.
+
+    A cursor seeks past the last row seen; skip is kept for older clients.
+    """
+    query = query.order_by(sort_column, id_column)
+    if cursor:
+        query = query.filter(keyset_filter(sort_column, id_column, cursor))
+    else:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+
+def next_cursor(rows, limit: int, sort_attr: str = "created_at") -> Optional[str]:
+    """Cursor for the page after rows, or None when rows is the last page"""
+    if limit <= 0 or len(rows) < limit:
+        return None
+    last = rows[-1]
+    if isinstance(last, dict):
+        return encode_cursor(last[sort_attr], last["id"])
+    return encode_cursor(getattr(last, sort_attr), last.id)
+
+
+def set_next_cursor(response, rows, limit: int, sort_attr: str = "created_at") -> None:
+    """Expose the next page cursor on the response as X-Next-Cursor"""
+    cursor = next_cursor(rows, limit, sort_attr)
+    if cursor:
+        response.headers["X-Next-Cursor"] = cursor
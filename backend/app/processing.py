@@ -0,0 +1,126 @@
+"""Work that follows a write, run by the background job workers (see jobs).
+
+Requests store what they were sent, enqueue the follow-up work in the same
+transaction and return, so their latency doesn't grow with the processing a
+file or bucket needs:
+
+- ``process_file`` runs every registered file processor that applies to a
+  file. The built-in one stores text content compressed when
+  STORAGE_COMPRESSION is set; checksums, thumbnails or scanning would be
+  further processors.
+- ``render_bucket`` pre-renders a published bucket's markdown. Until it has
+  run, the HTML endpoint renders on demand.
+- ``release_blobs`` deletes blobs that were replaced or whose files were
+  deleted, once nothing references them any more and no upload has written
+  or reused them within BLOB_REUSE_GRACE seconds (see ``crud.release_blobs``).
+  Blobs kept for that reason are released by a later job.
+
+Add a processor with::
+
+    @processing.file_processor(lambda db_file: db_file.file_type == "image/png")
+    def make_thumbnail(db, db_file):
+        ...
+
+Processors may run more than once for the same content and must be idempotent.
+"""
+from typing import Callable, Iterable
+
+from sqlalchemy.orm import Session
+
+from app import jobs, render
+from app.cache import bucket_cache
+from app.config import BLOB_RELEASE_DELAY
+from app.models import Bucket, File, FileVersion
+from app.storage_service import file_storage
+
+# Blobs per release_blobs job, so deleting a large bucket makes bounded jobs
+RELEASE_BATCH_SIZE = 500
+
+_processors: list[tuple[Callable[[File], bool], Callable[[Session, File], None]]] = []
+
+
+def file_processor(applies: Callable[[File], bool]):
+    """Register a function run in the background for each new or updated file applies() accepts"""
+    def register(function):
+        _processors.append((applies, function))
+        return function
+    return register
+
+
+def enqueue_file_processing(db: Session, db_files: Iterable[File]) -> None:
+    """Enqueue processing of files that have something to do; caller commits"""
+    for db_file in db_files:
+        if any(applies(db_file) for applies, _ in _processors):
+            jobs.enqueue(db, "process_file", subject=f"file:{db_file.id}", file_id=db_file.id)
+
+
+def enqueue_render(db: Session, bucket: Bucket) -> None:
+    """Enqueue pre-rendering of a published bucket; caller commits"""
+    if bucket.is_published:
+        jobs.enqueue(db, "render_bucket", subject=f"bucket:{bucket.id}", bucket_id=bucket.id)
+
+
+def enqueue_blob_release(db: Session, storage_paths: Iterable[str], delay: float = BLOB_RELEASE_DELAY) -> None:
+    """Enqueue deleting these blobs if nothing references them after delay seconds; caller commits.
+
+    The delay lets requests that resolved a blob just before its rows went away finish reading it.
+    """
+    storage_paths = sorted(storage_paths)
+    for start in range(0, len(storage_paths), RELEASE_BATCH_SIZE):
+        jobs.enqueue(db, "release_blobs", delay=delay, storage_paths=storage_paths[start:start + RELEASE_BATCH_SIZE])
+
+
+@jobs.handler("process_file")
+def process_file(db: Session, file_id: int) -> None:
+    db_file = db.get(File, file_id)
+    if db_file is None:
+        # Deleted since
+        return
+    for applies, function in _processors:
+        if applies(db_file):
+            function(db, db_file)
+
+
+@jobs.handler("render_bucket")
+def render_bucket(db: Session, bucket_id: int) -> None:
+    bucket = db.get(Bucket, bucket_id)
+    if bucket is None or not bucket.is_published:
+        return
+    render.render_bucket(db, bucket)
+    db.commit()
+
+
+@jobs.handler("release_blobs")
+def release_blobs(db: Session, storage_paths: list[str]) -> None:
+    from app import crud
+
+    # Checks references and the blobs' mtime again, and requeues the ones an upload just reused
+    crud.release_blobs(db, storage_paths)
+    db.commit()
+
+
+@file_processor(lambda db_file: db_file.content_encoding is None and file_storage.should_compress(db_file.file_type))
+def compress_content(db: Session, db_file: File) -> None:
+    """Move every row using the file's plain blob to a compressed copy of it"""
+    old_path = db_file.storage_path
+    storage_path = file_storage.compress_blob(old_path)
+    if storage_path is None:
+        return
+    paths = file_storage.aliases(old_path)
+    bucket_ids = {bucket_id for (bucket_id,) in db.query(File.bucket_id).filter(File.storage_path.in_(paths))}
+    # The content is unchanged, so neither is updated_at
+    db.query(File).filter(File.storage_path.in_(paths)).update(
+        {
+            File.storage_path: storage_path,
+            File.content_encoding: file_storage.content_encoding(storage_path),
+            File.updated_at: File.updated_at,
+        },
+        synchronize_session=False,
+    )
+    db.query(FileVersion).filter(FileVersion.storage_path.in_(paths)).update(
+        {FileVersion.storage_path: storage_path}, synchronize_session=False
+    )
+    enqueue_blob_release(db, [old_path])
+    db.commit()
+    for bucket_id in bucket_ids:
+        bucket_cache.invalidate(bucket_id)
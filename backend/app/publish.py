@@ -0,0 +1,255 @@
+"""Static snapshot of published buckets, served without touching the database.
+
+Published buckets are written to STATIC_PUBLISH_DIR as plain files:
+
+    index.json                  every published bucket, newest release first
+    buckets/<slug>/index.json   the bucket with its files, as GET /buckets/{id}, plus its rendered HTML
+    buckets/<slug>/index.html   the rendered content as a standalone page
+
+The app serves the directory under ``/published/``, and a web server or CDN
+in front of it can serve it directly. Files are replaced atomically, so
+readers never see one half-written.
+
+Rebuilds are incremental: a background job reads the change log (see
+changes) from the token the bundle was last built at and rewrites only the
+buckets that changed, including ones that were just published, unpublished
+or deleted. The job is enqueued by every transaction that records a change,
+and the job workers' maintenance catches up with anything missed. Without a
+token, e.g. on first run, or once the token has expired, everything is
+rebuilt. To rebuild by hand:
+
+    python -m app.publish --all
+"""
+import argparse
+import html
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, joinedload
+
+from app import changes, jobs, render, schemas
+from app.config import STATIC_PUBLISH_DIR, STATIC_PUBLISHING
+from app.models import Bucket
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds in one process at a time are still serialized by the job subject
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Buckets loaded per query during a full rebuild, and changes read per query during an incremental one
+BATCH_SIZE = 500
+# Slugs that are safe to use as a directory name
+SAFE_SLUG = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+</head>
+<body>
+{content}
+</body>
+</html>
+"""
+
+
+class StaticSite:
+    """A directory of published buckets and the change token it is current up to"""
+
+    def __init__(self, path: str = STATIC_PUBLISH_DIR):
+        self.path = Path(path)
+
+    def bucket_path(self, slug: str) -> Path:
+        return self.path / "buckets" / slug
+
+    def _write(self, path: Path, content: str) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Hold the site's lock, so builds in different processes don't interleave"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / ".lock", "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def read_token(self) -> Optional[int]:
+        try:
+            return int((self.path / ".token").read_text())
+        except (OSError, ValueError):
+            return None
+
+    def write_token(self, token: int) -> None:
+        self._write(self.path / ".token", str(token))
+
+    def read_index(self) -> dict[int, dict]:
+        try:
+            entries = json.loads((self.path / "index.json").read_text(encoding="utf-8"))["buckets"]
+        except (OSError, ValueError, KeyError):
+            return {}
+        return {entry["id"]: entry for entry in entries}
+
+    def write_index(self, index: dict[int, dict]) -> None:
+        entries = sorted(index.values(), key=lambda entry: (entry["release_date"] or "", entry["id"]), reverse=True)
+        self._write(self.path / "index.json", json.dumps({"buckets": entries}))
+
+    def write_bucket(self, bucket: Bucket, content_html: str) -> dict:
+        """Write a bucket's files and return its index entry"""
+        document = schemas.Bucket.model_validate(bucket).model_dump(mode="json")
+        document["html"] = content_html
+        path = self.bucket_path(bucket.slug)
+        self._write(path / "index.json", json.dumps(document))
+        self._write(path / "index.html", PAGE.format(title=html.escape(bucket.title or ""), content=content_html))
+        return {
+            "id": bucket.id,
+            "slug": bucket.slug,
+            "title": bucket.title,
+            "version": bucket.version,
+            "release_date": document["release_date"],
+            "updated_at": document["updated_at"],
+            "path": f"buckets/{bucket.slug}/",
+        }
+
+    def remove_bucket(self, slug: str) -> None:
+        shutil.rmtree(self.bucket_path(slug), ignore_errors=True)
+
+
+static_site = StaticSite()
+
+
+def _load_bucket(db: Session, bucket_id: int) -> Optional[Bucket]:
+    return db.query(Bucket).options(joinedload(Bucket.files)).filter(Bucket.id == bucket_id).first()
+
+
+def _publishable(bucket: Optional[Bucket]) -> bool:
+    if bucket is None or not bucket.is_published:
+        return False
+    if not SAFE_SLUG.fullmatch(bucket.slug or ""):
+        logger.warning("Not publishing bucket %s: slug %r is not a safe directory name", bucket.id, bucket.slug)
+        return False
+    return True
+
+
+def _publish_bucket(db: Session, site: StaticSite, bucket_id: int, index: dict[int, dict]) -> None:
+    """Bring one bucket's files and index entry in line with the database"""
+    bucket = _load_bucket(db, bucket_id)
+    previous = index.pop(bucket_id, None)
+    if _publishable(bucket):
+        content_html, _ = render.get_rendered_html(db, bucket)
+        index[bucket_id] = site.write_bucket(bucket, content_html)
+    if previous is not None and previous["slug"] not in {entry["slug"] for entry in index.values()}:
+        # Unpublished, deleted or renamed
+        site.remove_bucket(previous["slug"])
+
+
+def rebuild_all(db: Session, site: StaticSite = static_site) -> int:
+    """Write every published bucket and remove everything else; returns how many were written"""
+    with site.locked():
+        # Changes after this are picked up by the next incremental build
+        token = int(changes.get_changes(db, None).next)
+        index = {}
+        last_id = 0
+        while True:
+            bucket_ids = db.execute(
+                select(Bucket.id).where(Bucket.id > last_id, Bucket.is_published.is_(True))
+                .order_by(Bucket.id).limit(BATCH_SIZE)
+            ).scalars().all()
+            if not bucket_ids:
+                break
+            for bucket_id in bucket_ids:
+                _publish_bucket(db, site, bucket_id, index)
+            db.expunge_all()
+            last_id = bucket_ids[-1]
+
+        published = {entry["slug"] for entry in index.values()}
+        buckets_dir = site.path / "buckets"
+        if buckets_dir.is_dir():
+            for entry in buckets_dir.iterdir():
+                if entry.name not in published:
+                    shutil.rmtree(entry, ignore_errors=True)
+        site.write_index(index)
+        site.write_token(token)
+        return len(index)
+
+
+def publish_changes(db: Session, site: StaticSite = static_site) -> Optional[int]:
+    """Rewrite the buckets changed since the last build; returns how many, or None after a full rebuild"""
+    with site.locked():
+        token = site.read_token()
+        bucket_ids = set()
+        since = token
+        try:
+            while since is not None:
+                feed = changes.get_changes(db, since, limit=BATCH_SIZE, published_only=True)
+                bucket_ids.update(change.bucket_id for change in feed.changes)
+                since = int(feed.next)
+                if not feed.has_more:
+                    break
+        except changes.TokenExpiredError:
+            since = None
+        if since is not None:
+            if bucket_ids:
+                index = site.read_index()
+                for bucket_id in sorted(bucket_ids):
+                    _publish_bucket(db, site, bucket_id, index)
+                site.write_index(index)
+            if since != token:
+                site.write_token(since)
+            return len(bucket_ids)
+    rebuild_all(db, site)
+    return None
+
+
+@event.listens_for(Session, "before_commit")
+def _enqueue_publish(session):
+    # Every change may affect a published bucket; the job works out which
+    if STATIC_PUBLISHING and session.info.get("changes_recorded"):
+        jobs.enqueue(session, "publish_static", subject="static")
+
+
+@jobs.handler("publish_static")
+def publish_static(db: Session) -> None:
+    publish_changes(db)
+
+
+@jobs.maintenance
+def catch_up(db: Session) -> None:
+    """Publish changes made by processes that don't publish, and build the site the first time"""
+    if STATIC_PUBLISHING:
+        publish_changes(db)
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Write published buckets to the static site")
+    parser.add_argument("--all", action="store_true", help="rebuild everything instead of what changed")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        if args.all:
+            print(f"Published {rebuild_all(db)} buckets to {static_site.path}")
+        else:
+            count = publish_changes(db)
+            print(f"Rebuilt everything in {static_site.path}" if count is None else f"Updated {count} buckets")
@@ -0,0 +1,125 @@
+"""Markdown to sanitized HTML rendering with a cache keyed by content hash.
+
+Each bucket records the cache key of its current rendering in
+``Bucket.rendered_hash``. The key covers the renderer version, so bumping
+RENDERER_VERSION after changing the markdown extensions or sanitizer settings
+makes every entry stale. Re-render everything with:
+
+    python -m app.render --all
+"""
+import argparse
+import hashlib
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.models import Bucket, RenderedContent
+
+# Bump whenever the output of render_markdown changes
+RENDERER_VERSION = "1"
+
+MARKDOWN_EXTENSIONS = ["extra", "sane_lists"]
+
+
+def render_markdown(content: Optional[str]) -> str:
+    # Imported on first use; most processes only serve cached renderings
+    import markdown
+    import nh3
+
+    html = markdown.markdown(content or "", extensions=MARKDOWN_EXTENSIONS)
+    return nh3.clean(html)
+
+
+def render_key(content: Optional[str]) -> str:
+    return hashlib.sha256(f"{RENDERER_VERSION}\0{content or ''}".encode()).hexdigest()
+
+
+def release_rendering(db: Session, content_hash: Optional[str]) -> None:
+    """Drop a cache entry once no bucket renders to it any more"""
+    if content_hash is None:
+        return
+    if db.query(Bucket).filter(Bucket.rendered_hash == content_hash).count() == 0:
+        db.query(RenderedContent).filter(RenderedContent.content_hash == content_hash).delete()
+
+
+def render_bucket(db: Session, bucket: Bucket) -> RenderedContent:
+    """Ensure the bucket's current content is rendered and cached; caller commits"""
+    key = render_key(bucket.content)
+    entry = db.get(RenderedContent, key)
+    if entry is None:
+        entry = RenderedContent(
+            content_hash=key,
+            html=render_markdown(bucket.content),
+            renderer_version=RENDERER_VERSION,
+        )
+        try:
+            with db.begin_nested():
+                db.add(entry)
+        except IntegrityError:
+            # Rendered concurrently, e.g. by the publish and render jobs
+            entry = db.get(RenderedContent, key)
+    previous = bucket.rendered_hash
+    if previous != key:
+        # Point the bucket at the new entry without touching updated_at,
+        # which would change the bucket's ETag and Last-Modified
+        db.flush()
+        db.query(Bucket).filter(Bucket.id == bucket.id).update(
+            {Bucket.rendered_hash: key, Bucket.updated_at: Bucket.updated_at},
+            synchronize_session=False,
+        )
+        set_committed_value(bucket, "rendered_hash", key)
+        release_rendering(db, previous)
+    return entry
+
+
+def get_rendered_html(db: Session, bucket: Bucket) -> tuple[str, str]:
+    """Return (html, cache key) for a bucket, from the cache or rendered in memory on a miss.
+
+    Nothing is written: storing renderings is left to render_bucket, which
+    the render_bucket job runs for published buckets when they are saved.
+    """
+    key = render_key(bucket.content)
+    entry = db.get(RenderedContent, key)
+    if entry is not None:
+        return entry.html, key
+    return render_markdown(bucket.content), key
+
+
+def rerender_all(db: Session, batch_size: int = 500) -> int:
+    """Render every bucket with the current renderer and drop stale cache entries"""
+    count = 0
+    last_id = 0
+    while True:
+        buckets = (
+            db.query(Bucket).filter(Bucket.id > last_id).order_by(Bucket.id).limit(batch_size).all()
+        )
+        if not buckets:
+            break
+        for bucket in buckets:
+            render_bucket(db, bucket)
+        db.commit()
+        count += len(buckets)
+        last_id = buckets[-1].id
+
+    referenced = db.query(Bucket.rendered_hash).filter(Bucket.rendered_hash.isnot(None))
+    db.query(RenderedContent).filter(
+        RenderedContent.content_hash.notin_(referenced)
+    ).delete(synchronize_session=False)
+    db.commit()
+    return count
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Render bucket markdown to cached HTML")
+    parser.add_argument("--all", action="store_true", help="re-render every bucket")
+    args = parser.parse_args()
+
+    if args.all:
+        with SessionLocal() as db:
+            print(f"Rendered {rerender_all(db)} buckets")
+    else:
+        parser.print_help()
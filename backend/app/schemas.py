@@ -14,6 +14,7 @@ class File(FileBase):
     storage_path: str
     file_type: str
     file_size: float
+    checksum: Optional[str] = None
     bucket_id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
@@ -21,6 +22,56 @@ class File(FileBase):
     class Config:
         from_attributes = True
 
+class FileVersion(BaseModel):
+    version: int
+    kind: str  # "blob", "snapshot" or "delta"
+    checksum: Optional[str] = None
+    file_size: float
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    subject: Optional[str] = None
+    status: str  # "pending", "running", "succeeded" or "failed"
+    attempts: int
+    max_attempts: int
+    run_after: datetime
+    last_error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class Change(BaseModel):
+    id: int
+    entity: str  # "bucket" or "file"
+    entity_id: int
+    bucket_id: int
+    action: str  # "created", "updated", "deleted", "published" or "unpublished"
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class ChangeFeed(BaseModel):
+    changes: List[Change]
+    next: str  # Token to pass as since for the changes after these
+    has_more: bool
+
+    class Config:
+        from_attributes = True
+
+class FileUploadResult(BaseModel):
+    original_name: Optional[str] = None
+    status: str  # "created" or "failed"
+    file: Optional[File] = None
+    error: Optional[str] = None
+
 class BucketBase(BaseModel):
     title: str
     slug: str
@@ -50,4 +101,25 @@ class Bucket(BucketBase):
     files: List[File] = []
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True 
+
+class BucketSummary(BucketBase):
+    id: int
+    version: Optional[str]
+    release_date: Optional[datetime]
+    is_published: bool
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    file_count: int
+    total_bytes: float
+
+    class Config:
+        from_attributes = True
+
+class SearchHit(BaseModel):
+    kind: str  # "bucket" or "file"
+    id: int
+    bucket_id: int
+    title: Optional[str] = None
+    snippet: Optional[str] = None
+    score: float
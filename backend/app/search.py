@@ -0,0 +1,238 @@
+"""Full-text search over bucket and file text.
+
+SQLite uses an FTS5 table; PostgreSQL uses a table with a weighted tsvector
+column and a GIN index. Every bucket and every file is one document whose id is
+derived from the row id, so crud keeps the index current with single-row
+writes inside its own transactions.
+
+Rebuild the index from the tables with:
+
+    python -m app.search --rebuild
+"""
+import argparse
+import html
+import re
+from typing import Optional
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from app.pagination import decode_score_cursor, encode_score_cursor
+
+BUCKET = "bucket"
+FILE = "file"
+
+# Private-use markers survive escaping and are swapped for <mark> tags afterwards
+_MARK_START = "\ue000"
+_MARK_END = "\ue001"
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "title, version, body, bucket_id UNINDEXED, tokenize='porter unicode61')",
+]
+
+POSTGRES_DDL = [
+    """CREATE TABLE IF NOT EXISTS search_index (
+        id BIGINT PRIMARY KEY,
+        bucket_id INTEGER NOT NULL,
+        title TEXT,
+        version TEXT,
+        body TEXT,
+        document TSVECTOR GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(version, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(body, '')), 'C')
+        ) STORED
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_search_index_document ON search_index USING GIN (document)",
+]
+
+
+def document_id(kind: str, ref_id: int) -> int:
+    return ref_id * 2 + (1 if kind == FILE else 0)
+
+
+def split_document_id(doc_id: int) -> tuple[str, int]:
+    return (FILE if doc_id % 2 else BUCKET), doc_id // 2
+
+
+def _is_postgres(bind) -> bool:
+    return bind.dialect.name == "postgresql"
+
+
+def _id_column(db: Session) -> str:
+    return "id" if _is_postgres(db.get_bind()) else "rowid"
+
+
+def create_search_index(connection) -> None:
+    for statement in POSTGRES_DDL if _is_postgres(connection) else SQLITE_DDL:
+        connection.execute(text(statement))
+
+
+def drop_search_index(connection) -> None:
+    connection.execute(text("DROP TABLE IF EXISTS search_index"))
+
+
+def _upsert(db: Session, doc_id: int, bucket_id: int, title, version, body) -> None:
+    id_column = _id_column(db)
+    db.execute(text(f"DELETE FROM search_index WHERE {id_column} = :id"), {"id": doc_id})
+    db.execute(
+        text(
+            f"INSERT INTO search_index ({id_column}, bucket_id, title, version, body) "
+            "VALUES (:id, :bucket_id, :title, :version, :body)"
+        ),
+        {"id": doc_id, "bucket_id": bucket_id, "title": title, "version": version, "body": body},
+    )
+
+
+def index_bucket(db: Session, bucket) -> None:
+    _upsert(db, document_id(BUCKET, bucket.id), bucket.id, bucket.title, bucket.version, bucket.content)
+
+
+def index_file(db: Session, file) -> None:
+    _upsert(db, document_id(FILE, file.id), file.bucket_id, file.original_name, None, file.description)
+
+
+def remove_documents(db: Session, kind: str, ref_ids) -> None:
+    doc_ids = [document_id(kind, ref_id) for ref_id in ref_ids]
+    if not doc_ids:
+        return
+    statement = text(f"DELETE FROM search_index WHERE {_id_column(db)} IN :ids")
+    db.execute(statement.bindparams(bindparam("ids", expanding=True)), {"ids": doc_ids})
+
+
+def remove_bucket_documents(db: Session, bucket_id: int) -> None:
+    """Remove a bucket and all of its files from the index; run before deleting their rows"""
+    id_column = _id_column(db)
+    db.execute(
+        text(f"DELETE FROM search_index WHERE {id_column} = :bucket_doc OR {id_column} IN "
+             "(SELECT id * 2 + 1 FROM files WHERE bucket_id = :bucket_id)"),
+        {"bucket_doc": document_id(BUCKET, bucket_id), "bucket_id": bucket_id},
+    )
+
+
+def rebuild_search_index(db: Session) -> None:
+    """Re-index every bucket and file"""
+    id_column = _id_column(db)
+    db.execute(text("DELETE FROM search_index"))
+    db.execute(text(
+        f"INSERT INTO search_index ({id_column}, bucket_id, title, version, body) "
+        "SELECT id * 2, id, title, version, content FROM buckets"
+    ))
+    db.execute(text(
+        f"INSERT INTO search_index ({id_column}, bucket_id, title, version, body) "
+        "SELECT id * 2 + 1, bucket_id, original_name, NULL, description FROM files"
+    ))
+
+
+def _fts_query(query: str) -> Optional[str]:
+    # Quote every term so user input can't use FTS5 syntax; all terms must match
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"' for term in terms)
+
+
+def _highlighted(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    return html.escape(value).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def search(db: Session, query: str, limit: int = 20, cursor: Optional[str] = None,
+           include_drafts: bool = False) -> tuple[list[dict], Optional[str]]:
+    """Ranked matches for query as dicts, plus the cursor of the next page.
+
+    Titles and snippets are HTML-escaped with matches wrapped in <mark>.
+    Buckets that are not published, and their files, are left out unless
+    include_drafts is set.
+    """
+    postgres = _is_postgres(db.get_bind())
+    params = {"limit": limit, "start": _MARK_START, "end": _MARK_END}
+    if postgres:
+        params["query"] = query
+        ranked = (
+            "SELECT id, bucket_id, -ts_rank(document, q) AS score "
+            "FROM search_index, websearch_to_tsquery('english', :query) q WHERE document @@ q"
+        )
+    else:
+        params["query"] = _fts_query(query)
+        if params["query"] is None:
+            return [], None
+        ranked = (
+            "SELECT rowid AS id, bucket_id, bm25(search_index, 10.0, 5.0, 1.0) AS score "
+            "FROM search_index WHERE search_index MATCH :query"
+        )
+
+    # Lower scores rank higher; the cursor seeks past the last (score, id) seen
+    join = ""
+    where = ""
+    if not include_drafts:
+        params["published"] = True
+        join = "JOIN buckets ON buckets.id = ranked.bucket_id AND buckets.is_published = :published"
+    if cursor:
+        params["score"], params["after_id"] = decode_score_cursor(cursor)
+        where = "WHERE ranked.score > :score OR (ranked.score = :score AND ranked.id > :after_id)"
+    rows = db.execute(
+        text(f"SELECT ranked.id, ranked.bucket_id, ranked.score FROM ({ranked}) ranked {join} {where} "
+             "ORDER BY ranked.score, ranked.id LIMIT :limit"),
+        params,
+    ).fetchall()
+    if not rows:
+        return [], None
+
+    # Highlighting is the expensive part, so it only runs for the page being returned
+    if postgres:
+        highlights = (
+            "SELECT id, "
+            "ts_headline('english', coalesce(title, ''), q, "
+            "'HighlightAll=true, StartSel=' || :start || ', StopSel=' || :end) AS title, "
+            "ts_headline('english', coalesce(body, ''), q, "
+            "'MaxWords=35, MinWords=15, StartSel=' || :start || ', StopSel=' || :end) AS snippet "
+            "FROM search_index, websearch_to_tsquery('english', :query) q WHERE id IN :ids"
+        )
+    else:
+        highlights = (
+            "SELECT rowid AS id, highlight(search_index, 0, :start, :end) AS title, "
+            "snippet(search_index, 2, :start, :end, '…', 24) AS snippet "
+            "FROM search_index WHERE search_index MATCH :query AND rowid IN :ids"
+        )
+    statement = text(highlights).bindparams(bindparam("ids", expanding=True))
+    highlighted = {
+        row.id: row
+        for row in db.execute(statement, {**params, "ids": [row.id for row in rows]})
+    }
+
+    hits = []
+    for row in rows:
+        kind, ref_id = split_document_id(row.id)
+        match = highlighted.get(row.id)
+        hits.append({
+            "kind": kind,
+            "id": ref_id,
+            "bucket_id": row.bucket_id,
+            "title": _highlighted(match.title) if match else None,
+            "snippet": _highlighted(match.snippet) if match else None,
+            "score": row.score,
+        })
+
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = encode_score_cursor(rows[-1].score, rows[-1].id)
+    return hits, next_cursor
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Manage the full-text search index")
+    parser.add_argument("--rebuild", action="store_true", help="re-index all buckets and files")
+    args = parser.parse_args()
+
+    with engine.begin() as connection:
+        create_search_index(connection)
+    if args.rebuild:
+        with SessionLocal() as db:
+            rebuild_search_index(db)
+            db.commit()
+        print("Search index rebuilt")
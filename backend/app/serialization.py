@@ -0,0 +1,57 @@
+"""Fast JSON encoding for large list responses.
+
+List endpoints read plain column rows (see ``crud.get_bucket_rows``) and
+encode them here, skipping per-object ORM loading and Pydantic validation.
+Rows are built with the fields of the response models in ``schemas``, and
+datetimes are written the way Pydantic writes them, so the content matches
+the validated path. Encoding uses orjson, which requirements.txt installs;
+without it the standard library is used, several times slower, and a
+warning is logged at import.
+"""
+import json
+import logging
+from datetime import date, datetime
+from typing import Any, Iterable, Iterator
+
+from starlette.responses import Response
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    logger.warning("orjson is not installed; list responses are encoded with the slower json module")
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def _default(value: Any):
+    if isinstance(value, (datetime, date)):
+        text = value.isoformat()
+        # Pydantic writes UTC as Z
+        return text[:-6] + "Z" if text.endswith("+00:00") else text
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """Compact JSON, as FastAPI writes response bodies"""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_UTC_Z)
+    return json.dumps(value, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(Response):
+    """JSON response for content that is already plain dicts and lists"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def ndjson_chunks(batches: Iterable[list[dict]]) -> Iterator[bytes]:
+    """One line per row, one chunk per batch"""
+    for batch in batches:
+        if batch:
+            yield b"".join(dumps(row) + b"\n" for row in batch)
@@ -0,0 +1,364 @@
+"""Backends that hold blob content for FileStorageService.
+
+A backend stores complete blobs named by their SHA-256 and hands back the
+storage_path recorded on File rows: a key relative to the backend's root, such
+as ``ab/cd/<sha256>``, so the storage directory or bucket can move without
+rewriting rows. Absolute paths and ``s3://`` URIs written by older versions
+still resolve; ``python -m app.storage_migrate`` rewrites them. Backend methods
+block; FileStorageService runs them in worker threads when called from async
+code.
+
+Pick one with STORAGE_BACKEND:
+
+- ``sharded`` (default): ``blobs/<fan-out>/<sha256>`` on local disk, where
+  STORAGE_FANOUT gives the width of each directory level ("2,2" is ``ab/cd/``)
+- ``local``: ``blobs/<sha256>`` on local disk, one flat directory
+- ``s3``: objects in S3_BUCKET, or any S3-compatible service at
+  S3_ENDPOINT_URL such as MinIO (needs the ``boto3`` package)
+"""
+import os
+import shutil
+import tempfile
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+from app.config import S3_BUCKET, S3_ENDPOINT_URL, S3_PREFIX, S3_REGION, STORAGE_BACKEND, STORAGE_FANOUT
+
+
+class StorageBackend(ABC):
+    name = None
+
+    @abstractmethod
+    def location(self, blob_name: str) -> str:
+        """storage_path of a blob by name (its checksum plus any codec suffix), whether or not it exists"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def put(self, tmp_path: str, blob_name: str) -> str:
+        """Store a fully written local temp file as a blob and return its storage_path.
+
+        The temp file is consumed; if the blob already exists it is just removed.
+        """
+        raise NotImplementedError
+
+    def aliases(self, storage_path: str) -> set[str]:
+        """Every storage_path spelling, old or new, that names the same stored object"""
+        return {storage_path}
+
+    @abstractmethod
+    def relocate(self, storage_path: str, blob_name: str) -> Optional[str]:
+        """Make the blob at storage_path also available at its current location.
+
+        Returns the new storage_path, or None if the blob is missing. The old
+        copy is left in place for the caller to delete.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def exists(self, storage_path: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def size(self, storage_path: str) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def open(self, storage_path: str, start: int = 0, end: Optional[int] = None) -> BinaryIO:
+        """Readable stream of a blob from byte start up to and including byte end"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, storage_path: str, modified_before: Optional[float] = None) -> bool:
+        """Delete a blob; with modified_before, only if it was not written or reused since that time"""
+        raise NotImplementedError
+
+    def local_path(self, storage_path: str) -> Optional[str]:
+        """Filesystem path of a blob, if the backend keeps blobs on local disk"""
+        return None
+
+    @abstractmethod
+    def iter_blobs(self, prefix: str = "") -> Iterator[tuple[str, float]]:
+        """(storage_path, modification time) of every stored blob whose name starts with prefix, in no particular order"""
+        raise NotImplementedError
+
+
+class LocalBackend(StorageBackend):
+    """Blobs as files under one directory, fanned out over subdirectories.
+
+    fanout gives the number of hash characters per directory level, so (2, 2)
+    stores a blob at ``ab/cd/abcd...`` and () keeps every blob in the root.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str, fanout: tuple[int, ...] = ()):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.fanout = tuple(fanout)
+        # Directories known to exist, so saves skip the mkdir syscalls
+        self._dirs = {self.root}
+
+    def location(self, blob_name: str) -> str:
+        parts = []
+        offset = 0
+        for width in self.fanout:
+            parts.append(blob_name[offset:offset + width])
+            offset += width
+        parts.append(blob_name)
+        return "/".join(parts)
+
+    def _resolve(self, storage_path: str) -> Path:
+        # Rows written before storage paths were relative hold absolute paths
+        path = Path(storage_path)
+        return path if path.is_absolute() else self.root / path
+
+    def aliases(self, storage_path: str) -> set[str]:
+        path = self._resolve(storage_path)
+        names = {storage_path, str(path)}
+        if path.is_relative_to(self.root):
+            names.add(path.relative_to(self.root).as_posix())
+        return names
+
+    def _ensure_dir(self, directory: Path) -> None:
+        if directory not in self._dirs:
+            directory.mkdir(parents=True, exist_ok=True)
+            self._dirs.add(directory)
+
+    def _place(self, place, blob_path: Path) -> None:
+        self._ensure_dir(blob_path.parent)
+        try:
+            place()
+        except FileNotFoundError:
+            # The directory was removed behind our back; forget it and retry once
+            self._dirs.discard(blob_path.parent)
+            self._ensure_dir(blob_path.parent)
+            place()
+
+    def put(self, tmp_path: str, blob_name: str) -> str:
+        storage_path = self.location(blob_name)
+        blob_path = self._resolve(storage_path)
+        try:
+            # A reused blob counts as new, so releases and storage_reconcile leave it alone until its row is committed
+            os.utime(blob_path)
+            os.unlink(tmp_path)
+            return storage_path
+        except FileNotFoundError:
+            # Not stored, or just being deleted: store this copy
+            pass
+        os.chmod(tmp_path, 0o644)
+        # Atomic, so readers never see a partially written blob
+        self._place(lambda: os.replace(tmp_path, blob_path), blob_path)
+        return storage_path
+
+    def relocate(self, storage_path: str, blob_name: str) -> Optional[str]:
+        new_storage_path = self.location(blob_name)
+        source = self._resolve(storage_path)
+        target = self._resolve(new_storage_path)
+        if target.exists():
+            return new_storage_path
+        if not source.exists():
+            return None
+
+        def link():
+            try:
+                os.link(source, target)
+            except FileExistsError:
+                pass
+            except OSError:
+                # Different filesystem or no hard links: copy, then rename into place
+                fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=".relocate-")
+                os.close(fd)
+                shutil.copyfile(source, tmp_path)
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, target)
+
+        self._place(link, target)
+        return new_storage_path
+
+    def exists(self, storage_path: str) -> bool:
+        return self._resolve(storage_path).exists()
+
+    def size(self, storage_path: str) -> int:
+        return self._resolve(storage_path).stat().st_size
+
+    def open(self, storage_path: str, start: int = 0, end: Optional[int] = None) -> BinaryIO:
+        f = open(self._resolve(storage_path), "rb")
+        if start:
+            f.seek(start)
+        return f
+
+    def delete(self, storage_path: str, modified_before: Optional[float] = None) -> bool:
+        path = self._resolve(storage_path)
+        if modified_before is None:
+            try:
+                os.unlink(path)
+                return True
+            except FileNotFoundError:
+                return False
+        # Move it aside before looking at its mtime: an upload that reused it
+        # before shows there, and one reusing it from now on stores a new copy
+        aside = path.with_name(f".release-{uuid.uuid4().hex}")
+        try:
+            os.rename(path, aside)
+        except FileNotFoundError:
+            return False
+        if aside.stat().st_mtime >= modified_before:
+            try:
+                os.link(aside, path)
+            except FileExistsError:
+                # An upload has stored it again meanwhile
+                pass
+            os.unlink(aside)
+            return False
+        os.unlink(aside)
+        return True
+
+    def local_path(self, storage_path: str) -> Optional[str]:
+        return str(self._resolve(storage_path))
+
+    def iter_blobs(self, prefix: str = "") -> Iterator[tuple[str, float]]:
+        # Only the fan-out directories the prefix leads to need walking
+        top = self.root
+        offset = 0
+        for width in self.fanout:
+            if len(prefix) < offset + width:
+                break
+            top = top / prefix[offset:offset + width]
+            offset += width
+        for directory, _, names in os.walk(top):
+            for name in names:
+                # Dot-prefixed names are temp files of relocations in progress
+                if name.startswith(".") or not name.startswith(prefix):
+                    continue
+                path = Path(directory, name)
+                try:
+                    modified = path.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                yield path.relative_to(self.root).as_posix(), modified
+
+
+class ShardedBackend(LocalBackend):
+    """Local blobs fanned out per STORAGE_FANOUT so no directory grows too large"""
+
+    name = "sharded"
+
+    def __init__(self, root: str, fanout: tuple[int, ...] = STORAGE_FANOUT):
+        super().__init__(root, fanout)
+
+
+class S3Backend(StorageBackend):
+    """Blobs as objects named by their hash under a prefix of an S3 bucket"""
+
+    name = "s3"
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None):
+        import boto3
+        from botocore.exceptions import ClientError
+
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None, region_name=region or None)
+        self.client_error = ClientError
+        self.bucket = bucket
+        self.prefix = f"{prefix.strip('/')}/" if prefix.strip("/") else ""
+
+    def _split(self, storage_path: str) -> tuple[str, str]:
+        # Older rows hold full s3://<bucket>/<key> URIs
+        if storage_path.startswith("s3://"):
+            bucket, _, key = storage_path.removeprefix("s3://").partition("/")
+            return bucket, key
+        return self.bucket, self.prefix + storage_path
+
+    def location(self, blob_name: str) -> str:
+        return blob_name
+
+    def aliases(self, storage_path: str) -> set[str]:
+        bucket, key = self._split(storage_path)
+        names = {storage_path, f"s3://{bucket}/{key}"}
+        if bucket == self.bucket and key.startswith(self.prefix):
+            names.add(key[len(self.prefix):])
+        return names
+
+    def put(self, tmp_path: str, blob_name: str) -> str:
+        storage_path = self.location(blob_name)
+        bucket, key = self._split(storage_path)
+        try:
+            if not self.exists(storage_path):
+                self.client.upload_file(tmp_path, bucket, key)
+            else:
+                # Refresh LastModified of a reused blob, as LocalBackend does its mtime (a server-side copy)
+                self.client.copy({"Bucket": bucket, "Key": key}, bucket, key,
+                                 ExtraArgs={"MetadataDirective": "REPLACE"})
+        finally:
+            os.unlink(tmp_path)
+        return storage_path
+
+    def relocate(self, storage_path: str, blob_name: str) -> Optional[str]:
+        new_storage_path = self.location(blob_name)
+        if self.exists(new_storage_path):
+            return new_storage_path
+        if not self.exists(storage_path):
+            return None
+        source_bucket, source_key = self._split(storage_path)
+        bucket, key = self._split(new_storage_path)
+        self.client.copy({"Bucket": source_bucket, "Key": source_key}, bucket, key)
+        return new_storage_path
+
+    def _head(self, storage_path: str) -> Optional[dict]:
+        bucket, key = self._split(storage_path)
+        try:
+            return self.client.head_object(Bucket=bucket, Key=key)
+        except self.client_error as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, storage_path: str) -> bool:
+        return self._head(storage_path) is not None
+
+    def size(self, storage_path: str) -> int:
+        head = self._head(storage_path)
+        if head is None:
+            raise FileNotFoundError(storage_path)
+        return head["ContentLength"]
+
+    def open(self, storage_path: str, start: int = 0, end: Optional[int] = None) -> BinaryIO:
+        bucket, key = self._split(storage_path)
+        params = {"Bucket": bucket, "Key": key}
+        if start or end is not None:
+            params["Range"] = f"bytes={start}-{'' if end is None else end}"
+        try:
+            return self.client.get_object(**params)["Body"]
+        except self.client_error as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                raise FileNotFoundError(storage_path) from e
+            raise
+
+    def iter_blobs(self, prefix: str = "") -> Iterator[tuple[str, float]]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            for item in page.get("Contents", ()):
+                yield item["Key"][len(self.prefix):], item["LastModified"].timestamp()
+
+    def delete(self, storage_path: str, modified_before: Optional[float] = None) -> bool:
+        head = self._head(storage_path)
+        if head is None:
+            return False
+        if modified_before is not None and head["LastModified"].timestamp() >= modified_before:
+            return False
+        bucket, key = self._split(storage_path)
+        self.client.delete_object(Bucket=bucket, Key=key)
+        return True
+
+
+def make_backend(storage_dir: str, name: str = STORAGE_BACKEND) -> StorageBackend:
+    blobs_dir = os.path.join(storage_dir, "blobs")
+    if name == "s3":
+        return S3Backend(S3_BUCKET, prefix=S3_PREFIX, endpoint_url=S3_ENDPOINT_URL, region=S3_REGION)
+    if name == "local":
+        return LocalBackend(blobs_dir)
+    if name == "sharded":
+        return ShardedBackend(blobs_dir)
+    raise ValueError(f"Unknown storage backend: {name}")
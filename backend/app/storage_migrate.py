@@ -0,0 +1,134 @@
+"""Move blobs to the current storage layout while the app keeps running.
+
+Rows of files and file versions whose storage_path is not the blob's current
+location (absolute paths from older releases, or a layout written before
+STORAGE_FANOUT changed) are processed in batches:
+
+1. each blob is hard-linked (or copied) to its new location,
+2. every row pointing at the old path is switched to the new relative key in
+   one short transaction,
+3. after a grace period for requests that read the old path just before the
+   switch, the old copies are deleted.
+
+Both paths resolve the whole time, so uploads and downloads carry on during
+the migration, and the tool can be stopped and re-run at any point:
+
+    python -m app.storage_migrate --batch-size 500 --pause 0.1
+"""
+import argparse
+import time
+
+from sqlalchemy import case, select, update
+from sqlalchemy.orm import Session
+
+from app.cache import bucket_cache
+from app.crud import count_blob_references
+from app.models import File, FileVersion
+from app.storage_service import file_storage
+
+BATCH_SIZE = 500
+
+
+def _relocate_batch(db: Session, rows, dry_run: bool, stats: dict) -> list[str]:
+    moves = {}
+    for storage_path in {row.storage_path for row in rows}:
+        if file_storage.is_current(storage_path):
+            continue
+        if dry_run:
+            moves[storage_path] = file_storage.current_location(storage_path)
+            continue
+        new_storage_path = file_storage.relocate(storage_path)
+        if new_storage_path is None:
+            stats["missing"] += 1
+            continue
+        moves[storage_path] = new_storage_path
+    if not moves or dry_run:
+        stats["paths_rewritten"] += len(moves)
+        return []
+
+    # Rows after this batch that share a blob are switched too, since the old copy goes away
+    bucket_ids = db.execute(
+        select(File.bucket_id).where(File.storage_path.in_(moves)).distinct()
+    ).scalars().all()
+    result = db.execute(
+        update(File)
+        .where(File.storage_path.in_(moves))
+        .values(
+            storage_path=case(moves, value=File.storage_path),
+            # A new key is not a content change
+            updated_at=File.updated_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    version_result = db.execute(
+        update(FileVersion)
+        .where(FileVersion.storage_path.in_(moves))
+        .values(storage_path=case(moves, value=FileVersion.storage_path))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    # Cached bucket responses include storage paths
+    for bucket_id in bucket_ids:
+        bucket_cache.invalidate(bucket_id)
+    stats["paths_rewritten"] += len(moves)
+    stats["rows_updated"] += result.rowcount + version_result.rowcount
+    # An absolute path to the blob's current location is the same file, not an old copy
+    return [old for old, new in moves.items() if new not in file_storage.aliases(old)]
+
+
+def migrate_storage(db: Session, batch_size: int = BATCH_SIZE, pause: float = 0.0,
+                    grace: float = 5.0, dry_run: bool = False) -> dict:
+    """Relocate every blob not at its current location; returns counts of what was done"""
+    stats = {"files_scanned": 0, "versions_scanned": 0, "paths_rewritten": 0, "rows_updated": 0, "missing": 0}
+    pending_deletes = []
+    # Versions are scanned too: old versions may keep blobs no file points at any more
+    for model, counter in ((File, "files_scanned"), (FileVersion, "versions_scanned")):
+        last_id = 0
+        while True:
+            rows = db.execute(
+                select(model.id, model.storage_path)
+                .where(model.id > last_id, model.storage_path.isnot(None))
+                .order_by(model.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            stats[counter] += len(rows)
+            pending_deletes.append((time.monotonic(), _relocate_batch(db, rows, dry_run, stats)))
+
+            # Old copies are removed once requests that resolved them have had time to finish
+            while pending_deletes and time.monotonic() - pending_deletes[0][0] >= grace:
+                _delete_old_copies(db, pending_deletes.pop(0)[1])
+            if pause:
+                time.sleep(pause)
+
+    if pending_deletes:
+        time.sleep(max(0.0, grace - (time.monotonic() - pending_deletes[-1][0])))
+        for _, old_paths in pending_deletes:
+            _delete_old_copies(db, old_paths)
+    return stats
+
+
+def _delete_old_copies(db: Session, old_paths: list[str]) -> None:
+    for storage_path in old_paths:
+        # Never delete a blob something still points at, under any of its names
+        if count_blob_references(db, storage_path) == 0:
+            file_storage.delete_file(storage_path)
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Move blobs to the current storage layout without downtime")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="files per transaction")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    parser.add_argument("--grace", type=float, default=5.0,
+                        help="seconds to keep old copies after their rows are switched")
+    parser.add_argument("--dry-run", action="store_true", help="only count what would move")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        stats = migrate_storage(db, batch_size=args.batch_size, pause=args.pause,
+                                grace=args.grace, dry_run=args.dry_run)
+    print(stats)
@@ -0,0 +1,120 @@
+"""Find and delete blobs that no file or file version references.
+
+Blobs are normally released as soon as their last row goes away, but a crash
+between the commit and the delete, a failed job or a restore from an older
+database backup can leave orphans behind. This walks the whole blob store,
+plus directories left by the per-bucket layout of older releases and temp
+files of interrupted uploads, and deletes whatever nothing references:
+
+    python -m app.storage_reconcile --dry-run
+    python -m app.storage_reconcile --min-age 3600
+
+Blobs modified within --min-age seconds are skipped, since an upload writes
+its blob before the row pointing at it is committed. Blobs are checked
+against both ``files`` and ``file_versions``, so old versions keep theirs.
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+from typing import Iterator
+
+from sqlalchemy.orm import Session
+
+from app.crud import referenced_blobs
+from app.storage_service import file_storage
+
+BATCH_SIZE = 500
+MIN_AGE = 3600
+
+
+def _legacy_files() -> Iterator[tuple[str, float]]:
+    """Absolute paths of files in per-bucket directories (``<storage>/<bucket_id>/``)"""
+    for entry in file_storage.base_storage_path.iterdir():
+        if not (entry.is_dir() and entry.name.isdigit()):
+            continue
+        for directory, _, names in os.walk(entry):
+            for name in names:
+                path = Path(directory, name)
+                yield str(path), path.stat().st_mtime
+
+
+def _reconcile_batch(db: Session, batch: list[str], delete, dry_run: bool, stats: dict) -> None:
+    orphans = set(batch) - referenced_blobs(db, batch)
+    stats["orphans"] += len(orphans)
+    for storage_path in orphans:
+        try:
+            size = os.path.getsize(storage_path) if os.path.isabs(storage_path) else file_storage.blob_size(storage_path)
+        except OSError:
+            size = 0
+        if dry_run:
+            stats["bytes_freed"] += size
+        elif delete(storage_path):
+            stats["deleted"] += 1
+            stats["bytes_freed"] += size
+
+
+def _delete_legacy(path: str) -> bool:
+    try:
+        os.unlink(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def reconcile_storage(db: Session, min_age: float = MIN_AGE, batch_size: int = BATCH_SIZE,
+                      dry_run: bool = False) -> dict:
+    """Delete unreferenced blobs older than min_age seconds; returns counts of what was found and done"""
+    stats = {"blobs_scanned": 0, "too_recent": 0, "orphans": 0, "deleted": 0, "bytes_freed": 0, "temp_files_removed": 0}
+    cutoff = time.time() - min_age
+    sources = (
+        # Uploads reusing a blob refresh its mtime, which is checked again as it is deleted
+        (file_storage.iter_blobs(), lambda storage_path: file_storage.delete_file(storage_path, modified_before=cutoff)),
+        (_legacy_files(), _delete_legacy),
+    )
+    for blobs, delete in sources:
+        batch = []
+        for storage_path, modified in blobs:
+            stats["blobs_scanned"] += 1
+            if modified > cutoff:
+                stats["too_recent"] += 1
+                continue
+            batch.append(storage_path)
+            if len(batch) >= batch_size:
+                _reconcile_batch(db, batch, delete, dry_run, stats)
+                batch = []
+        if batch:
+            _reconcile_batch(db, batch, delete, dry_run, stats)
+
+    # Temp files of uploads and compressions that never finished
+    for entry in file_storage.tmp_path.iterdir():
+        if entry.is_file() and entry.stat().st_mtime <= cutoff:
+            if not dry_run:
+                entry.unlink(missing_ok=True)
+            stats["temp_files_removed"] += 1
+
+    # Per-bucket directories emptied above
+    if not dry_run:
+        for entry in file_storage.base_storage_path.iterdir():
+            if entry.is_dir() and entry.name.isdigit():
+                for directory, _, _ in sorted(os.walk(entry), reverse=True):
+                    try:
+                        os.rmdir(directory)
+                    except OSError:
+                        pass
+    return stats
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Delete blobs no file or file version references")
+    parser.add_argument("--min-age", type=float, default=MIN_AGE,
+                        help="seconds since a blob was written before it may be deleted")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="blobs checked per query")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        stats = reconcile_storage(db, min_age=args.min_age, batch_size=args.batch_size, dry_run=args.dry_run)
+    print(stats)
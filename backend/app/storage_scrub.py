@@ -0,0 +1,179 @@
+"""Read stored blobs back and check them against their SHA-256.
+
+Blobs are named by the SHA-256 of their content (see ``storage_service``), so
+every blob can be checked without the database: read it, decompressing if
+need be, and compare the hash with its name. Files and file versions whose
+blob is gone are found as well. Nothing is changed or deleted; problems are
+logged with the files that refer to the blob and counted in
+``storage_scrub_problems_total``, for someone to restore from a backup.
+
+The store is scrubbed in 256 slices, by the first two hex digits of the blob
+name, each read by SCRUB_WORKERS threads at SCRUB_RATE bytes per second in
+total. With SCRUB_INTERVAL_HOURS set, a background job scrubs one slice and
+enqueues the next one 1/256 of the interval later, so the whole store is
+covered once per interval at a steady rate; the job workers' maintenance
+starts the chain when there is none. To scrub everything now, or one slice:
+
+    python -m app.storage_scrub --rate 52428800 --workers 8
+    python -m app.storage_scrub --prefix ab
+"""
+import argparse
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from sqlalchemy import select, union
+from sqlalchemy.orm import Session
+
+from app import jobs, metrics
+from app.config import SCRUB_INTERVAL_HOURS, SCRUB_RATE, SCRUB_WORKERS
+from app.models import File, FileVersion, Job
+from app.storage_service import file_storage
+
+logger = logging.getLogger(__name__)
+
+JOB_KIND = "scrub_storage"
+SHA256 = re.compile(r"[0-9a-f]{64}")
+# Blob name prefixes, one per slice
+SLICES = [f"{n:02x}" for n in range(256)]
+# Blobs handed to the worker threads at a time
+BATCH_SIZE = 64
+
+problems = metrics.registry.counter(
+    "storage_scrub_problems_total", "Blobs found corrupt, unreadable or missing by the scrubber", ("reason",))
+
+
+class Throttle:
+    """Spaces reads from any number of threads to rate bytes per second in total; 0 for no limit"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def __call__(self, size: int) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + size / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+def _verify(storage_path: str, pace: Throttle) -> Optional[str]:
+    """What is wrong with a blob: "corrupt", "unreadable" or None"""
+    try:
+        checksum = file_storage.compute_hash(storage_path, pace)
+    except FileNotFoundError:
+        # Released since it was listed
+        return None
+    except Exception:
+        logger.warning("Could not read blob %s", storage_path, exc_info=True)
+        return "unreadable"
+    return None if checksum == file_storage.content_hash(storage_path) else "corrupt"
+
+
+def _report(db: Session, storage_path: str, reason: str, stats: dict) -> None:
+    names = file_storage.aliases(storage_path)
+    file_ids = db.execute(select(File.id).where(File.storage_path.in_(names))).scalars().all()
+    versions = db.execute(
+        select(FileVersion.file_id, FileVersion.version).where(FileVersion.storage_path.in_(names))
+    ).all()
+    logger.error("Blob %s is %s; files %s and versions %s refer to it",
+                 storage_path, reason, file_ids, [tuple(version) for version in versions])
+    problems.inc(reason)
+    stats[reason] += 1
+
+
+def _check_batch(db: Session, executor: ThreadPoolExecutor, batch: list[str], pace: Throttle, stats: dict) -> None:
+    for storage_path, reason in zip(batch, executor.map(lambda path: _verify(path, pace), batch)):
+        stats["blobs_checked"] += 1
+        if reason is not None:
+            _report(db, storage_path, reason, stats)
+
+
+def scrub(db: Session, prefix: str = "", rate: float = SCRUB_RATE, workers: int = SCRUB_WORKERS) -> dict:
+    """Check blobs whose name starts with prefix, and that files and versions there have theirs; returns counts"""
+    stats = {"blobs_checked": 0, "skipped": 0, "corrupt": 0, "unreadable": 0, "missing": 0}
+    pace = Throttle(rate)
+    seen = set()
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="scrub") as executor:
+        batch = []
+        for storage_path, _ in file_storage.iter_blobs(prefix):
+            seen.add(storage_path)
+            if not SHA256.fullmatch(file_storage.content_hash(storage_path)):
+                # Not a blob, so there is nothing to check it against
+                stats["skipped"] += 1
+                continue
+            batch.append(storage_path)
+            if len(batch) >= BATCH_SIZE:
+                _check_batch(db, executor, batch, pace, stats)
+                batch = []
+        if batch:
+            _check_batch(db, executor, batch, pace, stats)
+
+    referenced = db.execute(union(
+        select(File.storage_path).where(File.checksum.startswith(prefix)),
+        select(FileVersion.storage_path)
+        .where(FileVersion.storage_path.isnot(None), FileVersion.checksum.startswith(prefix)),
+    )).scalars().all()
+    for storage_path in referenced:
+        if storage_path not in seen and not file_storage.exists(storage_path):
+            _report(db, storage_path, "missing", stats)
+    return stats
+
+
+def _next_slice(prefix: str) -> str:
+    return SLICES[(SLICES.index(prefix) + 1) % len(SLICES)] if prefix in SLICES else SLICES[0]
+
+
+@jobs.handler(JOB_KIND)
+def scrub_slice(db: Session, prefix: str) -> None:
+    stats = scrub(db, prefix)
+    logger.info("Scrubbed blobs starting with %s: %s", prefix, stats)
+    if SCRUB_INTERVAL_HOURS > 0:
+        jobs.enqueue(db, JOB_KIND, subject="storage", delay=SCRUB_INTERVAL_HOURS * 3600 / len(SLICES),
+                     prefix=_next_slice(prefix))
+        db.commit()
+
+
+@jobs.maintenance
+def keep_scrubbing(db: Session) -> None:
+    """Start the chain of scrub jobs, after the last slice scrubbed, when scrubbing is on and none is queued"""
+    if SCRUB_INTERVAL_HOURS <= 0:
+        return
+    queued = db.execute(
+        select(Job.id).where(Job.kind == JOB_KIND, Job.status.in_((jobs.PENDING, jobs.RUNNING))).limit(1)
+    ).first()
+    if queued is not None:
+        return
+    last = db.execute(select(Job.payload).where(Job.kind == JOB_KIND).order_by(Job.id.desc()).limit(1)).scalar()
+    prefix = _next_slice(json.loads(last).get("prefix")) if last else SLICES[0]
+    jobs.enqueue(db, JOB_KIND, subject="storage", prefix=prefix)
+    db.commit()
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Check stored blobs against their SHA-256")
+    parser.add_argument("--prefix", help="only blobs whose name starts with this (default: all, slice by slice)")
+    parser.add_argument("--rate", type=float, default=SCRUB_RATE, help="bytes read per second in total, 0 for no limit")
+    parser.add_argument("--workers", type=int, default=SCRUB_WORKERS, help="blobs read at once")
+    args = parser.parse_args()
+
+    totals = {}
+    with SessionLocal() as db:
+        for prefix in [args.prefix] if args.prefix is not None else SLICES:
+            for key, value in scrub(db, prefix, rate=args.rate, workers=args.workers).items():
+                totals[key] = totals.get(key, 0) + value
+    print(totals)
+    # Non-zero for cron and monitoring when anything needs restoring
+    sys.exit(1 if totals["corrupt"] or totals["unreadable"] or totals["missing"] else 0)
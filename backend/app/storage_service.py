@@ -1,69 +1,385 @@
 import os
-import uuid
+import asyncio
+import hashlib
+import io
 import shutil
+import tempfile
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, BinaryIO, Callable, Iterator, Optional, NamedTuple, Union
 import mimetypes
 
+from app import compression
+from app.config import (
+    MAX_UPLOAD_SIZE, STORAGE_COMPRESSION, STORAGE_COMPRESSION_MIN_SIZE, STORAGE_DIR, UPLOAD_CHUNK_SIZE,
+    UPLOAD_CONCURRENCY,
+)
+from app.metrics import timed
+from app.storage_backends import StorageBackend, make_backend
+
+class FileTooLargeError(Exception):
+    """Raised when an upload exceeds the configured maximum size"""
+
+class StoredFile(NamedTuple):
+    storage_path: str
+    file_type: str
+    file_size: float
+    checksum: str
+
 class FileStorageService:
-    def __init__(self, base_storage_path: str):
+    """Content-addressed blob store.
+
+    Blobs are named by the SHA-256 of their content, so identical uploads share
+    one blob. Content is spooled to a local temp file while it is hashed, then
+    handed to the backend (see ``storage_backends``). Blobs are never modified in
+    place; callers own reference counting (see ``crud``) and delete blobs nobody
+    points to.
+
+    With a compression codec set, text-like content can be stored compressed
+    under ``<sha256><suffix>`` (see ``compression``). Uploads are stored as
+    sent; ``compress_blob`` makes the compressed copy later, in a background
+    job (see ``processing``). ``open_blob`` and
+    ``read_blob`` return stored bytes; ``open_content``, ``get_file`` and
+    ``read_blob(decode=True)`` return the original content.
+
+    Async methods run all disk and network I/O in worker threads; the plain
+    methods block and are meant for sync routes, scripts and migrations.
+    Directories and the backend are created by ``setup``, which the app runs
+    at startup and everything else triggers on first use.
+    """
+
+    def __init__(self, base_storage_path: str, backend: Optional[StorageBackend] = None,
+                 max_size: int = MAX_UPLOAD_SIZE, chunk_size: int = UPLOAD_CHUNK_SIZE,
+                 concurrency: int = UPLOAD_CONCURRENCY, compression_codec: str = STORAGE_COMPRESSION,
+                 compression_min_size: int = STORAGE_COMPRESSION_MIN_SIZE):
         self.base_storage_path = Path(base_storage_path)
-        self.base_storage_path.mkdir(parents=True, exist_ok=True)
+        self._tmp_path = self.base_storage_path / "tmp"
+        self._backend = backend
+        self._ready = False
+        self._setup_lock = threading.Lock()
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.codec = compression.get_codec(compression_codec) if compression_codec else None
+        self.compression_min_size = compression_min_size
 
-    def _get_storage_path(self, bucket_id: int) -> Path:
-        """Get the storage path for a specific bucket"""
-        bucket_path = self.base_storage_path / str(bucket_id)
-        bucket_path.mkdir(exist_ok=True)
-        return bucket_path
+    def setup(self) -> None:
+        """Create the storage directories and the backend; runs on first use if not called before"""
+        if self._ready:
+            return
+        with self._setup_lock:
+            if self._ready:
+                return
+            self.base_storage_path.mkdir(parents=True, exist_ok=True)
+            self._tmp_path.mkdir(exist_ok=True)
+            if self._backend is None:
+                self._backend = make_backend(str(self.base_storage_path))
+            self._ready = True
+
+    @property
+    def backend(self) -> StorageBackend:
+        self.setup()
+        return self._backend
+
+    @property
+    def tmp_path(self) -> Path:
+        self.setup()
+        return self._tmp_path
+
+    def should_compress(self, file_type: Optional[str]) -> bool:
+        return self.codec is not None and compression.is_text_type(file_type)
+
+    def _commit_blob(self, tmp_path: str, checksum: str, compress: bool = False) -> str:
+        """Hand a fully written temp file to the backend, dropping it if the blob exists"""
+        if compress and self.codec is not None:
+            storage_path = self._commit_compressed(tmp_path, checksum)
+            if storage_path is not None:
+                return storage_path
+        return self.backend.put(tmp_path, checksum)
+
+    def _commit_compressed(self, tmp_path: str, checksum: str) -> Optional[str]:
+        """Store the temp file's content compressed if that saves space; None to store it plain"""
+        storage_path = self._put_compressed(tmp_path, checksum)
+        if storage_path is not None:
+            self._discard(tmp_path)
+        return storage_path
+
+    def _put_compressed(self, source_path: str, checksum: str) -> Optional[str]:
+        """Compressed blob of a local file's content; None if not worth it.
+
+        An existing compressed blob is reused through backend.put like any
+        other, so it is marked as just written and releases leave it alone.
+        """
+        size = os.path.getsize(source_path)
+        if size < self.compression_min_size:
+            return None
+        name = checksum + self.codec.suffix
+
+        fd, packed_path = tempfile.mkstemp(dir=self.tmp_path, prefix=".compress-")
+        try:
+            with open(source_path, "rb") as source, os.fdopen(fd, "wb") as packed:
+                self.codec.compress_stream(source, packed, self.chunk_size)
+                self._sync(packed)
+            if os.path.getsize(packed_path) > size * 0.9:
+                self._discard(packed_path)
+                return None
+            return self.backend.put(packed_path, name)
+        except BaseException:
+            self._discard(packed_path)
+            raise
+
+    def compress_blob(self, storage_path: str) -> Optional[str]:
+        """Store a plain blob's content compressed and return the compressed blob's storage_path.
+
+        Returns None if there is no codec, the blob is compressed already or
+        compressing doesn't save enough. The plain blob is left in place for
+        the caller to release once nothing references it.
+        """
+        if self.codec is None or self.content_encoding(storage_path):
+            return None
+        checksum = self.content_hash(storage_path)
+        with timed("compress_blob", "write") as measure:
+            local_path = self.local_path(storage_path)
+            if local_path is not None:
+                measure.bytes = os.path.getsize(local_path)
+                return self._put_compressed(local_path, checksum)
+            fd, tmp_path = tempfile.mkstemp(dir=self.tmp_path, prefix=".compress-")
+            try:
+                with os.fdopen(fd, "wb") as f, self.backend.open(storage_path) as source:
+                    shutil.copyfileobj(source, f, self.chunk_size)
+                measure.bytes = os.path.getsize(tmp_path)
+                return self._put_compressed(tmp_path, checksum)
+            finally:
+                self._discard(tmp_path)
 
     def save_file(self, file_data: bytes, original_name: str, bucket_id: int) -> tuple[str, str, float]:
         """Save a file and return (storage_path, file_type, file_size)"""
-        # Generate unique filename
-        file_extension = os.path.splitext(original_name)[1]
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        
-        # Get storage path
-        storage_path = self._get_storage_path(bucket_id)
-        file_path = storage_path / unique_filename
-        
-        # Save file
-        with open(file_path, "wb") as f:
-            f.write(file_data)
-        
-        # Get file metadata
         file_type = mimetypes.guess_type(original_name)[0] or "application/octet-stream"
-        file_size = os.path.getsize(file_path)
-        
-        return str(file_path), file_type, file_size
+        # The same path as uploads, so reusing identical content refreshes the blob as written
+        storage_path, file_size, _ = self.store_fileobj(io.BytesIO(file_data))
+        return storage_path, file_type, file_size
+
+    async def save_upload(self, upload, original_name: str, bucket_id: int) -> StoredFile:
+        """Stream an upload to storage chunk by chunk and return its metadata"""
+        file_type = mimetypes.guess_type(original_name)[0] or "application/octet-stream"
+        storage_path, file_size, checksum = await self.store_upload(upload)
+        return StoredFile(storage_path, file_type, file_size, checksum)
+
+    async def save_uploads(self, uploads: list, bucket_id: int) -> list[Union[StoredFile, Exception]]:
+        """Store many uploads concurrently, at most ``concurrency`` at a time.
+
+        Returns one entry per upload, in order: its StoredFile, or the exception
+        that stopped it, so one bad file doesn't fail the others.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def save(upload):
+            async with semaphore:
+                return await self.save_upload(upload, upload.filename, bucket_id)
+
+        return await asyncio.gather(*(save(upload) for upload in uploads), return_exceptions=True)
+
+    async def store_upload(self, upload, compress: bool = False) -> tuple[str, int, str]:
+        """Stream an upload into the blob store, return (storage_path, file_size, checksum).
 
-    def delete_file(self, storage_path: str) -> bool:
-        """Delete a file from storage"""
+        Disk writes and hashing run in worker threads so the event loop stays free,
+        and readers never see a partially written blob.
+        """
+        fd, tmp_path = await asyncio.to_thread(
+            tempfile.mkstemp, dir=self.tmp_path, prefix=".upload-"
+        )
+        digest = hashlib.sha256()
+        file_size = 0
+        with timed("store_upload", "write") as measure:
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    while chunk := await upload.read(self.chunk_size):
+                        file_size += len(chunk)
+                        if self.max_size and file_size > self.max_size:
+                            raise FileTooLargeError(f"File exceeds the maximum upload size of {self.max_size} bytes")
+                        await asyncio.to_thread(self._write_chunk, f, digest, chunk)
+                    await asyncio.to_thread(self._sync, f)
+                checksum = digest.hexdigest()
+                storage_path = await asyncio.to_thread(self._commit_blob, tmp_path, checksum, compress)
+            except BaseException:
+                self._discard(tmp_path)
+                raise
+            measure.bytes = file_size
+        return storage_path, file_size, checksum
+
+    def store_fileobj(self, fileobj, compress: bool = False) -> tuple[str, int, str]:
+        """Blocking counterpart of store_upload for file-like objects, e.g. archive members"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_path, prefix=".upload-")
+        digest = hashlib.sha256()
+        file_size = 0
+        with timed("store_fileobj", "write") as measure:
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    while chunk := fileobj.read(self.chunk_size):
+                        file_size += len(chunk)
+                        if self.max_size and file_size > self.max_size:
+                            raise FileTooLargeError(f"File exceeds the maximum upload size of {self.max_size} bytes")
+                        self._write_chunk(f, digest, chunk)
+                    self._sync(f)
+                checksum = digest.hexdigest()
+                storage_path = self._commit_blob(tmp_path, checksum, compress)
+            except BaseException:
+                self._discard(tmp_path)
+                raise
+            measure.bytes = file_size
+        return storage_path, file_size, checksum
+
+    def compute_hash(self, storage_path: str, pace: Optional[Callable[[int], None]] = None) -> str:
+        """SHA-256 of a blob's original content, read back from the backend.
+
+        pace, if given, is called with each chunk's size before it is read,
+        so callers can limit how fast the store is read.
+        """
+        digest = hashlib.sha256()
+        with timed("compute_hash", "read") as measure, self.open_content(storage_path) as f:
+            while True:
+                if pace is not None:
+                    pace(self.chunk_size)
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                measure.bytes += len(chunk)
+        return digest.hexdigest()
+
+    def blob_path(self, checksum: str) -> str:
+        """Storage path an uncompressed blob with this checksum has, whether or not it exists"""
+        return self.backend.location(checksum)
+
+    @staticmethod
+    def content_hash(storage_path: str) -> str:
+        """SHA-256 of a stored blob's content, which is its file name less any codec suffix"""
+        return compression.strip_suffix(Path(storage_path).name)
+
+    @staticmethod
+    def content_encoding(storage_path: str) -> Optional[str]:
+        """Codec a blob is stored compressed with, None for plain blobs"""
+        return compression.codec_name(storage_path)
+
+    def current_location(self, storage_path: str) -> str:
+        """Storage path the current layout gives this blob"""
+        return self.backend.location(Path(storage_path).name)
+
+    def is_current(self, storage_path: str) -> bool:
+        """Whether a blob is stored at the location the current layout gives it"""
+        return storage_path == self.current_location(storage_path)
+
+    def aliases(self, storage_path: str) -> set[str]:
+        """All storage_path values that refer to the same stored blob"""
+        return self.backend.aliases(storage_path)
+
+    def relocate(self, storage_path: str) -> Optional[str]:
+        """Copy a blob to its current location, return the new storage_path (None if missing)"""
+        return self.backend.relocate(storage_path, Path(storage_path).name)
+
+    def local_path(self, storage_path: str) -> Optional[str]:
+        """Filesystem path of a blob when the backend keeps it on local disk"""
+        return self.backend.local_path(storage_path)
+
+    def adopt_file(self, path: str) -> tuple[str, str]:
+        """Move an existing file into the blob store, return (storage_path, checksum)"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(self.chunk_size):
+                digest.update(chunk)
+        checksum = digest.hexdigest()
+        return self._commit_blob(path, checksum), checksum
+
+    @staticmethod
+    def _write_chunk(f, digest, chunk: bytes) -> None:
+        digest.update(chunk)
+        f.write(chunk)
+
+    @staticmethod
+    def _sync(f) -> None:
+        f.flush()
+        os.fsync(f.fileno())
+
+    @staticmethod
+    def _discard(tmp_path: str) -> None:
         try:
-            file_path = Path(storage_path)
-            if file_path.exists():
-                file_path.unlink()
-                return True
-            return False
-        except Exception:
-            return False
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def iter_blobs(self, prefix: str = "") -> Iterator[tuple[str, float]]:
+        """(storage_path, modification time) of every blob in the backend, or those whose name starts with prefix"""
+        return self.backend.iter_blobs(prefix)
+
+    def exists(self, storage_path: str) -> bool:
+        return self.backend.exists(storage_path)
+
+    def blob_size(self, storage_path: str) -> int:
+        return self.backend.size(storage_path)
+
+    def open_blob(self, storage_path: str) -> BinaryIO:
+        """Open a blob for reading its stored bytes"""
+        return self.backend.open(storage_path)
+
+    def open_content(self, storage_path: str) -> BinaryIO:
+        """Open a blob for reading its original content, decompressing if need be"""
+        f = self.backend.open(storage_path)
+        codec_name = self.content_encoding(storage_path)
+        if codec_name is None:
+            return f
+        try:
+            return compression.DecodedReader(compression.get_codec(codec_name).reader(f), f)
+        except BaseException:
+            f.close()
+            raise
+
+    def delete_file(self, storage_path: str, modified_before: Optional[float] = None) -> bool:
+        """Delete a file from storage; with modified_before, only if not written or reused since then"""
+        with timed("delete"):
+            try:
+                return self.backend.delete(storage_path, modified_before)
+            except Exception:
+                return False
 
     def get_file(self, storage_path: str) -> Optional[bytes]:
         """Get file content from storage"""
         try:
-            with open(storage_path, "rb") as f:
+            with self.open_content(storage_path) as f:
                 return f.read()
         except Exception:
             return None
 
-    def update_file(self, storage_path: str, new_content: bytes) -> bool:
-        """Update file content in storage"""
-        try:
-            with open(storage_path, "wb") as f:
-                f.write(new_content)
-            return True
-        except Exception:
-            return False
+    async def read_blob(self, storage_path: str, start: int = 0, end: Optional[int] = None,
+                        decode: bool = False) -> AsyncIterator[bytes]:
+        """Yield a blob's bytes from start up to and including end, chunk by chunk.
+
+        With decode, offsets are into the original content of a compressed blob,
+        which is decompressed from the beginning.
+        """
+        with timed("read_blob", "read") as measure:
+            skip = 0
+            if decode and self.content_encoding(storage_path):
+                f = await asyncio.to_thread(self.open_content, storage_path)
+                skip = start
+            else:
+                f = await asyncio.to_thread(self.backend.open, storage_path, start, end)
+            try:
+                while skip > 0:
+                    skipped = await asyncio.to_thread(f.read, min(self.chunk_size, skip))
+                    if not skipped:
+                        break
+                    skip -= len(skipped)
+                remaining = None if end is None else end - start + 1
+                while remaining is None or remaining > 0:
+                    size = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+                    chunk = await asyncio.to_thread(f.read, size)
+                    if not chunk:
+                        break
+                    if remaining is not None:
+                        remaining -= len(chunk)
+                    measure.bytes += len(chunk)
+                    yield chunk
+            finally:
+                await asyncio.to_thread(f.close)
 
-# Initialize the storage service
-STORAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "app", "storage")
-file_storage = FileStorageService(STORAGE_DIR) 
\ No newline at end of file
+file_storage = FileStorageService(STORAGE_DIR)
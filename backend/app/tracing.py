@@ -0,0 +1,73 @@
+"""Optional OpenTelemetry spans around crud functions and storage calls.
+
+Off unless TRACING_ENABLED=true and the ``opentelemetry-api`` package is
+installed; when off nothing is wrapped, so there is no overhead at all. Spans
+go to whatever tracer provider the process configures, e.g. by running under
+``opentelemetry-instrument`` with the usual OTEL_* exporter variables.
+"""
+import functools
+import inspect
+import logging
+
+from app.config import TRACING_ENABLED
+
+logger = logging.getLogger(__name__)
+
+_tracer = None
+
+
+def _wrap(function, span_name: str):
+    if inspect.isasyncgenfunction(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with _tracer.start_as_current_span(span_name):
+                async for item in function(*args, **kwargs):
+                    yield item
+    elif inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with _tracer.start_as_current_span(span_name):
+                return await function(*args, **kwargs)
+    else:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _tracer.start_as_current_span(span_name):
+                return function(*args, **kwargs)
+    return wrapper
+
+
+def instrument_module(module, prefix: str) -> None:
+    """Replace each public function defined in module with a traced version"""
+    for name, function in list(vars(module).items()):
+        if name.startswith("_") or not inspect.isfunction(function) or function.__module__ != module.__name__:
+            continue
+        setattr(module, name, _wrap(function, f"{prefix}.{name}"))
+
+
+def instrument_object(obj, prefix: str, methods) -> None:
+    """Trace the named methods of one object, e.g. the storage service instance"""
+    for name in methods:
+        setattr(obj, name, _wrap(getattr(obj, name), f"{prefix}.{name}"))
+
+
+def setup_tracing() -> bool:
+    """Wrap crud and storage calls in spans if tracing is enabled; returns whether it is"""
+    global _tracer
+    if not TRACING_ENABLED or _tracer is not None:
+        return _tracer is not None
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("TRACING_ENABLED is set but opentelemetry-api is not installed; tracing is off")
+        return False
+
+    from app import crud
+    from app.storage_service import file_storage
+
+    _tracer = trace.get_tracer("release-notes-cms")
+    instrument_module(crud, "crud")
+    instrument_object(file_storage, "storage", (
+        "save_file", "save_upload", "save_uploads", "store_upload", "store_fileobj",
+        "read_blob", "open_blob", "blob_size", "exists", "delete_file", "get_file", "relocate",
+    ))
+    return True
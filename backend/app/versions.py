@@ -0,0 +1,241 @@
+"""Version history of file content.
+
+Every content a file has had is a row in ``file_versions``, numbered from 1,
+kept in one of three ways:
+
+- ``blob``: the version points at a content-addressed blob, the way files
+  do. Used for the content a file is created with and for binary or large
+  content. Blobs named by a version count as referenced (see crud.release_blob).
+- ``snapshot``: the full text, zlib-compressed, in the row itself.
+- ``delta``: the line edits turning the previous version into this one, as
+  compressed JSON.
+
+Text updates are stored as deltas, with a snapshot once VERSION_SNAPSHOT_INTERVAL
+deltas have accumulated, so a revision of a long markdown file costs a few
+hundred bytes and reading any version replays a bounded number of deltas.
+The version matching a file's current content is read straight from its blob.
+"""
+import difflib
+import json
+import zlib
+from bisect import bisect_right
+from typing import Iterable, Optional
+
+from sqlalchemy.orm import Session, undefer
+
+from app.compression import is_text_type
+from app.config import VERSION_DELTA_MAX_SIZE, VERSION_SNAPSHOT_INTERVAL
+from app.models import File, FileVersion
+from app.storage_service import file_storage
+
+BLOB = "blob"
+SNAPSHOT = "snapshot"
+DELTA = "delta"
+
+
+class VersionError(ValueError):
+    """Raised for operations a version's content doesn't support, e.g. diffing binary content"""
+
+
+def _decode(content: Optional[bytes]) -> Optional[str]:
+    if content is None:
+        return None
+    try:
+        return content.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+def make_delta(old: str, new: str) -> bytes:
+    """Compressed line edits that turn old into new"""
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    # Edits are usually local; skip the unchanged head and tail before matching
+    limit = min(len(old_lines), len(new_lines))
+    head = 0
+    while head < limit and old_lines[head] == new_lines[head]:
+        head += 1
+    tail = 0
+    while tail < limit - head and old_lines[-1 - tail] == new_lines[-1 - tail]:
+        tail += 1
+    old_middle = old_lines[head:len(old_lines) - tail]
+    new_middle = new_lines[head:len(new_lines) - tail]
+
+    matcher = difflib.SequenceMatcher(None, old_middle, new_middle)
+    edits = [
+        [head + i1, head + i2, "".join(new_middle[j1:j2])]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"
+    ]
+    return zlib.compress(json.dumps(edits, separators=(",", ":")).encode())
+
+
+def apply_delta(old: str, delta: bytes) -> str:
+    old_lines = old.splitlines(keepends=True)
+    parts = []
+    position = 0
+    for start, end, replacement in json.loads(zlib.decompress(delta)):
+        parts.extend(old_lines[position:start])
+        parts.append(replacement)
+        position = end
+    parts.extend(old_lines[position:])
+    return "".join(parts)
+
+
+def initial_version(db_file: File) -> FileVersion:
+    """Version 1 of a file: the content it was created with, left in its blob"""
+    return FileVersion(
+        file_id=db_file.id,
+        version=1,
+        kind=BLOB,
+        storage_path=db_file.storage_path,
+        checksum=file_storage.content_hash(db_file.storage_path),
+        file_size=db_file.file_size,
+    )
+
+
+def record_version(db: Session, db_file: File, storage_path: str, file_size: float) -> FileVersion:
+    """Add the version for the content db_file is about to be switched to; caller commits.
+
+    Must run while db_file still points at its previous content, which the
+    new version is a delta against.
+    """
+    latest = (
+        db.query(FileVersion.version, FileVersion.kind)
+        .filter(FileVersion.file_id == db_file.id)
+        .order_by(FileVersion.version.desc())
+        .first()
+    )
+    if latest is None:
+        # History of files created before versioning starts at their current content
+        db.add(initial_version(db_file))
+        number = 2
+    else:
+        number = latest.version + 1
+
+    version = FileVersion(
+        file_id=db_file.id,
+        version=number,
+        kind=BLOB,
+        storage_path=storage_path,
+        checksum=file_storage.content_hash(storage_path),
+        file_size=file_size,
+    )
+    if is_text_type(db_file.file_type) and file_size <= VERSION_DELTA_MAX_SIZE:
+        text = _decode(file_storage.get_file(storage_path))
+        if text is not None:
+            base = (
+                db.query(FileVersion.version)
+                .filter(FileVersion.file_id == db_file.id, FileVersion.kind != DELTA)
+                .order_by(FileVersion.version.desc())
+                .first()
+            )
+            previous = None
+            if base is not None and number - base.version < VERSION_SNAPSHOT_INTERVAL:
+                previous = _decode(file_storage.get_file(db_file.storage_path))
+            version.storage_path = None
+            if previous is None:
+                version.kind = SNAPSHOT
+                version.data = zlib.compress(text.encode("utf-8"))
+            else:
+                version.kind = DELTA
+                version.data = make_delta(previous, text)
+    db.add(version)
+    return version
+
+
+def get_versions(db: Session, file_id: int) -> list[FileVersion]:
+    return (
+        db.query(FileVersion)
+        .filter(FileVersion.file_id == file_id)
+        .order_by(FileVersion.version)
+        .all()
+    )
+
+
+def get_version(db: Session, file_id: int, number: int) -> Optional[FileVersion]:
+    return db.query(FileVersion).filter(FileVersion.file_id == file_id, FileVersion.version == number).first()
+
+
+def _stored_content(version: FileVersion) -> Optional[bytes]:
+    if version.kind == BLOB:
+        return file_storage.get_file(version.storage_path)
+    return zlib.decompress(version.data)
+
+
+def read_versions(db: Session, db_file: File, numbers: Iterable[int]) -> dict[int, bytes]:
+    """Content of the requested versions that exist, keyed by version number.
+
+    Deltas are replayed from the nearest snapshot or blob at or before each
+    version, once for all requested versions that share it.
+    """
+    wanted = set(numbers)
+    rows = db.query(FileVersion).filter(FileVersion.file_id == db_file.id, FileVersion.version.in_(wanted)).all()
+    current_checksum = file_storage.content_hash(db_file.storage_path)
+    current = None
+    contents = {}
+    pending = []
+    for row in rows:
+        if row.checksum == current_checksum:
+            if current is None:
+                current = file_storage.get_file(db_file.storage_path)
+            contents[row.version] = current
+        elif row.kind == DELTA:
+            pending.append(row.version)
+        else:
+            contents[row.version] = _stored_content(row)
+    if not pending:
+        return {number: content for number, content in contents.items() if content is not None}
+
+    bases = [
+        number for (number,) in db.query(FileVersion.version)
+        .filter(FileVersion.file_id == db_file.id, FileVersion.kind != DELTA, FileVersion.version <= max(pending))
+        .order_by(FileVersion.version)
+    ]
+    needed = set()
+    for number in pending:
+        needed.update(range(bases[bisect_right(bases, number) - 1], number + 1))
+    chain = (
+        db.query(FileVersion)
+        .options(undefer(FileVersion.data))
+        .filter(FileVersion.file_id == db_file.id, FileVersion.version.in_(needed))
+        .order_by(FileVersion.version)
+    )
+    text = None
+    for row in chain:
+        if row.kind != DELTA:
+            text = _decode(_stored_content(row))
+        elif text is not None:
+            text = apply_delta(text, row.data)
+        if row.version in pending and text is not None:
+            contents[row.version] = text.encode("utf-8")
+    return {number: content for number, content in contents.items() if content is not None}
+
+
+def read_version(db: Session, db_file: File, number: int) -> Optional[bytes]:
+    return read_versions(db, db_file, [number]).get(number)
+
+
+def diff_versions(db: Session, db_file: File, from_version: int, to_version: int) -> Optional[str]:
+    """Unified diff between two versions, or None if either doesn't exist"""
+    checksums = dict(
+        db.query(FileVersion.version, FileVersion.checksum)
+        .filter(FileVersion.file_id == db_file.id, FileVersion.version.in_((from_version, to_version)))
+        .all()
+    )
+    if from_version not in checksums or to_version not in checksums:
+        return None
+    if not is_text_type(db_file.file_type):
+        raise VersionError("Only text versions can be diffed")
+    if checksums[from_version] == checksums[to_version]:
+        return ""
+    contents = read_versions(db, db_file, (from_version, to_version))
+    old = _decode(contents.get(from_version))
+    new = _decode(contents.get(to_version))
+    if old is None or new is None:
+        raise VersionError("Only text versions can be diffed")
+    return "".join(difflib.unified_diff(
+        old.splitlines(keepends=True),
+        new.splitlines(keepends=True),
+        fromfile=f"{db_file.original_name}@{from_version}",
+        tofile=f"{db_file.original_name}@{to_version}",
+    ))
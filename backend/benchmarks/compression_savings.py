@@ -0,0 +1,162 @@
+"""Disk and bandwidth saved by compressed blob storage and compressed JSON responses.
+
+Stores a corpus of release-note markdown with each storage codec and reports
+bytes on disk, which is also what a download sends to a client accepting that
+coding, plus store and decompress-on-read times. Then sends a /buckets/-like
+JSON listing through CompressionMiddleware for each response coding.
+
+Run from the backend directory:
+
+    python -m benchmarks.compression_savings --files 500
+    python -m benchmarks.compression_savings --dir ../docs   # your own text files
+"""
+import argparse
+import asyncio
+import io
+import json
+import mimetypes
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+from app import compression
+from app.storage_service import FileStorageService
+
+WORDS = (
+    "fix crash when parser handles empty input improve startup time of the editor add support for "
+    "exporting release notes as pdf update dependencies resolve memory leak in upload handler "
+    "deprecate legacy api endpoint rename configuration option clarify error message for invalid "
+    "tokens bucket files search index cache migration performance regression security patch"
+).split()
+
+
+def release_note(rng: random.Random, index: int) -> bytes:
+    lines = [f"# Release {index // 10}.{index % 10}.0", ""]
+    for section in ("Features", "Fixes", "Deprecations"):
+        lines += [f"## {section}", ""]
+        for _ in range(rng.randint(3, 25)):
+            ticket = rng.randint(1000, 9999)
+            lines.append(f"- {' '.join(rng.choices(WORDS, k=rng.randint(6, 18))).capitalize()} (#{ticket})")
+        lines.append("")
+    return "\n".join(lines).encode()
+
+
+def corpus(args) -> list[tuple[str, bytes]]:
+    if args.dir:
+        return [
+            (path.name, path.read_bytes())
+            for path in sorted(Path(args.dir).rglob("*"))
+            if path.is_file() and compression.is_text_type(mimetypes.guess_type(path.name)[0])
+        ]
+    rng = random.Random(args.seed)
+    return [(f"release-{i}.md", release_note(rng, i)) for i in range(args.files)]
+
+
+def storage_run(codec: str, files: list[tuple[str, bytes]]) -> dict:
+    with tempfile.TemporaryDirectory() as storage_dir:
+        storage = FileStorageService(storage_dir, max_size=0, compression_codec=codec)
+        started = time.perf_counter()
+        paths = [storage.store_fileobj(io.BytesIO(content), compress=True)[0] for _, content in files]
+        stored = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for path in paths:
+            storage.get_file(path)
+        read = time.perf_counter() - started
+        return {
+            "codec": codec or "none",
+            "disk_bytes": sum(storage.blob_size(path) for path in set(paths)),
+            "compressed_blobs": sum(1 for path in set(paths) if storage.content_encoding(path)),
+            "store_s": stored,
+            "read_s": read,
+        }
+
+
+def bucket_listing(buckets: int, files_per_bucket: int, seed: int) -> bytes:
+    rng = random.Random(seed)
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    listing = []
+    for bucket_id in range(1, buckets + 1):
+        created = now + timedelta(days=bucket_id)
+        listing.append({
+            "id": bucket_id,
+            "title": f"Release {bucket_id}",
+            "slug": f"release-{bucket_id}",
+            "version": f"{bucket_id // 10}.{bucket_id % 10}.0",
+            "release_date": created.isoformat(),
+            "content": release_note(rng, bucket_id).decode(),
+            "is_published": rng.random() < 0.8,
+            "created_at": created.isoformat(),
+            "updated_at": None,
+            "files": [
+                {
+                    "id": bucket_id * 1000 + n,
+                    "original_name": f"asset-{n}.md",
+                    "description": None,
+                    "storage_path": f"{rng.getrandbits(256):064x}",
+                    "file_type": "text/markdown",
+                    "file_size": float(rng.randint(500, 50000)),
+                    "bucket_id": bucket_id,
+                    "created_at": created.isoformat(),
+                    "updated_at": None,
+                }
+                for n in range(files_per_bucket)
+            ],
+        })
+    return json.dumps(listing).encode()
+
+
+async def response_run(body: bytes) -> list[dict]:
+    async def endpoint(request):
+        return Response(body, media_type="application/json")
+
+    app = compression.CompressionMiddleware(Starlette(routes=[Route("/buckets/", endpoint)]))
+    results = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for coding in ["identity", *app.codings]:
+            started = time.perf_counter()
+            async with client.stream("GET", "/buckets/", headers={"Accept-Encoding": coding}) as response:
+                sent = sum([len(chunk) async for chunk in response.aiter_raw()])
+            results.append({"coding": coding, "bytes": sent, "seconds": time.perf_counter() - started})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=500, help="generated release notes to store")
+    parser.add_argument("--dir", help="store the text files under this directory instead")
+    parser.add_argument("--buckets", type=int, default=100, help="buckets in the JSON listing")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    files = corpus(args)
+    original = sum(len(content) for _, content in files)
+    print(f"{len(files)} files, {original / 1024:.0f} KiB of text\n")
+    print(f"{'codec':>6} {'disk (KiB)':>11} {'saved':>7} {'compressed':>11} {'store s':>8} {'read s':>7}")
+    for codec in ["", *compression.CODECS]:
+        try:
+            result = storage_run(codec, files)
+        except ImportError as e:
+            print(f"{codec:>6} skipped: {e}")
+            continue
+        print(f"{result['codec']:>6} {result['disk_bytes'] / 1024:>11.0f} "
+              f"{1 - result['disk_bytes'] / original:>7.1%} {result['compressed_blobs']:>11} "
+              f"{result['store_s']:>8.2f} {result['read_s']:>7.2f}")
+
+    body = bucket_listing(args.buckets, 5, args.seed)
+    print(f"\nGET /buckets/ JSON, {len(body) / 1024:.0f} KiB uncompressed")
+    print(f"{'coding':>9} {'sent (KiB)':>11} {'saved':>7} {'ms':>7}")
+    for result in asyncio.run(response_run(body)):
+        print(f"{result['coding']:>9} {result['bytes'] / 1024:>11.0f} "
+              f"{1 - result['bytes'] / len(body):>7.1%} {result['seconds'] * 1000:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
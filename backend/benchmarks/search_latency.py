@@ -0,0 +1,107 @@
+"""Measure /search query latency over a large corpus of release notes.
+
+Seeds a throwaway SQLite database (or the database in DATABASE_URL with
+--use-database-url) with N notes and reports p50/p99 latency per query.
+Run from the backend directory:
+
+    python -m benchmarks.search_latency --notes 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+COMMON_WORDS = (
+    "fix crash login dashboard export import performance memory upload download "
+    "search billing invoice account security token session cache api webhook "
+    "notification email report chart filter sort pagination timezone locale"
+).split()
+# A long tail of rarer terms so match rates resemble real notes: common words
+# appear in most notes, tail terms in few
+TAIL_WORDS = [f"feature{n}" for n in range(20000)]
+QUERIES = ["login", "crash fix", "webhook notification", "feature12", "feature150 feature151", "feature9", "security feature42"]
+
+
+def note_text(rng: random.Random, words: int) -> str:
+    picked = []
+    for _ in range(words):
+        if rng.random() < 0.05:
+            picked.append(rng.choice(COMMON_WORDS))
+        else:
+            picked.append(TAIL_WORDS[min(int(rng.paretovariate(1.0)) - 1, len(TAIL_WORDS) - 1)])
+    return " ".join(picked)
+
+
+def seed(notes: int) -> None:
+    from sqlalchemy import insert
+
+    from app import search
+    from app.database import Base, SessionLocal, engine
+    from app.models import Bucket
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        search.drop_search_index(connection)
+        search.create_search_index(connection)
+
+    rng = random.Random(42)
+    with SessionLocal() as db:
+        batch = []
+        for i in range(notes):
+            batch.append({
+                "title": f"Release {i} {note_text(rng, 3)}",
+                "slug": f"release-{i}",
+                "version": f"{i // 100}.{i % 100}.0",
+                "content": note_text(rng, 200),
+                "is_published": True,
+            })
+            if len(batch) == 5000:
+                db.execute(insert(Bucket), batch)
+                batch = []
+        if batch:
+            db.execute(insert(Bucket), batch)
+        search.rebuild_search_index(db)
+        db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--notes", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--use-database-url", action="store_true", help="seed DATABASE_URL instead of a temp SQLite file")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    if not args.use_database_url:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp.name, 'search.db')}"
+
+    from app import search
+    from app.database import SessionLocal
+
+    started = time.perf_counter()
+    seed(args.notes)
+    print(f"seeded {args.notes} notes in {time.perf_counter() - started:.1f}s")
+
+    print(f"{'query':<26} {'p50 ms':>8} {'p99 ms':>8} {'page 2 p50 ms':>14}")
+    with SessionLocal() as db:
+        for query in QUERIES:
+            first, second = [], []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                _, cursor = search.search(db, query, limit=20)
+                first.append((time.perf_counter() - t0) * 1000)
+                if cursor:
+                    t0 = time.perf_counter()
+                    search.search(db, query, limit=20, cursor=cursor)
+                    second.append((time.perf_counter() - t0) * 1000)
+            p99 = statistics.quantiles(first, n=100)[98]
+            page2 = f"{statistics.median(second):.1f}" if second else "-"
+            print(f"{query:<26} {statistics.median(first):>8.1f} {p99:>8.1f} {page2:>14}")
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
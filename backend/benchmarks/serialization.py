@@ -0,0 +1,207 @@
+"""CPU per listed item of the bucket and file list endpoints, by response path.
+
+Seeds N buckets x M files into a fresh SQLite database, then times, with
+process CPU time, what a list request spends after routing:
+
+- orm_pydantic: ORM objects with their files (selectinload), validated
+  through the ``from_attributes`` response models and encoded with the
+  standard library, as FastAPI does for ``response_model``
+- rows_stdlib: column rows as dicts (``crud.get_bucket_rows``) encoded with
+  the standard library
+- rows_orjson: the same rows encoded with orjson, which the endpoints use
+  when it is installed
+
+Each path is split into query and encode time, and is checked to produce the
+same JSON as orm_pydantic. The NDJSON stream of the whole collection is timed
+as well, with the peak memory it needs next to building the whole list at
+once. Run from the backend directory:
+
+    python -m benchmarks.serialization --buckets 2000 --files 10
+    python -m benchmarks.serialization --page 500 --output serialization.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+def seed(buckets: int, files: int) -> None:
+    from sqlalchemy import insert, select
+
+    from alembic import command
+    from alembic.config import Config
+
+    from app.database import SessionLocal
+    from app.models import Bucket, File, utcnow
+
+    command.upgrade(Config("alembic.ini"), "head")
+    now = utcnow()
+    with SessionLocal() as db:
+        db.execute(insert(Bucket), [
+            {
+                "title": f"Release {i}",
+                "slug": f"release-{i}",
+                "version": f"{i // 100}.{i % 100}.0",
+                "content": "\n".join(f"- Fixed issue #{i * 40 + n} in the exporter" for n in range(40)),
+                "is_published": i % 2 == 0,
+                "created_at": now,
+            }
+            for i in range(buckets)
+        ])
+        bucket_ids = db.execute(select(Bucket.id)).scalars().all()
+        db.execute(insert(File), [
+            {
+                "original_name": f"asset-{n}.txt",
+                "description": f"Asset {n} of release {bucket_id}",
+                "storage_path": f"{bucket_id:04x}/{n:04x}/{'0' * 56}",
+                "file_type": "text/plain",
+                "file_size": 1024.0 * (n + 1),
+                "bucket_id": bucket_id,
+                "created_at": now,
+            }
+            for bucket_id in bucket_ids for n in range(files)
+        ])
+        db.commit()
+
+
+def stdlib_dumps(value) -> bytes:
+    from app import serialization
+
+    return json.dumps(value, default=serialization._default, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode()
+
+
+def paths(page: int) -> dict:
+    from typing import List
+
+    from pydantic import TypeAdapter
+
+    from app import crud, schemas, serialization
+
+    adapter = TypeAdapter(List[schemas.Bucket])
+
+    def orm_pydantic(db):
+        buckets = crud.get_buckets(db, limit=page)
+        return buckets, lambda: stdlib_dumps(adapter.dump_python(
+            adapter.validate_python(buckets, from_attributes=True), mode="json"))
+
+    def rows(encode):
+        def read(db):
+            buckets = crud.get_bucket_rows(db, limit=page)
+            return buckets, lambda: encode(buckets)
+        return read
+
+    result = {"orm_pydantic": orm_pydantic, "rows_stdlib": rows(stdlib_dumps)}
+    if serialization.orjson is not None:
+        result["rows_orjson"] = rows(serialization.dumps)
+    return result
+
+
+def measure(read, samples: int) -> dict:
+    from app.database import SessionLocal
+
+    query, encode = [], []
+    body = None
+    for _ in range(samples):
+        # A fresh session per sample, as each request gets one
+        with SessionLocal() as db:
+            started = time.process_time()
+            buckets, encoder = read(db)
+            query.append(time.process_time() - started)
+            started = time.process_time()
+            body = encoder()
+            encode.append(time.process_time() - started)
+    return {"query": statistics.median(query), "encode": statistics.median(encode), "items": len(buckets), "body": body}
+
+
+def stream(page: int) -> dict:
+    from app import crud, serialization
+    from app.database import SessionLocal
+
+    def read(skip, limit, cursor):
+        with SessionLocal() as db:
+            return crud.get_bucket_rows(db, skip, limit, cursor)
+
+    def run() -> int:
+        chunks = serialization.ndjson_chunks(crud.iter_row_batches(read, batch_size=page))
+        return sum(chunk.count(b"\n") for chunk in chunks)
+
+    started = time.process_time()
+    lines = run()
+    cpu = time.process_time() - started
+    # Memory is traced in a second run, since tracing slows everything down
+    tracemalloc.start()
+    run()
+    streamed_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+    with SessionLocal() as db:
+        serialization.dumps(crud.get_bucket_rows(db, limit=lines))
+    whole_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "items": lines,
+        "cpu_us_per_item": round(cpu / max(lines, 1) * 1e6, 1),
+        "peak_mb": round(streamed_peak / 2 ** 20, 1),
+        "whole_list_peak_mb": round(whole_peak / 2 ** 20, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buckets", type=int, default=2000)
+    parser.add_argument("--files", type=int, default=10, help="files per bucket")
+    parser.add_argument("--page", type=int, default=100, help="buckets per list request")
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--output", help="write results JSON here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Read when the app is first imported, below
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'serialization.db')}"
+        os.environ["STORAGE_DIR"] = os.path.join(tmp, "storage")
+        seed(args.buckets, args.files)
+
+        results = []
+        reference = None
+        for name, read in paths(args.page).items():
+            measured = measure(read, args.samples)
+            body = json.loads(measured.pop("body"))
+            if reference is None:
+                reference = body
+            elif body != reference:
+                print(f"{name} returns different content than orm_pydantic", file=sys.stderr)
+                sys.exit(1)
+            items = measured["items"]
+            total = measured["query"] + measured["encode"]
+            results.append({
+                "path": name,
+                "items": items,
+                "query_us_per_item": round(measured["query"] / items * 1e6, 1),
+                "encode_us_per_item": round(measured["encode"] / items * 1e6, 1),
+                "total_us_per_item": round(total / items * 1e6, 1),
+            })
+        baseline = results[0]["total_us_per_item"]
+        for result in results:
+            result["speedup"] = round(baseline / result["total_us_per_item"], 2)
+        report = {
+            "buckets": args.buckets,
+            "files_per_bucket": args.files,
+            "page": args.page,
+            "results": results,
+            "ndjson_stream": stream(args.page),
+        }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Import and startup time of an app worker, for keeping worker spawn fast.
+
+Each sample is a fresh interpreter against a migrated SQLite database and an
+empty storage directory, measuring:
+
+- import: ``import app.main``
+- lifespan: running the startup hooks (storage setup, schema check, job workers)
+- first_request: the first ``GET /buckets/`` after startup, which opens the
+  first database connection
+- openapi: the first ``GET /openapi.json``, which builds the schema lazily
+- uvicorn: spawning ``uvicorn app.main:app`` until ``/health`` answers
+
+and lists the app modules that take longest to import. Results are JSON and
+can be compared against a baseline, as in api_load. Run from the backend
+directory:
+
+    python -m benchmarks.startup --samples 5
+    python -m benchmarks.startup --output startup.json --baseline benchmarks/startup_baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+PHASES = ("import", "lifespan", "first_request", "openapi")
+
+
+def measure() -> dict:
+    started = time.perf_counter()
+    from app.main import app
+    timings = {"import": time.perf_counter() - started}
+
+    async def run():
+        started = time.perf_counter()
+        async with app.router.lifespan_context(app):
+            timings["lifespan"] = time.perf_counter() - started
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for phase, url in (("first_request", "/buckets/"), ("openapi", "/openapi.json")):
+                    started = time.perf_counter()
+                    response = await client.get(url)
+                    response.raise_for_status()
+                    timings[phase] = time.perf_counter() - started
+
+    asyncio.run(run())
+    return timings
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def uvicorn_ready(env: dict) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"], env=env,
+    )
+    # One client, so polling doesn't compete with the server for CPU by setting up a new one each time
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            while True:
+                try:
+                    client.get("/health")
+                    return time.perf_counter() - started
+                except httpx.TransportError:
+                    if time.perf_counter() - started > 60 or server.poll() is not None:
+                        raise RuntimeError("uvicorn did not start")
+                    time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def slowest_modules(env: dict, count: int) -> list[dict]:
+    """App modules and top-level packages by cumulative import time, from python -X importtime"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"],
+                            env=env, capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        name = match and match.group(4)
+        if name and name != "app.main" and (name.startswith("app.") or "." not in name):
+            modules.append({"module": name, "self_ms": int(match.group(1)) / 1000,
+                            "cumulative_ms": int(match.group(2)) / 1000})
+    return sorted(modules, key=lambda m: m["cumulative_ms"], reverse=True)[:count]
+
+
+def summarize(name: str, samples: list[float]) -> dict:
+    return {
+        "phase": name,
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+def compare(results: list[dict], baseline: dict, tolerance: float) -> list[str]:
+    expected = {r["phase"]: r for r in baseline["results"]}
+    return [
+        f"{r['phase']}: median {r['median_ms']}ms vs baseline {expected[r['phase']]['median_ms']}ms"
+        for r in results
+        if r["phase"] in expected and r["median_ms"] > expected[r["phase"]]["median_ms"] * (1 + tolerance)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=5, help="fresh processes per measurement")
+    parser.add_argument("--modules", type=int, default=10, help="slowest app modules to list")
+    parser.add_argument("--skip-uvicorn", action="store_true")
+    parser.add_argument("--output", help="write results JSON here instead of stdout")
+    parser.add_argument("--baseline", help="results JSON to compare against; exits 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown against the baseline")
+    parser.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(measure()))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'startup.db')}",
+            "STORAGE_DIR": os.path.join(tmp, "storage"),
+            "CACHE_BACKEND": "local",
+        }
+        subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], env=env, check=True, capture_output=True)
+
+        samples = {phase: [] for phase in PHASES}
+        for _ in range(args.samples):
+            output = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--run"],
+                                    env=env, capture_output=True, text=True, check=True).stdout
+            for phase, seconds in json.loads(output.splitlines()[-1]).items():
+                samples[phase].append(seconds)
+        results = [summarize(phase, samples[phase]) for phase in PHASES]
+        if not args.skip_uvicorn:
+            results.append(summarize("uvicorn", [uvicorn_ready(env) for _ in range(args.samples)]))
+        report = {"samples": args.samples, "results": results, "slowest_modules": slowest_modules(env, args.modules)}
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
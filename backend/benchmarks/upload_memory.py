@@ -0,0 +1,67 @@
+"""Compare peak memory of buffered vs streamed uploads as upload size grows.
+
+Run from the backend directory:
+
+    python -m benchmarks.upload_memory --sizes 1 16 64 256
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+from starlette.datastructures import UploadFile
+
+from app.storage_service import FileStorageService
+
+MB = 1024 * 1024
+
+
+def make_upload(size_mb: int) -> UploadFile:
+    """Build an UploadFile spooled to disk, like Starlette does for large multipart bodies"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=MB)
+    block = os.urandom(MB)
+    for _ in range(size_mb):
+        spooled.write(block)
+    spooled.seek(0)
+    return UploadFile(file=spooled, filename="artifact.bin")
+
+
+async def buffered(storage: FileStorageService, upload: UploadFile) -> None:
+    contents = await upload.read()
+    storage.save_file(contents, upload.filename, bucket_id=1)
+
+
+async def streamed(storage: FileStorageService, upload: UploadFile) -> None:
+    await storage.save_upload(upload, upload.filename, bucket_id=1)
+
+
+def measure(mode, storage: FileStorageService, size_mb: int) -> tuple[float, float]:
+    upload = make_upload(size_mb)
+    tracemalloc.start()
+    started = time.perf_counter()
+    asyncio.run(mode(storage, upload))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    upload.file.close()
+    return peak / MB, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 16, 64, 256], help="upload sizes in MB")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as storage_dir:
+        storage = FileStorageService(storage_dir, max_size=0)
+        print(f"{'size (MB)':>10} {'buffered peak (MB)':>20} {'streamed peak (MB)':>20} {'buffered s':>11} {'streamed s':>11}")
+        for size_mb in args.sizes:
+            buffered_peak, buffered_time = measure(buffered, storage, size_mb)
+            streamed_peak, streamed_time = measure(streamed, storage, size_mb)
+            print(f"{size_mb:>10} {buffered_peak:>20.1f} {streamed_peak:>20.1f} {buffered_time:>11.2f} {streamed_time:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
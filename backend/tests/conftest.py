@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+import pytest
+
+# Settings are read when the app is first imported, so they are set here
+_tmp = tempfile.mkdtemp(prefix="release-notes-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ["STORAGE_DIR"] = os.path.join(_tmp, "storage")
+# No job workers, so every statement counted comes from the request
+os.environ["JOB_WORKERS"] = "0"
+os.environ["STATIC_PUBLISHING"] = "false"
+os.environ["SCRUB_INTERVAL_HOURS"] = "0"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    from alembic import command
+    from alembic.config import Config
+
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    config = Config(os.path.join(backend, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(backend, "alembic"))
+    command.upgrade(config, "head")
+
+
+@pytest.fixture
+def db():
+    from sqlalchemy import delete
+
+    from app.cache import bucket_cache
+    from app.database import SessionLocal
+    from app.models import Bucket, Change, RenderedContent
+
+    with SessionLocal() as session:
+        yield session
+        session.rollback()
+        session.execute(delete(Bucket))
+        session.execute(delete(Change))
+        session.execute(delete(RenderedContent))
+        session.commit()
+    bucket_cache.clear()
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
@@ -0,0 +1,35 @@
+"""Oversized uploads are turned away by Content-Length before the app reads them"""
+from fastapi.testclient import TestClient
+from starlette.responses import PlainTextResponse
+
+from app.admission import MULTIPART_OVERHEAD, AdmissionMiddleware
+
+
+def make_client(reached: list) -> TestClient:
+    async def app(scope, receive, send):
+        reached.append(scope["path"])
+        await PlainTextResponse("ok")(scope, receive, send)
+
+    return TestClient(AdmissionMiddleware(app, rate_limits="", concurrency_limits="", max_upload_size=1000))
+
+
+def test_oversized_upload_is_rejected_before_the_app():
+    reached = []
+    client = make_client(reached)
+
+    response = client.post("/buckets/1/files/", content=b"x" * (1000 + MULTIPART_OVERHEAD + 1))
+    assert response.status_code == 413
+    response = client.put("/files/1/content", content=b"x" * (1000 + MULTIPART_OVERHEAD + 1))
+    assert response.status_code == 413
+    assert reached == []
+
+
+def test_uploads_within_the_limit_and_other_routes_pass():
+    reached = []
+    client = make_client(reached)
+
+    assert client.post("/buckets/1/files/", content=b"x" * 1000).status_code == 200
+    # A batch may carry MAX_BATCH_FILES files
+    assert client.post("/buckets/1/files/batch", content=b"x" * (2 * (1000 + MULTIPART_OVERHEAD))).status_code == 200
+    assert client.post("/import", content=b"x" * (1000 + MULTIPART_OVERHEAD + 1)).status_code == 200
+    assert reached == ["/buckets/1/files/", "/buckets/1/files/batch", "/import"]
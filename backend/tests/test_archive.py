@@ -0,0 +1,64 @@
+"""Export and import of buckets and files as tar archives"""
+import hashlib
+import io
+import os
+import tarfile
+
+from app.storage_service import file_storage
+from tests.test_file_content import upload
+
+
+def test_export_with_missing_blob_fails_before_streaming(db, client):
+    bucket = client.post("/buckets/", json={"title": "Lost", "slug": "lost"}).json()
+    lost = upload(client, bucket["id"], "lost.txt", b"content that goes missing")
+    os.unlink(file_storage.local_path(lost["storage_path"]))
+
+    response = client.get("/export", params={"slug": "lost"})
+    assert response.status_code == 500
+    assert "missing" in response.json()["detail"]
+
+
+def tar_bytes(members: dict) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def import_archive(client, content: bytes):
+    return client.post("/import", files={"file": ("export.tar", content, "application/x-tar")})
+
+
+def test_export_and_import_round_trip(db, client):
+    bucket = client.post("/buckets/", json={"title": "Trip", "slug": "trip", "content": "# Notes"}).json()
+    upload(client, bucket["id"], "a.txt", b"first file")
+    upload(client, bucket["id"], "b.txt", b"second file")
+    exported = client.get("/export", params={"slug": "trip"})
+    assert exported.status_code == 200
+    assert client.delete(f"/buckets/{bucket['id']}").status_code == 200
+
+    response = import_archive(client, exported.content)
+    assert response.status_code == 200, response.text
+    assert response.json()["buckets_created"] == 1
+    assert response.json()["files_created"] == 2
+
+    imported = client.get("/buckets/by-slug/trip").json()
+    assert (imported["title"], imported["content"]) == ("Trip", "# Notes")
+    contents = {f["original_name"]: client.get(f"/files/{f['id']}/download").content for f in imported["files"]}
+    assert contents == {"a.txt": b"first file", "b.txt": b"second file"}
+
+    # Importing the same archive again changes nothing
+    again = import_archive(client, exported.content).json()
+    assert (again["buckets_created"], again["buckets_updated"]) == (0, 1)
+    assert (again["files_created"], again["files_skipped"]) == (0, 2)
+
+
+def test_import_rejects_blob_with_wrong_checksum(db, client):
+    claimed = hashlib.sha256(b"what the name says").hexdigest()
+    response = import_archive(client, tar_bytes({f"blobs/{claimed}": b"something else"}))
+    assert response.status_code == 400
+    assert "Checksum mismatch" in response.json()["detail"]
+    assert not file_storage.exists(file_storage.blob_path(hashlib.sha256(b"something else").hexdigest()))
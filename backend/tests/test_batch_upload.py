@@ -0,0 +1,58 @@
+"""Batch uploads report a result per file and release their blobs when the transaction fails"""
+import hashlib
+import json
+
+from sqlalchemy import select
+
+from app import crud, jobs
+from app.models import File, Job
+from app.storage_service import file_storage
+
+
+def post_batch(client, bucket_id: int, files: dict, descriptions: list = ()):
+    return client.post(
+        f"/buckets/{bucket_id}/files/batch",
+        files=[("files", (name, content, "text/plain")) for name, content in files.items()],
+        data={"descriptions": list(descriptions)},
+    )
+
+
+def test_batch_reports_each_file(db, client, monkeypatch):
+    monkeypatch.setattr(file_storage, "max_size", 100)
+    bucket = client.post("/buckets/", json={"title": "Batch", "slug": "batch"}).json()
+
+    response = post_batch(client, bucket["id"], {"a.txt": b"a", "big.txt": b"x" * 101, "c.txt": b"c"},
+                          descriptions=["first", "second", "third"])
+    assert response.status_code == 200, response.text
+    results = response.json()
+    assert [(r["original_name"], r["status"]) for r in results] == [
+        ("a.txt", "created"), ("big.txt", "failed"), ("c.txt", "created")
+    ]
+    assert "maximum upload size" in results[1]["error"]
+    assert results[2]["file"]["description"] == "third"
+
+    files = client.get(f"/buckets/{bucket['id']}/files/").json()
+    assert sorted(f["original_name"] for f in files) == ["a.txt", "c.txt"]
+
+
+def test_failed_batch_releases_its_blobs(db, client, monkeypatch):
+    def fail(db, db_files, bucket_id):
+        db.add_all(db_files)
+        db.flush()
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(crud, "_add_files", fail)
+    bucket = client.post("/buckets/", json={"title": "Rollback", "slug": "rollback"}).json()
+
+    response = post_batch(client, bucket["id"], {"a.txt": b"rolled back a", "b.txt": b"rolled back b"})
+    assert response.status_code == 500
+    assert db.execute(select(File).where(File.bucket_id == bucket["id"])).first() is None
+
+    # Unreferenced now; written just now, so they are released by a job after the grace period
+    released = set()
+    for payload in db.execute(
+        select(Job.payload).where(Job.kind == "release_blobs", Job.status == jobs.PENDING)
+    ).scalars():
+        released.update(json.loads(payload)["storage_paths"])
+    contents = (b"rolled back a", b"rolled back b")
+    assert {file_storage.blob_path(hashlib.sha256(content).hexdigest()) for content in contents} <= released
@@ -0,0 +1,62 @@
+"""Content-addressed blobs: identical content is stored once, and reused blobs are kept from releases"""
+import json
+import os
+import time
+
+from sqlalchemy import select
+
+from app import crud, jobs
+from app.config import BLOB_REUSE_GRACE
+from app.models import Job
+from app.storage_service import FileStorageService, file_storage
+from tests.test_file_content import upload
+
+
+def test_save_file_reuses_and_refreshes_existing_blob(tmp_path):
+    storage = FileStorageService(str(tmp_path), compression_codec="")
+    storage_path, file_type, file_size = storage.save_file(b"same bytes", "a.txt", 1)
+    blob = storage.local_path(storage_path)
+    os.utime(blob, (time.time() - 3600, time.time() - 3600))
+
+    again, _, _ = storage.save_file(b"same bytes", "b.txt", 2)
+    assert again == storage_path
+    assert (file_type, file_size) == ("text/plain", 10)
+    # Marked as just written, so a release in progress leaves it alone
+    assert os.path.getmtime(blob) > time.time() - 60
+    assert not storage.delete_file(storage_path, modified_before=time.time() - 60)
+    assert list(storage.tmp_path.iterdir()) == []
+
+
+def test_identical_uploads_share_one_blob(db, client):
+    first = client.post("/buckets/", json={"title": "First", "slug": "first"}).json()
+    second = client.post("/buckets/", json={"title": "Second", "slug": "second"}).json()
+    a = upload(client, first["id"], "a.txt", b"shared content")
+    b = upload(client, second["id"], "b.txt", b"shared content")
+
+    assert a["storage_path"] == b["storage_path"]
+    checksum = file_storage.content_hash(a["storage_path"])
+    assert [path for path, _ in file_storage.iter_blobs(checksum[:2]) if checksum in path] == [a["storage_path"]]
+
+
+def test_blob_is_released_once_unreferenced_and_past_the_grace_period(db, client):
+    bucket = client.post("/buckets/", json={"title": "Release", "slug": "release"}).json()
+    a = upload(client, bucket["id"], "a.bin", b"\x00released content")
+    b = upload(client, bucket["id"], "b.bin", b"\x00released content")
+    storage_path = a["storage_path"]
+
+    # Still referenced by the other file
+    assert crud.delete_file(db, a["id"])
+    assert file_storage.exists(storage_path)
+
+    # Unreferenced, but written just now, so a release job comes back for it later
+    assert crud.delete_file(db, b["id"])
+    assert file_storage.exists(storage_path)
+    pending = db.execute(
+        select(Job.payload).where(Job.kind == "release_blobs", Job.status == jobs.PENDING)
+    ).scalars().all()
+    assert any(storage_path in json.loads(payload)["storage_paths"] for payload in pending)
+
+    old = time.time() - BLOB_REUSE_GRACE - 60
+    os.utime(file_storage.local_path(storage_path), (old, old))
+    assert crud.release_blobs(db, [storage_path]) == 1
+    assert not file_storage.exists(storage_path)
@@ -0,0 +1,65 @@
+"""Deleting a bucket releases its blobs in the background, and reconcile removes orphans left behind"""
+import io
+import json
+import os
+import time
+
+from sqlalchemy import func, select
+
+from app import crud, jobs
+from app.models import File, FileVersion, Job
+from app.storage_reconcile import reconcile_storage
+from app.storage_service import file_storage
+from tests.test_file_content import put_content, upload
+
+
+def make_old(storage_path: str, seconds: float = 7200) -> None:
+    old = time.time() - seconds
+    os.utime(file_storage.local_path(storage_path), (old, old))
+
+
+def test_bucket_delete_releases_blobs_only_it_used(db, client):
+    doomed = client.post("/buckets/", json={"title": "Doomed", "slug": "doomed"}).json()
+    kept = client.post("/buckets/", json={"title": "Kept", "slug": "kept"}).json()
+    own = upload(client, doomed["id"], "own.txt", b"only in the doomed bucket")
+    put_content(client, own["id"], b"\xff not UTF-8, so kept as a blob version")
+    shared = upload(client, doomed["id"], "shared.txt", b"in both buckets")
+    upload(client, kept["id"], "shared.txt", b"in both buckets")
+    own_paths = {version.storage_path for version in db.query(FileVersion).filter(FileVersion.file_id == own["id"])}
+    assert len(own_paths) == 2
+
+    assert client.delete(f"/buckets/{doomed['id']}").status_code == 200
+    assert db.scalar(select(func.count()).select_from(File).where(File.bucket_id == doomed["id"])) == 0
+    assert db.scalar(select(func.count()).select_from(FileVersion).where(FileVersion.file_id == own["id"])) == 0
+
+    job = db.execute(
+        select(Job).where(Job.kind == "release_blobs", Job.status == jobs.PENDING).order_by(Job.id.desc())
+    ).scalars().first()
+    released = set(json.loads(job.payload)["storage_paths"])
+    assert released == own_paths | {shared["storage_path"]}
+
+    # What the job does once the grace period is over
+    for storage_path in released:
+        make_old(storage_path)
+    assert crud.release_blobs(db, released) == 2
+    assert not any(file_storage.exists(storage_path) for storage_path in own_paths)
+    assert file_storage.exists(shared["storage_path"])
+
+
+def test_reconcile_deletes_old_orphans_only(db, client):
+    bucket = client.post("/buckets/", json={"title": "Reconcile", "slug": "reconcile"}).json()
+    referenced = upload(client, bucket["id"], "kept.txt", b"still referenced")["storage_path"]
+    orphan, _, _ = file_storage.store_fileobj(io.BytesIO(b"left behind by a crash"))
+    recent, _, _ = file_storage.store_fileobj(io.BytesIO(b"an upload about to commit its row"))
+    make_old(referenced)
+    make_old(orphan)
+
+    stats = reconcile_storage(db, min_age=3600, dry_run=True)
+    assert stats["deleted"] == 0
+    assert file_storage.exists(orphan)
+
+    stats = reconcile_storage(db, min_age=3600)
+    assert stats["deleted"] >= 1
+    assert not file_storage.exists(orphan)
+    assert file_storage.exists(referenced)
+    assert file_storage.exists(recent)
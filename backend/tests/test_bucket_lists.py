@@ -0,0 +1,27 @@
+"""Bucket lists carry their files, and summaries aggregate them, without a query per bucket"""
+from tests.test_file_content import upload
+
+
+def test_summaries_count_files_and_bytes(db, client):
+    full = client.post("/buckets/", json={"title": "Full", "slug": "full"}).json()
+    empty = client.post("/buckets/", json={"title": "Empty", "slug": "empty"}).json()
+    upload(client, full["id"], "a.txt", b"12345")
+    upload(client, full["id"], "b.txt", b"1234567")
+
+    summaries = {summary["slug"]: summary for summary in client.get("/buckets/summary").json()}
+    assert (summaries["full"]["file_count"], summaries["full"]["total_bytes"]) == (2, 12)
+    assert (summaries["empty"]["file_count"], summaries["empty"]["total_bytes"]) == (0, 0)
+    assert "files" not in summaries["full"]
+    assert summaries["empty"]["id"] == empty["id"]
+
+
+def test_bucket_list_includes_each_buckets_files(db, client):
+    first = client.post("/buckets/", json={"title": "First", "slug": "first"}).json()
+    second = client.post("/buckets/", json={"title": "Second", "slug": "second"}).json()
+    upload(client, first["id"], "one.txt", b"one")
+    upload(client, second["id"], "two.txt", b"two")
+    upload(client, second["id"], "three.txt", b"three")
+
+    buckets = {bucket["slug"]: bucket for bucket in client.get("/buckets/").json()}
+    assert [f["original_name"] for f in buckets["first"]["files"]] == ["one.txt"]
+    assert [f["original_name"] for f in buckets["second"]["files"]] == ["two.txt", "three.txt"]
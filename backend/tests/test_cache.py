@@ -0,0 +1,50 @@
+"""A response read before a write must not be cached after that write's invalidation"""
+from app.cache import BucketCache, CachedBucket, LocalCacheBackend
+
+
+def response(bucket_id: int, slug: str, body: str) -> CachedBucket:
+    return CachedBucket(bucket_id, slug, body, f'"{body}"', None, True)
+
+
+def test_invalidation_during_load_is_not_overwritten():
+    cache = BucketCache(LocalCacheBackend(10, 60))
+
+    def stale_load():
+        # A write commits and invalidates while the old row is being serialized
+        cache.invalidate(1)
+        return response(1, "one", "old")
+
+    assert cache.read_through(1, stale_load).body == "old"
+    assert cache.get_by_id(1) is None
+    assert cache.read_through(1, lambda: response(1, "one", "new")).body == "new"
+    assert cache.get_by_id(1).body == "new"
+
+
+def test_slug_read_caches_once_the_mapping_is_known():
+    cache = BucketCache(LocalCacheBackend(10, 60))
+
+    assert cache.read_through_slug("one", lambda: response(1, "one", "v1")).body == "v1"
+    assert cache.get_by_slug("one") is None
+    cache.read_through_slug("one", lambda: response(1, "one", "v1"))
+    assert cache.get_by_slug("one").body == "v1"
+
+    def stale_load():
+        cache.invalidate(1)
+        return response(1, "one", "v1")
+
+    cache.invalidate(1)
+    cache.read_through_slug("one", stale_load)
+    assert cache.get_by_slug("one") is None
+
+
+def test_generations_stay_bounded_and_evicted_keys_stay_invalidated():
+    backend = LocalCacheBackend(2, 60)
+    before = backend.generation("bucket:1")
+    for bucket_id in range(1, 10):
+        backend.delete(f"bucket:{bucket_id}")
+    assert len(backend._generations) == 2
+
+    # bucket:1 was invalidated after its generation was read, then evicted
+    assert not backend.set_if_generation("bucket:1", "stale", before)
+    assert backend.set_if_generation("bucket:1", "fresh", backend.generation("bucket:1"))
+    assert backend.get("bucket:1") == "fresh"
@@ -0,0 +1,80 @@
+"""The change feed hands out tokens, long-polls for the next change and streams changes as events"""
+import asyncio
+import threading
+import time
+
+from app import changes
+from app.database import SessionLocal
+
+
+def current_token(client) -> str:
+    return client.get("/changes", params={"since": "now"}).json()["next"]
+
+
+def test_feed_lists_changes_after_a_token(db, client):
+    token = current_token(client)
+    bucket = client.post("/buckets/", json={"title": "Feed", "slug": "feed"}).json()
+    client.put(f"/buckets/{bucket['id']}", json={"title": "Feed", "slug": "feed", "is_published": True})
+    created = client.post(f"/buckets/{bucket['id']}/files/", files={"file": ("a.txt", b"a", "text/plain")}).json()
+
+    feed = client.get("/changes", params={"since": token}).json()
+    # The latest change per bucket or file
+    assert [(c["entity"], c["entity_id"], c["action"]) for c in feed["changes"]] == [
+        ("bucket", bucket["id"], "published"),
+        ("file", created["id"], "created"),
+    ]
+    assert feed["has_more"] is False
+    assert client.get("/changes", params={"since": feed["next"]}).json()["changes"] == []
+
+    files_only = client.get("/changes", params={"since": token, "entity": "file"}).json()
+    assert [c["entity"] for c in files_only["changes"]] == ["file"]
+    assert client.get("/changes", params={"since": "nonsense"}).status_code == 400
+    assert client.get("/changes", params={"since": int(feed["next"]) + 100}).status_code == 410
+
+
+def test_long_poll_returns_when_a_change_is_committed(db, client):
+    token = current_token(client)
+    result = {}
+
+    def wait_for_change():
+        started = time.monotonic()
+        result["feed"] = client.get("/changes", params={"since": token, "wait": 10}).json()
+        result["elapsed"] = time.monotonic() - started
+
+    waiter = threading.Thread(target=wait_for_change)
+    waiter.start()
+    time.sleep(0.3)
+    bucket = client.post("/buckets/", json={"title": "Polled", "slug": "polled"}).json()
+    waiter.join(10)
+
+    assert result["elapsed"] < 5
+    assert [(c["entity_id"], c["action"]) for c in result["feed"]["changes"]] == [(bucket["id"], "created")]
+
+    started = time.monotonic()
+    assert client.get("/changes", params={"since": result["feed"]["next"], "wait": 0.2}).json()["changes"] == []
+    assert time.monotonic() - started >= 0.2
+
+
+def test_stream_sends_an_event_per_change(db, client):
+    token = int(current_token(client))
+    first = client.post("/buckets/", json={"title": "First", "slug": "first"}).json()
+
+    async def read_events():
+        feed = await changes.poll(SessionLocal, token)
+        events = changes.stream(SessionLocal, token, feed)
+        try:
+            received = [await anext(events)]
+            # Later changes arrive on the open stream
+            await asyncio.to_thread(client.post, "/buckets/", json={"title": "Second", "slug": "second"})
+            received.append(await anext(events))
+            return received
+        finally:
+            await events.aclose()
+
+    received = asyncio.run(read_events())
+    assert all(event.startswith("id: ") and "event: change\n" in event for event in received)
+    assert f'"entity_id":{first["id"]}' in received[0]
+    assert '"action":"created"' in received[1]
+    assert int(received[1].split("\n")[0][4:]) > int(received[0].split("\n")[0][4:])
+    # A bad token is answered with an error status before the stream starts
+    assert client.get("/changes/stream", params={"since": "nonsense"}).status_code == 400
@@ -0,0 +1,57 @@
+"""Files carry their SHA-256, downloads send it as a digest, and the scrubber checks blobs against it"""
+import base64
+import hashlib
+import os
+
+from app import storage_scrub
+from app.storage_service import file_storage
+from tests.test_file_content import upload
+
+
+def test_download_sends_the_stored_checksum_as_digest(db, client):
+    bucket = client.post("/buckets/", json={"title": "Digests", "slug": "digests"}).json()
+    content = b"checked content"
+    created = upload(client, bucket["id"], "notes.txt", content)
+    digest = hashlib.sha256(content)
+    assert created["checksum"] == digest.hexdigest()
+
+    response = client.get(f"/files/{created['id']}/download")
+    encoded = base64.b64encode(digest.digest()).decode()
+    assert response.headers["repr-digest"] == f"sha-256=:{encoded}:"
+    assert response.headers["digest"] == f"SHA-256={encoded}"
+    assert response.headers["etag"] == f'"{digest.hexdigest()}"'
+
+
+def test_put_with_current_checksum_is_refused(db, client):
+    bucket = client.post("/buckets/", json={"title": "Unchanged", "slug": "unchanged"}).json()
+    created = upload(client, bucket["id"], "notes.txt", b"same as before")
+    url = f"/files/{created['id']}/content"
+    files = {"file": ("notes.txt", b"same as before", "text/plain")}
+
+    response = client.put(url, files=files, headers={"If-None-Match": f'"{created["checksum"]}"'})
+    assert response.status_code == 412
+    assert response.headers["etag"] == f'"{created["checksum"]}"'
+    assert len(client.get(f"/files/{created['id']}/versions").json()) == 1
+
+    # Any other checksum means the content differs, so the update goes ahead
+    files = {"file": ("notes.txt", b"changed", "text/plain")}
+    response = client.put(url, files=files, headers={"If-None-Match": f'"{"0" * 64}"'})
+    assert response.status_code == 200
+    assert response.json()["file"]["checksum"] == hashlib.sha256(b"changed").hexdigest()
+
+
+def test_scrub_finds_corrupt_and_missing_blobs(db, client):
+    bucket = client.post("/buckets/", json={"title": "Scrub", "slug": "scrub"}).json()
+    corrupt = upload(client, bucket["id"], "corrupt.txt", b"will be corrupted on disk")
+    missing = upload(client, bucket["id"], "missing.txt", b"will go missing from disk")
+
+    assert storage_scrub.scrub(db, corrupt["checksum"][:2], rate=0)["corrupt"] == 0
+    with open(file_storage.local_path(corrupt["storage_path"]), "wb") as f:
+        f.write(b"bit rot")
+    os.unlink(file_storage.local_path(missing["storage_path"]))
+
+    stats = storage_scrub.scrub(db, corrupt["checksum"][:2], rate=0)
+    assert stats["corrupt"] == 1
+    assert stats["blobs_checked"] >= 1
+    assert storage_scrub.scrub(db, missing["checksum"][:2], rate=0)["missing"] == 1
+    file_storage.delete_file(corrupt["storage_path"])
@@ -0,0 +1,68 @@
+"""Text blobs stored compressed read back as their original content"""
+import asyncio
+import io
+import os
+
+import pytest
+
+from app import compression, processing
+from app.storage_service import FileStorageService, file_storage
+from tests.test_file_content import upload
+
+TEXT = b"".join(b"- change %d: fixed a thing that was broken\n" % n for n in range(200))
+
+
+def read_all(storage: FileStorageService, storage_path: str, start: int = 0, end=None, decode: bool = False) -> bytes:
+    async def collect():
+        return b"".join([chunk async for chunk in storage.read_blob(storage_path, start, end, decode=decode)])
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_compressed_blob_reads_back_as_the_original(tmp_path, codec):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    storage = FileStorageService(str(tmp_path), chunk_size=256, compression_codec=codec, compression_min_size=1024)
+    plain, _, checksum = storage.store_fileobj(io.BytesIO(TEXT))
+
+    packed = storage.compress_blob(plain)
+    assert packed == plain + compression.get_codec(codec).suffix
+    assert storage.content_encoding(packed) == codec
+    assert storage.content_hash(packed) == checksum
+    assert os.path.getsize(storage.local_path(packed)) < len(TEXT) // 2
+    assert storage.get_file(packed) == TEXT
+    # Ranges are offsets into the original content
+    assert read_all(storage, packed, 1000, 1999, decode=True) == TEXT[1000:2000]
+
+
+def test_small_or_incompressible_blobs_stay_plain(tmp_path):
+    storage = FileStorageService(str(tmp_path), compression_codec="gzip", compression_min_size=1024)
+    small, _, _ = storage.store_fileobj(io.BytesIO(b"short text"))
+    assert storage.compress_blob(small) is None
+    noise, _, _ = storage.store_fileobj(io.BytesIO(os.urandom(4096)))
+    assert storage.compress_blob(noise) is None
+    packed = storage.compress_blob(storage.store_fileobj(io.BytesIO(TEXT))[0])
+    assert storage.compress_blob(packed) is None
+
+
+def test_download_of_compressed_file(db, client, monkeypatch):
+    monkeypatch.setattr(file_storage, "codec", compression.get_codec("gzip"))
+    bucket = client.post("/buckets/", json={"title": "Packed", "slug": "packed"}).json()
+    created = upload(client, bucket["id"], "notes.txt", TEXT)
+
+    # What the process_file job does after the upload
+    processing.process_file(db, created["id"])
+    stored = client.get(f"/files/{created['id']}").json()
+    assert stored["storage_path"].endswith(".gz")
+    url = f"/files/{created['id']}/download"
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == TEXT
+
+    response = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.content == TEXT
+    response = client.get(url, headers={"Accept-Encoding": "identity", "Range": "bytes=100-199"})
+    assert (response.status_code, response.content) == (206, TEXT[100:200])
@@ -0,0 +1,30 @@
+"""Content updates and restores answer with the file they changed"""
+
+
+def upload(client, bucket_id: int, name: str, content: bytes) -> dict:
+    response = client.post(f"/buckets/{bucket_id}/files/", files={"file": (name, content, "text/plain")})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def put_content(client, file_id: int, content: bytes) -> dict:
+    response = client.put(f"/files/{file_id}/content", files={"file": ("notes.txt", content, "text/plain")})
+    assert response.status_code == 200, response.text
+    return response.json()["file"]
+
+
+def test_update_and_restore_return_the_file(db, client):
+    bucket = client.post("/buckets/", json={"title": "Content", "slug": "content"}).json()
+    created = upload(client, bucket["id"], "notes.txt", b"first revision\n")
+
+    for revision in (b"second revision\n", b"third revision\n"):
+        updated = put_content(client, created["id"], revision)
+        assert updated["id"] == created["id"]
+        assert updated["file_size"] == len(revision)
+
+    response = client.post(f"/files/{created['id']}/versions/1/restore")
+    assert response.status_code == 200, response.text
+    restored = response.json()["file"]
+    assert restored["id"] == created["id"]
+    assert restored["file_size"] == len(b"first revision\n")
+    assert client.get(f"/files/{created['id']}/download").content == b"first revision\n"
@@ -0,0 +1,70 @@
+"""Validators and conditional requests for buckets and downloads"""
+from datetime import timedelta
+
+from sqlalchemy import update
+
+from app.models import Bucket, File, utcnow
+from tests.test_file_content import upload
+
+
+def age(db, bucket_id: int, days: int = 1) -> None:
+    # Push existing timestamps back so a change now is a later second
+    then = utcnow() - timedelta(days=days)
+    db.execute(update(Bucket).where(Bucket.id == bucket_id).values(created_at=then, updated_at=then))
+    db.execute(update(File).where(File.bucket_id == bucket_id).values(created_at=then, updated_at=then))
+    db.commit()
+
+
+def test_deleting_a_file_moves_last_modified_forward(db, client):
+    bucket = client.post("/buckets/", json={"title": "Cached", "slug": "cached"}).json()
+    upload(client, bucket["id"], "a.txt", b"a")
+    newest = upload(client, bucket["id"], "b.txt", b"b")
+    age(db, bucket["id"])
+    last_modified = client.get(f"/buckets/{bucket['id']}").headers["last-modified"]
+
+    assert client.delete(f"/files/{newest['id']}").status_code == 200
+    response = client.get(f"/buckets/{bucket['id']}", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 200
+    assert [f["original_name"] for f in response.json()["files"]] == ["a.txt"]
+
+
+def test_download_revalidates_with_etag(db, client):
+    bucket = client.post("/buckets/", json={"title": "Downloads", "slug": "downloads"}).json()
+    created = upload(client, bucket["id"], "notes.txt", b"0123456789")
+    response = client.get(f"/files/{created['id']}/download")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = client.get(f"/files/{created['id']}/download", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    response = client.get(f"/files/{created['id']}/download", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == b"0123456789"
+
+
+def test_download_serves_byte_ranges(db, client):
+    bucket = client.post("/buckets/", json={"title": "Ranges", "slug": "ranges"}).json()
+    created = upload(client, bucket["id"], "notes.txt", b"0123456789")
+    url = f"/files/{created['id']}/download"
+    etag = client.get(url).headers["etag"]
+
+    response = client.get(url, headers={"Range": "bytes=2-5"})
+    assert response.status_code == 206
+    assert response.content == b"2345"
+    assert response.headers["content-range"] == "bytes 2-5/10"
+
+    response = client.get(url, headers={"Range": "bytes=-3"})
+    assert (response.status_code, response.content) == (206, b"789")
+
+    response = client.get(url, headers={"Range": "bytes=20-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */10"
+
+    # If-Range: the range only while the client's copy is current, the whole file otherwise
+    response = client.get(url, headers={"Range": "bytes=2-5", "If-Range": etag})
+    assert (response.status_code, response.content) == (206, b"2345")
+    response = client.get(url, headers={"Range": "bytes=2-5", "If-Range": '"stale"'})
+    assert (response.status_code, response.content) == (200, b"0123456789")
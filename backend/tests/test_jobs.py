@@ -0,0 +1,72 @@
+"""Background jobs are retried with backoff until they succeed or run out of attempts"""
+from sqlalchemy import delete, update
+
+from app import jobs
+from app.database import SessionLocal
+from app.models import Job, utcnow
+
+failures = []
+
+
+@jobs.handler("test_flaky")
+def flaky(db, fail_times: int) -> None:
+    failures.append(len(failures))
+    if len(failures) <= fail_times:
+        raise RuntimeError(f"attempt {len(failures)} failed")
+
+
+def run_due(db):
+    """Claim and run the next due job, as a worker does"""
+    job = jobs.claim(db)
+    assert job is not None
+    return jobs.run_job(SessionLocal, job)
+
+
+def make_due(db, job_id: int) -> None:
+    db.execute(update(Job).where(Job.id == job_id).values(run_after=utcnow()))
+    db.commit()
+
+
+def enqueue_flaky(db, fail_times: int, max_attempts: int) -> int:
+    # Start from an empty queue so jobs left by other tests are not claimed first
+    db.execute(delete(Job))
+    failures.clear()
+    job = jobs.enqueue(db, "test_flaky", fail_times=fail_times)
+    job.max_attempts = max_attempts
+    db.commit()
+    return job.id
+
+
+def test_failed_job_is_retried_later_then_succeeds(db):
+    job_id = enqueue_flaky(db, fail_times=1, max_attempts=3)
+
+    assert not run_due(db)
+    db.expire_all()
+    job = db.get(Job, job_id)
+    assert (job.status, job.attempts) == (jobs.PENDING, 1)
+    assert job.last_error == "RuntimeError: attempt 1 failed"
+    # Backing off, so not due again yet
+    assert jobs.claim(db) is None
+
+    make_due(db, job_id)
+    assert run_due(db)
+    db.expire_all()
+    job = db.get(Job, job_id)
+    assert (job.status, job.attempts, job.last_error) == (jobs.SUCCEEDED, 2, None)
+
+
+def test_job_fails_after_its_last_attempt_and_can_be_requeued(db):
+    job_id = enqueue_flaky(db, fail_times=5, max_attempts=2)
+
+    assert not run_due(db)
+    make_due(db, job_id)
+    assert not run_due(db)
+    db.expire_all()
+    job = db.get(Job, job_id)
+    assert (job.status, job.attempts) == (jobs.FAILED, 2)
+    assert job.finished_at is not None
+
+    assert jobs.retry_failed(db) == 1
+    db.expire_all()
+    job = db.get(Job, job_id)
+    assert (job.status, job.attempts) == (jobs.PENDING, 0)
@@ -0,0 +1,41 @@
+"""Lists page by keyset cursor, handed back in the X-Next-Cursor header"""
+from tests.test_file_content import upload
+
+
+def pages(client, path: str, limit: int) -> list[list[dict]]:
+    """Every page of path, following X-Next-Cursor until it is absent"""
+    result = []
+    response = client.get(path, params={"limit": limit})
+    while True:
+        assert response.status_code == 200, response.text
+        result.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return result
+        response = client.get(path, params={"limit": limit, "cursor": cursor})
+
+
+def test_bucket_pages_follow_the_cursor(db, client):
+    created = [client.post("/buckets/", json={"title": f"B{i}", "slug": f"b{i}"}).json()["id"] for i in range(5)]
+
+    bucket_pages = pages(client, "/buckets/", limit=2)
+    assert [len(page) for page in bucket_pages] == [2, 2, 1]
+    assert [bucket["id"] for page in bucket_pages for bucket in page] == created
+
+    summary_pages = pages(client, "/buckets/summary", limit=2)
+    assert [summary["id"] for page in summary_pages for summary in page] == created
+
+
+def test_file_pages_follow_the_cursor(db, client):
+    bucket = client.post("/buckets/", json={"title": "Files", "slug": "files"}).json()
+    created = [upload(client, bucket["id"], f"{i}.txt", b"x")["id"] for i in range(4)]
+
+    file_pages = pages(client, f"/buckets/{bucket['id']}/files/", limit=2)
+    # A full last page still gets a cursor, which then leads to an empty page
+    assert [len(page) for page in file_pages] == [2, 2, 0]
+    assert [f["id"] for page in file_pages for f in page] == created
+
+
+def test_invalid_cursor_is_rejected(db, client):
+    response = client.get("/buckets/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
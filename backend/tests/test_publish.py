@@ -0,0 +1,58 @@
+"""Published buckets are written to a static site, and incremental builds follow the change log"""
+import json
+
+from app import publish
+from tests.test_file_content import upload
+
+
+def create_bucket(client, slug: str, published: bool) -> dict:
+    bucket = {"title": slug.title(), "slug": slug, "content": f"# {slug}\n\nSome *notes*.", "is_published": published}
+    return client.post("/buckets/", json=bucket).json()
+
+
+def set_published(client, bucket: dict, published: bool) -> None:
+    response = client.put(f"/buckets/{bucket['id']}", json={"title": bucket["title"], "slug": bucket["slug"],
+                                                            "is_published": published})
+    assert response.status_code == 200, response.text
+
+
+def index_slugs(site: publish.StaticSite) -> list[str]:
+    return [entry["slug"] for entry in json.loads((site.path / "index.json").read_text())["buckets"]]
+
+
+def test_rebuild_writes_published_buckets_only(db, client, tmp_path):
+    site = publish.StaticSite(str(tmp_path / "site"))
+    public = create_bucket(client, "public", published=True)
+    upload(client, public["id"], "notes.txt", b"attached")
+    create_bucket(client, "draft", published=False)
+    # Left over from a bucket that has since gone
+    site.bucket_path("gone").mkdir(parents=True)
+
+    assert publish.rebuild_all(db, site) == 1
+    assert index_slugs(site) == ["public"]
+    document = json.loads((site.bucket_path("public") / "index.json").read_text())
+    assert [f["original_name"] for f in document["files"]] == ["notes.txt"]
+    assert "<em>notes</em>" in document["html"]
+    page = (site.bucket_path("public") / "index.html").read_text()
+    assert "<title>Public</title>" in page and "<em>notes</em>" in page
+    assert not site.bucket_path("draft").exists()
+    assert not site.bucket_path("gone").exists()
+    assert site.read_token() is not None
+
+
+def test_incremental_build_rewrites_changed_buckets(db, client, tmp_path):
+    site = publish.StaticSite(str(tmp_path / "site"))
+    first = create_bucket(client, "first", published=True)
+    second = create_bucket(client, "second", published=False)
+    publish.rebuild_all(db, site)
+    token = site.read_token()
+
+    assert publish.publish_changes(db, site) == 0
+    set_published(client, first, False)
+    set_published(client, second, True)
+
+    assert publish.publish_changes(db, site) == 2
+    assert index_slugs(site) == ["second"]
+    assert not site.bucket_path("first").exists()
+    assert (site.bucket_path("second") / "index.html").exists()
+    assert site.read_token() > token
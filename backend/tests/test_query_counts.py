@@ -0,0 +1,69 @@
+"""Statements each read endpoint issues must not grow with the rows it returns"""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, insert, select
+from sqlalchemy.engine import Engine
+
+from app.cache import bucket_cache
+from app.models import Bucket, File, utcnow
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+
+
+def seed(db, buckets: int, files: int, prefix: str) -> list[int]:
+    now = utcnow()
+    db.execute(insert(Bucket), [
+        {"title": f"{prefix} {i}", "slug": f"{prefix}-{i}", "version": "1.0", "content": "- fix",
+         "is_published": True, "created_at": now}
+        for i in range(buckets)
+    ])
+    bucket_ids = db.execute(select(Bucket.id).where(Bucket.slug.like(f"{prefix}-%")).order_by(Bucket.id)).scalars().all()
+    db.execute(insert(File), [
+        {"original_name": f"f{n}.txt", "storage_path": f"{n:064x}", "file_type": "text/plain",
+         "file_size": 1.0, "bucket_id": bucket_id, "created_at": now}
+        for bucket_id in bucket_ids for n in range(files)
+    ])
+    db.commit()
+    return bucket_ids
+
+
+def queries_for(client, path: str) -> int:
+    # Served from the database, not the bucket cache
+    bucket_cache.clear()
+    with count_queries() as statements:
+        response = client.get(path)
+    assert response.status_code == 200, response.text
+    return len(statements)
+
+
+@pytest.mark.parametrize("path", ["/buckets/?limit=100", "/buckets/summary?limit=100"])
+def test_bucket_list(db, client, path):
+    seed(db, 2, 2, "small")
+    small = queries_for(client, path)
+    seed(db, 40, 5, "large")
+    assert queries_for(client, path) == small
+
+
+def test_bucket_detail_and_by_slug(db, client):
+    small_id, large_id = seed(db, 1, 1, "small")[0], seed(db, 1, 30, "large")[0]
+    assert queries_for(client, f"/buckets/{small_id}") == queries_for(client, f"/buckets/{large_id}")
+    assert queries_for(client, "/buckets/by-slug/small-0") == queries_for(client, "/buckets/by-slug/large-0")
+
+
+def test_file_list(db, client):
+    small_id, large_id = seed(db, 1, 1, "small")[0], seed(db, 1, 50, "large")[0]
+    assert (queries_for(client, f"/buckets/{small_id}/files/?limit=100")
+            == queries_for(client, f"/buckets/{large_id}/files/?limit=100"))
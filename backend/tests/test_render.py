@@ -0,0 +1,34 @@
+"""Serving rendered HTML reads the rendering cache but never writes to it"""
+from sqlalchemy import func, select
+
+from app.models import Bucket, RenderedContent
+from app.render import render_key
+from tests.test_query_counts import count_queries
+
+
+def writes_for(client, path: str) -> tuple[str, list[str]]:
+    with count_queries() as statements:
+        response = client.get(path)
+    assert response.status_code == 200, response.text
+    return response.text, [statement for statement in statements if not statement.lstrip().upper().startswith("SELECT")]
+
+
+def test_draft_is_rendered_without_storing(db, client):
+    db.add(Bucket(title="Draft", slug="draft", content="# Draft *notes*", is_published=False))
+    db.commit()
+
+    html, writes = writes_for(client, "/buckets/draft/html")
+    assert html == "<h1>Draft <em>notes</em></h1>"
+    assert writes == []
+    assert db.scalar(select(func.count()).select_from(RenderedContent)) == 0
+
+
+def test_cached_rendering_is_served(db, client):
+    content = "# Published"
+    db.add(RenderedContent(content_hash=render_key(content), html="<h1>cached</h1>", renderer_version="1"))
+    db.add(Bucket(title="Published", slug="published", content=content, is_published=True))
+    db.commit()
+
+    html, writes = writes_for(client, "/buckets/published/html")
+    assert html == "<h1>cached</h1>"
+    assert writes == []
@@ -0,0 +1,21 @@
+"""Search leaves out drafts unless asked and bounds the page size"""
+from app import crud
+from app.schemas import BucketCreate
+
+
+def test_drafts_are_only_found_when_asked(db, client):
+    published = crud.create_bucket(
+        db, BucketCreate(title="Published", slug="published", content="frobnicator fix", is_published=True))
+    draft = crud.create_bucket(
+        db, BucketCreate(title="Draft", slug="draft", content="frobnicator fix", is_published=False))
+
+    hits = client.get("/search", params={"q": "frobnicator"}).json()
+    assert {hit["bucket_id"] for hit in hits} == {published.id}
+
+    hits = client.get("/search", params={"q": "frobnicator", "include_drafts": "true"}).json()
+    assert {hit["bucket_id"] for hit in hits} == {published.id, draft.id}
+
+
+def test_limit_is_bounded(client):
+    assert client.get("/search", params={"q": "x", "limit": 101}).status_code == 422
+    assert client.get("/search", params={"q": "x", "limit": 0}).status_code == 422
@@ -0,0 +1,50 @@
+"""Blobs are fanned out over subdirectories, and storage_migrate moves old layouts online"""
+import os
+import shutil
+
+from sqlalchemy import update
+
+from app.models import File, FileVersion
+from app.storage_backends import LocalBackend
+from app.storage_migrate import migrate_storage
+from app.storage_service import file_storage
+from tests.test_file_content import upload
+
+
+def test_fanout_places_blobs_in_subdirectories(tmp_path):
+    backend = LocalBackend(str(tmp_path), fanout=(2, 2))
+    name = "abcdef" + "0" * 58
+    assert backend.location(name) == f"ab/cd/{name}"
+    assert LocalBackend(str(tmp_path / "flat")).location(name) == name
+
+    source = tmp_path / "upload.tmp"
+    source.write_bytes(b"content")
+    storage_path = backend.put(str(source), name)
+    assert (tmp_path / "ab" / "cd" / name).read_bytes() == b"content"
+    assert [path for path, _ in backend.iter_blobs("abcd")] == [storage_path]
+    assert list(backend.iter_blobs("abce")) == []
+
+
+def test_migrate_moves_absolute_flat_paths_to_the_current_layout(db, client):
+    bucket = client.post("/buckets/", json={"title": "Migrate", "slug": "migrate"}).json()
+    created = upload(client, bucket["id"], "old.txt", b"stored by an older release")
+    current = created["storage_path"]
+
+    # As an older release left it: flat in the storage root, referenced by absolute path
+    old_path = os.path.join(file_storage.backend.root, os.path.basename(current))
+    shutil.move(file_storage.local_path(current), old_path)
+    db.execute(update(File).where(File.id == created["id"]).values(storage_path=old_path))
+    db.execute(update(FileVersion).where(FileVersion.file_id == created["id"]).values(storage_path=old_path))
+    db.commit()
+    assert client.get(f"/files/{created['id']}/download").content == b"stored by an older release"
+
+    stats = migrate_storage(db, grace=0)
+    assert stats["missing"] == 0
+    assert stats["rows_updated"] >= 2
+    db.expire_all()
+    assert db.get(File, created["id"]).storage_path == current
+    assert not os.path.exists(old_path)
+    assert client.get(f"/files/{created['id']}/download").content == b"stored by an older release"
+
+    # Everything is in place now, so another run changes nothing
+    assert migrate_storage(db, grace=0)["paths_rewritten"] == 0
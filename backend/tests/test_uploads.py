@@ -0,0 +1,51 @@
+"""Uploads are streamed to storage in chunks, renamed into place and size limited"""
+import asyncio
+import hashlib
+import io
+
+import pytest
+from starlette.datastructures import UploadFile
+
+from app.storage_service import FileStorageService, FileTooLargeError, file_storage
+from tests.test_file_content import upload
+
+
+def test_upload_round_trip(db, client):
+    bucket = client.post("/buckets/", json={"title": "Uploads", "slug": "uploads"}).json()
+    content = bytes(range(256)) * 1000
+    created = upload(client, bucket["id"], "data.bin", content)
+
+    assert created["file_size"] == len(content)
+    assert created["checksum"] == hashlib.sha256(content).hexdigest()
+    assert client.get(f"/files/{created['id']}/download").content == content
+    assert list(file_storage.tmp_path.iterdir()) == []
+
+
+def test_upload_is_read_in_chunks(tmp_path):
+    storage = FileStorageService(str(tmp_path), chunk_size=1000, compression_codec="")
+    reads = []
+
+    class CountingUpload(UploadFile):
+        async def read(self, size: int = -1) -> bytes:
+            reads.append(size)
+            return await super().read(size)
+
+    content = b"x" * 4500
+    storage_path, file_size, checksum = asyncio.run(storage.store_upload(CountingUpload(io.BytesIO(content))))
+    assert (file_size, checksum) == (len(content), hashlib.sha256(content).hexdigest())
+    assert set(reads) == {1000} and len(reads) == 6
+    with open(storage.local_path(storage_path), "rb") as f:
+        assert f.read() == content
+
+
+def test_oversized_upload_is_rejected_and_cleaned_up(tmp_path):
+    storage = FileStorageService(str(tmp_path), max_size=100, chunk_size=10, compression_codec="")
+
+    with pytest.raises(FileTooLargeError):
+        asyncio.run(storage.store_upload(UploadFile(io.BytesIO(b"x" * 101))))
+    with pytest.raises(FileTooLargeError):
+        storage.store_fileobj(io.BytesIO(b"x" * 101))
+    assert list(storage.tmp_path.iterdir()) == []
+    assert list(storage.iter_blobs()) == []
+    # At the limit is fine
+    storage.store_fileobj(io.BytesIO(b"x" * 100))
@@ -0,0 +1,70 @@
+"""Text revisions are kept as deltas, and any version can be read, diffed and restored"""
+from app import versions
+from tests.test_file_content import put_content, upload
+
+REVISIONS = [
+    b"# Release 1.0\n\n- first change\n- second change\n",
+    b"# Release 1.0\n\n- first change\n- second change, reworded\n",
+    b"# Release 1.0\n\n- first change\n- second change, reworded\n- third change\n",
+    b"# Release 1.1\n\n- first change\n- second change, reworded\n- third change\n",
+]
+
+
+def upload_revisions(client, slug: str) -> int:
+    bucket = client.post("/buckets/", json={"title": slug, "slug": slug}).json()
+    file_id = upload(client, bucket["id"], "notes.md", REVISIONS[0])["id"]
+    for revision in REVISIONS[1:]:
+        put_content(client, file_id, revision)
+    return file_id
+
+
+def test_revisions_are_recorded_as_deltas_and_read_back(db, client):
+    file_id = upload_revisions(client, "deltas")
+
+    history = client.get(f"/files/{file_id}/versions").json()
+    assert [v["version"] for v in history] == [1, 2, 3, 4]
+    assert [v["kind"] for v in history] == ["blob", "delta", "delta", "delta"]
+    for number, revision in enumerate(REVISIONS, start=1):
+        response = client.get(f"/files/{file_id}/versions/{number}")
+        assert response.status_code == 200
+        assert response.content == revision
+    assert client.get(f"/files/{file_id}/versions/5").status_code == 404
+
+
+def test_snapshot_bounds_the_delta_chain(db, client, monkeypatch):
+    monkeypatch.setattr(versions, "VERSION_SNAPSHOT_INTERVAL", 2)
+    file_id = upload_revisions(client, "snapshots")
+
+    assert [v["kind"] for v in client.get(f"/files/{file_id}/versions").json()] == [
+        "blob", "delta", "snapshot", "delta"
+    ]
+    for number, revision in enumerate(REVISIONS, start=1):
+        assert client.get(f"/files/{file_id}/versions/{number}").content == revision
+
+
+def test_diff_between_versions(db, client):
+    file_id = upload_revisions(client, "diffs")
+
+    response = client.get(f"/files/{file_id}/versions/diff", params={"from": 1, "to": 3})
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert lines[:2] == ["--- notes.md@1", "+++ notes.md@3"]
+    assert "-- second change" in lines
+    assert "+- second change, reworded" in lines
+    assert "+- third change" in lines
+    assert client.get(f"/files/{file_id}/versions/diff", params={"from": 2, "to": 2}).text == ""
+    assert client.get(f"/files/{file_id}/versions/diff", params={"from": 1, "to": 9}).status_code == 404
+
+
+def test_restore_adds_a_version_with_the_old_content(db, client):
+    file_id = upload_revisions(client, "restores")
+
+    response = client.post(f"/files/{file_id}/versions/2/restore")
+    assert response.status_code == 200, response.text
+    history = client.get(f"/files/{file_id}/versions").json()
+    assert len(history) == 5
+    assert history[4]["checksum"] == history[1]["checksum"]
+    assert client.get(f"/files/{file_id}/download").content == REVISIONS[1]
+    # Later versions are still there, so the restore can be undone
+    assert client.get(f"/files/{file_id}/versions/4").content == REVISIONS[3]
+    assert client.post(f"/files/{file_id}/versions/9/restore").status_code == 404